@@ -46,8 +46,12 @@ class Client(object):
     personality_path = "/sfc/appliances/%s/personalities/%s"
     chains_path = "/sfc/chains"
     chain_path = "/sfc/chains/%s"
+    chain_topology_path = "/sfc/chains/%s/get_chain_topology"
+    chain_cascade_path = "/sfc/chains/%s/delete_chain_cascade"
     chainsets_path = "/sfc/chainsets"
     chainset_path = "/sfc/chainsets/%s"
+    chainset_conflicts_path = "/sfc/chainsets/%s/conflicts"
+    chainset_cascade_path = "/sfc/chainsets/%s/delete_chainset_cascade"
     
     rules_path = "/sfc/chainsets/%s/rules"
     rule_path = "/sfc/chainsets/%s/rules/%s"
@@ -84,6 +88,10 @@ class Client(object):
     chain_img_net_history_path = "/sfc/chain_img_net_histories/%s"
     
     launch_path = "/sfc/launchs"
+    launch_jobs_path = "/sfc/launch_jobs"
+    launch_job_path = "/sfc/launch_jobs/%s"
+    launch_job_cancel_path = "/sfc/launch_jobs/%s/cancel_launch_job"
+    flow_lookups_path = "/sfc/flow_lookups"
     
     nsdeltas_path = "/sfc/nsdeltas"
     nsdelta_path = "/sfc/nsdeltas/%s"
@@ -352,6 +360,14 @@ class Client(object):
         Deletes the specified chain
         """
         return self.crdclient.delete(self.chain_path % (chain))
+
+    @crd_client.APIParamsCall
+    def delete_chain_cascade(self, chain):
+        """
+        Deletes the specified chain with the selection rules steering to
+        it, its bypass rules, appliance maps and their instances
+        """
+        return self.crdclient.delete(self.chain_cascade_path % (chain))
     
     @crd_client.APIParamsCall
     def show_chain(self, chain, **_params):
@@ -367,6 +383,15 @@ class Client(object):
         """
         return self.crdclient.put(self.chain_path % (chain), body=body)
         
+    @crd_client.APIParamsCall
+    def show_chain_topology(self, chain, **_params):
+        """
+        Fetches a chain with its appliance maps, their appliances and
+        instances
+        """
+        return self.crdclient.get(self.chain_topology_path % (chain),
+                                  params=_params)
+
     @crd_client.APIParamsCall
     def list_appliance_maps(self, chain_id, **_params):
         """
@@ -482,6 +507,14 @@ class Client(object):
         Deletes the specified chainset
         """
         return self.crdclient.delete(self.chainset_path % (chainset))
+
+    @crd_client.APIParamsCall
+    def delete_chainset_cascade(self, chainset):
+        """
+        Deletes the specified chainset with its rules, zones and network
+        maps
+        """
+        return self.crdclient.delete(self.chainset_cascade_path % (chainset))
     
     @crd_client.APIParamsCall
     def show_chainset(self, chainset, **_params):
@@ -490,6 +523,15 @@ class Client(object):
         """
         return self.crdclient.get(self.chainset_path % (chainset), params=_params)
         
+    @crd_client.APIParamsCall
+    def show_chainset_conflicts(self, chainset, **_params):
+        """
+        Fetches the selection rules of a chainset that duplicate, shadow
+        or overlap each other
+        """
+        return self.crdclient.get(self.chainset_conflicts_path % (chainset),
+                                  params=_params)
+
     @crd_client.APIParamsCall
     def update_chainset(self, chainset, body=None):
         """
@@ -620,6 +662,43 @@ class Client(object):
         Launch Chain
         """
         return self.crdclient.post(self.launch_path, body=body)
+
+    @crd_client.APIParamsCall
+    def list_launch_jobs(self, **_params):
+        """
+        Fetches a list of all launch jobs for a tenant
+        """
+        return self.crdclient.get(self.launch_jobs_path, params=_params)
+
+    @crd_client.APIParamsCall
+    def show_launch_job(self, launch_job, **_params):
+        """
+        Fetches information of a launch job, with the progress of each
+        appliance
+        """
+        return self.crdclient.get(self.launch_job_path % (launch_job),
+                                  params=_params)
+
+    @crd_client.APIParamsCall
+    def cancel_launch_job(self, launch_job):
+        """
+        Cancels a pending or running launch job
+        """
+        return self.crdclient.put(self.launch_job_cancel_path % (launch_job))
+
+    @crd_client.APIParamsCall
+    def delete_launch_job(self, launch_job):
+        """
+        Deletes a finished launch job
+        """
+        return self.crdclient.delete(self.launch_job_path % (launch_job))
+
+    @crd_client.APIParamsCall
+    def lookup_flow(self, body=None):
+        """
+        Finds the selection rule, chain and appliance instances a flow hits
+        """
+        return self.crdclient.post(self.flow_lookups_path, body=body)
     
     @crd_client.APIParamsCall
     def list_appliance_map_instances(self, chain_id, appliance_map_id, **_params):
@@ -12,6 +12,8 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+import collections
+
 from nscs.ocas_utils.openstack.common.gettextutils import _
 from nscs.ocas_utils.openstack.common import log as logging
 from nscs.ocas_utils.openstack.common import context
@@ -20,6 +22,30 @@ from sfc.crdconsumer.client import ocas_client
 
 LOG = logging.getLogger(__name__)
 
+SNAPSHOT_PAGE_SIZE = 500
+# Most objects whose full payload is kept to merge compact updates into
+SHADOW_SIZE = 4096
+
+
+def shadowed(id_key):
+    """
+    Merge a compact update payload, which lists its changed_fields, into
+    the consumer's copy of the object before the create, update or
+    delete handler applies it, so the handler sees the full object.
+    """
+    def decorator(handler):
+        operation, kind = handler.__name__.split('_', 1)
+
+        def wrapper(self, context, **kwargs):
+            payload = kwargs['payload']
+            kwargs['payload'] = self.shadow_merge(kind, operation,
+                                                  payload.get(id_key), payload)
+            return handler(self, context, **kwargs)
+        wrapper.__name__ = handler.__name__
+        wrapper.__doc__ = handler.__doc__
+        return wrapper
+    return decorator
+
 
 class SFCConsumerPlugin(proxy.RpcProxy):
     """
@@ -34,6 +60,10 @@ class SFCConsumerPlugin(proxy.RpcProxy):
         # RPC network init
         self.consumer_context = context.RequestContext('crd', 'crd',
                                                        is_admin=False)
+        # (kind, object id) -> last full payload applied, least recently
+        # used first; kept once the service is seen sending compact updates
+        self.shadow = collections.OrderedDict()
+        self.compact_updates = False
         
     def get_plugin_type(self):
         return "SFC"
@@ -41,12 +71,136 @@ class SFCConsumerPlugin(proxy.RpcProxy):
     def init_consumer(self, consumer=None):
         delta_msg = {}
         try:
-            delta_msg = self.call(self.consumer_context,self.make_msg('sfc_init_consumer',consumer=consumer),self.listener_topic)
+            payload = consumer['payload']
+            if not payload.get('version'):
+                # Bootstrap page by page, then resync from the snapshot
+                # version to pick up what changed while paging.
+                version = self.load_snapshot(payload.get('hostname'))
+                if not version:
+                    return delta_msg
+                consumer = dict(consumer,
+                                payload=dict(payload, version=version))
+            deltas = self.call(self.consumer_context,self.make_msg('sfc_init_consumer',consumer=consumer),self.listener_topic)
+            delta_msg = self.batch_deltas(deltas)
         except BaseException,msg1:
             LOG.error("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
             LOG.error(_("Exception raised when running method - sfc_init_consumer with msg '%s'"), msg1)
         return delta_msg
 
+    @staticmethod
+    def batch_deltas(deltas):
+        """
+        Turn the ordered (version, message) list sent on init into the
+        version-keyed dict applied by the consumer framework. Messages of a
+        bulk call share a version, so the list goes in one
+        apply_delta_batch message under its newest version.
+        """
+        if not deltas:
+            return {}
+        version = max(entry[0] for entry in deltas)
+        return {version: {'method': 'apply_delta_batch',
+                          'payload': {'deltas': [list(entry)
+                                                 for entry in deltas]}}}
+
+    def load_snapshot(self, hostname):
+        """
+        Pull the bootstrap snapshot one page at a time and apply each page
+        in sequence order. Returns the version the snapshot was taken at.
+        """
+        request = {'hostname': hostname,
+                   'page_size': SNAPSHOT_PAGE_SIZE,
+                   'version': None,
+                   'cursor': None}
+        while True:
+            page = self.call(self.consumer_context,
+                             self.make_msg('sfc_snapshot_page',
+                                           consumer={'payload': request}),
+                             self.listener_topic)
+            for sequence, message in page['entries']:
+                self.apply_message(self.consumer_context, message)
+            request.update({'version': page['version'],
+                            'cursor': page['next']})
+            if not page['next']:
+                return page['version']
+
+    def apply_delta_batch(self, context, **kwargs):
+        """
+        Apply a batch of coalesced delta messages in version order
+        """
+        deltas = kwargs['payload']['deltas']
+        for version, message in sorted(deltas, key=lambda d: d[0]):
+            self.apply_message(context, message)
+
+    def apply_message(self, context, message):
+        try:
+            getattr(self, message['method'])(context,
+                                             payload=message['payload'])
+        except Exception, msg:
+            LOG.error(_("Exception raised when running method - %(method)s "
+                        "with msg '%(msg)s'"),
+                      {'method': message['method'], 'msg': msg})
+
+    def shadow_merge(self, kind, operation, object_id, payload):
+        """
+        Return the full payload of a create, update or delete. Copies of
+        objects are kept only once a compact update has arrived, for the
+        SHADOW_SIZE objects used last; a compact update of any other
+        object is merged into its payload fetched from the service.
+        """
+        key = (kind, object_id)
+        current = self.shadow.pop(key, None)
+        if operation == 'delete':
+            return payload
+        changed = payload.get('changed_fields')
+        if changed is not None:
+            self.compact_updates = True
+            if current is None:
+                current = self.fetch_object(kind, object_id)
+            if current is None:
+                LOG.error(_("No copy of %(kind)s %(id)s to apply "
+                            "changed fields %(changed)s to"),
+                          {'kind': kind, 'id': object_id,
+                           'changed': changed})
+                return payload
+            payload = dict(current, **payload)
+            del payload['changed_fields']
+        if self.compact_updates:
+            self.shadow[key] = payload
+            while len(self.shadow) > SHADOW_SIZE:
+                self.shadow.popitem(last=False)
+        return payload
+
+    def fetch_object(self, kind, object_id):
+        """
+        Return the full payload of an object from the service, for a
+        compact update of an object this consumer has no copy of, or None
+        when the service does not know it.
+        """
+        request = {'method': 'create_' + kind, 'id': object_id}
+        try:
+            message = self.call(self.consumer_context,
+                                self.make_msg('sfc_get_object',
+                                              consumer={'payload': request}),
+                                self.listener_topic)
+        except Exception, msg:
+            LOG.error(_("Fetching %(kind)s %(id)s failed: %(msg)s"),
+                      {'kind': kind, 'id': object_id, 'msg': msg})
+            return None
+        if not message:
+            return None
+        return message['payload']
+
+    @staticmethod
+    def typed_value(payload, field, value):
+        """
+        Return a typed match field of a rule payload. The string value is
+        parsed only for deltas written before rules had typed matches.
+        """
+        typed = payload.get(field)
+        if typed is not None:
+            return typed
+        return int(value) if value else 0
+
     def build_ucm_wsgi_msg(self, payload, message_type=None):
         msg = {}
         if message_type == 'create_chain':
@@ -331,7 +485,8 @@ class SFCConsumerPlugin(proxy.RpcProxy):
                     "tenant": tenant,
                     "chain_id": chain_id,
                     "chain_set_id": chain_set_id,
-                    "protocol": int(ip_protocol),
+                    "protocol": self.typed_value(payload, 'protocol_num',
+                                                 ip_protocol),
                     "admin_status": True,
                    }
             }
@@ -381,22 +536,13 @@ class SFCConsumerPlugin(proxy.RpcProxy):
                 
             ##Port
             if sp_type.lower() == 'single':
-		if sp_start:
-		  sp_start = int(sp_start)
-		else:
-		  sp_start = 0
+                sp_start = self.typed_value(payload, 'sp_start_num', sp_start)
                 msg['chain_selection_rule'].update({'sp_type':sp_type.capitalize(),
                                                   'sp_start':sp_start,
                                                   'sp_end':sp_start})
             elif sp_type.lower() == 'range':
-		if sp_start:
-		  sp_start = int(sp_start)
-		else:
-		  sp_start = 0
-		if dp_end:
-		  sp_end = int(sp_end)
-		else:
-		  sp_end = 0
+                sp_start = self.typed_value(payload, 'sp_start_num', sp_start)
+                sp_end = self.typed_value(payload, 'sp_end_num', sp_end)
                 msg['chain_selection_rule'].update({'sp_type':sp_type.capitalize(),
                                                   'sp_start':sp_start,
                                                   'sp_end':sp_end})
@@ -404,23 +550,13 @@ class SFCConsumerPlugin(proxy.RpcProxy):
                 msg['chain_selection_rule'].update({'sp_type':'Any'})
                 
             if dp_type.lower() == 'single':
-		if dp_start:
-		  dp_start = int(dp_start)
-		else:
-		  dp_start = 0
+                dp_start = self.typed_value(payload, 'dp_start_num', dp_start)
                 msg['chain_selection_rule'].update({'dp_type':dp_type.capitalize(),
                                                   'dp_start':dp_start,
                                                   'dp_end':dp_start})
             elif dp_type.lower() == 'range':
-		if dp_start:
-		  dp_start = int(dp_start)
-		else:
-		  dp_start = 0
-		if dp_end:
-		  dp_end = int(dp_end)
-		else:
-		  dp_end = 0
-
+                dp_start = self.typed_value(payload, 'dp_start_num', dp_start)
+                dp_end = self.typed_value(payload, 'dp_end_num', dp_end)
                 msg['chain_selection_rule'].update({'dp_type':dp_type.capitalize(),
                                                   'dp_start':dp_start,
                                                   'dp_end':dp_end})
@@ -456,7 +592,8 @@ class SFCConsumerPlugin(proxy.RpcProxy):
             msg = {"chain_selection_rule":{"name": selection_rule_name,
                     "chain_id": chain_id,
                     "chain_set_id": chain_set_id,
-                    "protocol": int(ip_protocol),
+                    "protocol": self.typed_value(payload, 'protocol_num',
+                                                 ip_protocol),
                     "admin_status": True,
                    }
             }
@@ -567,18 +704,21 @@ class SFCConsumerPlugin(proxy.RpcProxy):
     ###
     ###Chains
     ###
+    @shadowed('chain_id')
     def create_chain(self, context, **kwargs):
         #LOG.info(_("Create Chain Body - %s"), str(kwargs))
         payload = kwargs['payload']
         body = self.build_ucm_wsgi_msg(payload, 'create_chain')
         self.uc.create_chain(body=body)
         
+    @shadowed('chain_id')
     def delete_chain(self, context, **kwargs):
         payload = kwargs['payload']
         chain_id = payload.get('chain_id')
         #LOG.info(_("Delete Chain Name- %s"), str(chain_id))
         self.uc.delete_chain(chain_id)
         
+    @shadowed('chain_id')
     def update_chain(self, context, **kwargs):
         payload = kwargs['payload']
         chain_id = payload.get('chain_id')
@@ -598,6 +738,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
     ###
     ###Chain Bypass rules
     ###
+    @shadowed('chain_bypass_rule_id')
     def create_chain_bypass_rules(self, context, **kwargs):
         #LOG.info(_("Create chain_bypass_rule Body - %s"), str(kwargs))
         payload = kwargs['payload']
@@ -605,6 +746,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
         body = self.build_ucm_wsgi_msg(payload, 'create_chain_bypass_rule')
         self.uc.create_chain_bypass_rule(chain_id, body=body)
         
+    @shadowed('chain_bypass_rule_id')
     def delete_chain_bypass_rules(self, context, **kwargs):
         payload = kwargs['payload']
         chain_id = payload.get('chain_id')
@@ -612,6 +754,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
         #LOG.info(_("Delete chain_bypass_rule Name- %s"), str(chain_bypass_rule_id))
         self.uc.delete_chain_bypass_rule(chain_id, chain_bypass_rule_id)
         
+    @shadowed('chain_bypass_rule_id')
     def update_chain_bypass_rules(self, context, **kwargs):
         payload = kwargs['payload']
         chain_id = payload.get('chain_id')
@@ -633,18 +776,21 @@ class SFCConsumerPlugin(proxy.RpcProxy):
     ###
     ###Services
     ###
+    @shadowed('appliance_id')
     def create_appliance(self, context, **kwargs):
         payload = kwargs['payload']
         body = self.build_ucm_wsgi_msg(payload, 'create_service')
         # LOG.info(_("Create service Body - %s"), str(body))
         self.uc.create_service(body=body)
         
+    @shadowed('appliance_id')
     def delete_appliance(self, context, **kwargs):
         payload = kwargs['payload']
         service_id = payload.get('appliance_id')
         #LOG.info(_("Delete service Name- %s"), str(service_id))
         self.uc.delete_service(service_id)
         
+    @shadowed('appliance_id')
     def update_appliance(self, context, **kwargs):
         payload = kwargs['payload']
         service_id = payload.get('appliance_id')
@@ -664,6 +810,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
     ###
     ###chain_services
     ###
+    @shadowed('chain_appliance_map_id')
     def create_chain_appliance(self, context, **kwargs):
         #LOG.info(_("Create chain_service Body - %s"), str(kwargs))
         payload = kwargs['payload']
@@ -671,6 +818,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
         body = self.build_ucm_wsgi_msg(payload, 'create_chain_service')
         self.uc.create_chain_service(chain_id, body=body)
         
+    @shadowed('chain_appliance_map_id')
     def delete_chain_appliance(self, context, **kwargs):
         payload = kwargs['payload']
         chain_service_id = payload.get('chain_appliance_map_id')
@@ -678,6 +826,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
         #LOG.info(_("Delete chain_service Name- %s"), str(chain_service_id))
         self.uc.delete_chain_service(chain_id, chain_service_id)
         
+    @shadowed('chain_appliance_map_id')
     def update_chain_appliance(self, context, **kwargs):
         payload = kwargs['payload']
         chain_service_id = payload.get('chain_appliance_map_id')
@@ -700,6 +849,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
     ###
     ###chain_sets
     ###
+    @shadowed('chainset_id')
     def create_chainsets(self, context, **kwargs):
 
         payload = kwargs['payload']
@@ -708,12 +858,14 @@ class SFCConsumerPlugin(proxy.RpcProxy):
         LOG.info(_("Create chain_set Body - %s"), str(body))
         self.uc.create_chain_set(body=body)
         
+    @shadowed('chainset_id')
     def delete_chainsets(self, context, **kwargs):
         payload = kwargs['payload']
         chain_set_id = payload.get('chainset_id')
         #LOG.info(_("Delete chain_set Name- %s"), str(chain_set_id))
         self.uc.delete_chain_set(chain_set_id)
         
+    @shadowed('chainset_id')
     def update_chainsets(self, context, **kwargs):
         payload = kwargs['payload']
         chain_set_id = payload.get('chainset_id')
@@ -733,6 +885,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
     ###
     ###chain_selection_rules
     ###
+    @shadowed('chain_rule_id')
     def create_chainrule(self, context, **kwargs):
         #LOG.info(_("Create chain_selection_rule Body - %s"), str(kwargs))
         payload = kwargs['payload']
@@ -740,6 +893,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
         body = self.build_ucm_wsgi_msg(payload, 'create_chain_selection_rule')
         self.uc.create_chain_selection_rule(chain_set_id, body=body)
         
+    @shadowed('chain_rule_id')
     def delete_chainrule(self, context, **kwargs):
         payload = kwargs['payload']
         chain_set_id = payload.get('chainset_id')
@@ -747,6 +901,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
         #LOG.info(_("Delete chain_selection_rule Name- %s"), str(chain_selection_rule_id))
         self.uc.delete_chain_selection_rule(chain_set_id, chain_selection_rule_id)
         
+    @shadowed('chain_rule_id')
     def update_chainrule(self, context, **kwargs):
         payload = kwargs['payload']
         chain_set_id = payload.get('chainset_id')
@@ -769,18 +924,21 @@ class SFCConsumerPlugin(proxy.RpcProxy):
     ###
     ###chain_networks
     ###
+    @shadowed('chain_map_id')
     def create_chainmap(self, context, **kwargs):
         #LOG.info(_("Create chain_network Body - %s"), str(kwargs))
         payload = kwargs['payload']
         body = self.build_ucm_wsgi_msg(payload, 'create_chain_network')
         self.uc.create_chain_network(body=body)
         
+    @shadowed('chain_map_id')
     def delete_chainmap(self, context, **kwargs):
         payload = kwargs['payload']
         chain_network_id = payload.get('chain_map_id')
         #LOG.info(_("Delete chain_network Name- %s"), str(chain_network_id))
         self.uc.delete_chain_network(chain_network_id)
         
+    @shadowed('chain_map_id')
     def update_chainmap(self, context, **kwargs):
         payload = kwargs['payload']
         chain_network_id = payload.get('chain_map_id')
@@ -839,6 +997,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
     ###
     ###appliance_instances
     ###
+    @shadowed('appliance_instance_id')
     def create_appliance_instance(self, context, **kwargs):
         LOG.info(_("Create appliance_instance Body - %s"), str(kwargs))
         payload = kwargs['payload']
@@ -847,6 +1006,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
         body = self.build_ucm_wsgi_msg(payload, 'create_appliance_instance')
         self.uc.create_appliance_instance(chain_id, chain_map_id, body=body)
         
+    @shadowed('appliance_instance_id')
     def delete_appliance_instance(self, context, **kwargs):
         payload = kwargs['payload']
         chain_id = payload.get('chain_id')
@@ -857,6 +1017,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
         self.uc.delete_appliance_instance(chain_id, chain_map_id,
                                           appliance_instance_id)
         
+    @shadowed('appliance_instance_id')
     def update_appliance_instance(self, context, **kwargs):
         payload = kwargs['payload']
         chain_id = payload.get('chain_id')
@@ -889,6 +1050,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
     ###
     ###Chainset to Zone - Direction Mappings
     ###
+    @shadowed('zone_id')
     def create_chainset_zone(self, context, **kwargs):
         payload = kwargs['payload']
         chain_set_id = payload.get('chainset_id')
@@ -896,6 +1058,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
         #LOG.info(_("Create chainset_zone Body - %s"), str(body))
         self.uc.create_chainset_zone(chain_set_id, body=body)
         
+    @shadowed('zone_id')
     def delete_chainset_zone(self, context, **kwargs):
         payload = kwargs['payload']
         chain_set_id = payload.get('chainset_id')
@@ -903,6 +1066,7 @@ class SFCConsumerPlugin(proxy.RpcProxy):
         #LOG.info(_("Delete chainset_zone Name- %s"), str(chainset_zone_id))
         self.uc.delete_chainset_zone(chain_set_id, chainset_zone_id)
         
+    @shadowed('zone_id')
     def update_chainset_zone(self, context, **kwargs):
         payload = kwargs['payload']
         chain_set_id = payload.get('chainset_id')
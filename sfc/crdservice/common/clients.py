@@ -0,0 +1,102 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cache of the nova and neutron clients of the SFC service.
+
+A new client opens new HTTP connections, and one given a password
+authenticates to keystone again on its first request. Clients are kept
+here under the credentials they were built with and handed out again,
+so their token and connections are reused; a client rejected for an
+expired token authenticates again by itself. A client is replaced once
+client_ttl seconds old, before a token of the default keystone lifetime
+expires.
+
+Clients are shared by the green threads of a process. Building one does
+no I/O, so two green threads never run in the cache at the same time.
+"""
+
+import collections
+import time
+
+from oslo.config import cfg
+
+from novaclient.v1_1 import client as nova_client
+
+from nscs.crdservice.openstack.common import log as logging
+from nscs.crdservice.openstack.common.gettextutils import _
+
+LOG = logging.getLogger(__name__)
+
+sfc_client_opts = [
+    cfg.IntOpt('client_cache_size', default=64,
+               help=_("Number of nova and neutron clients, one per set of "
+                      "credentials, kept for reuse")),
+    cfg.IntOpt('client_ttl', default=3000,
+               help=_("Seconds a cached client is reused before it is "
+                      "replaced, shorter than the lifetime of a keystone "
+                      "token")),
+]
+
+cfg.CONF.register_opts(sfc_client_opts, "sfc_driver")
+
+
+class ClientCache(object):
+    """Clients keyed by kind and credentials, least recently used first."""
+    _instance = None
+
+    def __init__(self):
+        self.clients = collections.OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def get(self, key, build):
+        """
+        Return the client cached under key, built by build() when it is
+        missing or older than client_ttl.
+        """
+        now = time.time()
+        ttl = cfg.CONF.sfc_driver.client_ttl
+        entry = self.clients.pop(key, None)
+        if entry is not None and now - entry[0] < ttl:
+            self.stats['hits'] += 1
+        else:
+            self.stats['expired' if entry is not None else 'misses'] += 1
+            entry = (now, build())
+            LOG.debug(_("Built %(kind)s client, client cache stats "
+                        "%(stats)s"), {'kind': key[0], 'stats': self.stats})
+        self.clients[key] = entry
+        while len(self.clients) > cfg.CONF.sfc_driver.client_cache_size:
+            self.clients.popitem(last=False)
+            self.stats['evictions'] += 1
+        return entry[1]
+
+
+def admin_novaclient(conf):
+    """Return the nova client of the admin credentials of a config group."""
+    def _build():
+        return nova_client.Client(conf.admin_user,
+                                  conf.admin_password,
+                                  conf.admin_tenant_name,
+                                  auth_url=conf.auth_url,
+                                  service_type="compute")
+
+    key = ('nova', conf.admin_user, conf.admin_tenant_name, conf.auth_url)
+    return ClientCache.get_instance().get(key, _build)
@@ -62,3 +62,21 @@ class chainset_zones_deltaNotFound(NotFound):
     
 class ChainSetNotFound(NotFound):
     message = _("Chainset %(chainset_id)s could not be found")
+
+class ChainsetRuleConflict(InUse):
+    message = _("Rule %(name)s conflicts with rules of chainset %(chainset_id)s: %(conflicts)s")
+
+class VlanRangeExhausted(Conflict):
+    message = _("No free VLAN pair left in %(vlan_range)s on network %(network_id)s")
+
+class LaunchJobNotFound(NotFound):
+    message = _("Launch job %(job_id)s could not be found")
+
+class LaunchJobFinished(Conflict):
+    message = _("Launch job %(job_id)s is already %(status)s")
+
+class LaunchJobNotFinished(Conflict):
+    message = _("Launch job %(job_id)s is still %(status)s")
+
+class LaunchJobCancelled(CrdException):
+    message = _("Launch job %(job_id)s was cancelled")
@@ -0,0 +1,126 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Readiness of the nova instances the SFC service waits for.
+
+Code waiting for an instance to become active registers its UUID; the
+listener resolves it when the compute.instance.update notification
+reporting the instance active or in error arrives. Waiters then check
+the instance once, instead of polling nova or the CRD database, and
+fall back to polling only when no notification comes in time.
+
+Notifications are taken off the sfc-consume queue, which the workers of
+the service share, so each one reaches a single worker: waiters in other
+workers are not woken and see the instance at their next poll. Polls are
+therefore kept short, every instance_poll_interval seconds, and only a
+service running one worker is spared them altogether.
+"""
+
+import time
+
+import eventlet
+from eventlet import event
+from oslo.config import cfg
+
+from nscs.crdservice.openstack.common.gettextutils import _
+
+sfc_readiness_opts = [
+    cfg.IntOpt('instance_poll_interval', default=2,
+               help=_("Seconds between checks of an instance that is "
+                      "waited for when no notification of its state "
+                      "arrives; notifications reach one worker only, so "
+                      "waiters in the other workers rely on these checks")),
+]
+
+cfg.CONF.register_opts(sfc_readiness_opts, "sfc_driver")
+
+READY_STATES = ('active', 'error')
+
+
+class InstanceReadiness(object):
+    """
+    Events of the instances waited for, keyed by UUID. An event is sent
+    the state of the notification resolving it, and replaced once a
+    waiter has seen it.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.events = {}
+        self.waiters = {}
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def register(self, instance_uuid):
+        """Start listening for the state of an instance."""
+        self.waiters[instance_uuid] = self.waiters.get(instance_uuid, 0) + 1
+        self.events.setdefault(instance_uuid, event.Event())
+
+    def discard(self, instance_uuid):
+        count = self.waiters.get(instance_uuid, 0) - 1
+        if count > 0:
+            self.waiters[instance_uuid] = count
+            return
+        self.waiters.pop(instance_uuid, None)
+        self.events.pop(instance_uuid, None)
+
+    def resolve(self, instance_uuid, state):
+        """Wake the waiters of an instance; ignored if nobody waits."""
+        waiting = self.events.get(instance_uuid)
+        if waiting is not None and not waiting.ready():
+            waiting.send(state)
+
+    def wait(self, instance_uuid, timeout):
+        """
+        Return the state an instance was reported in, or None if no
+        notification arrived within timeout seconds.
+        """
+        waiting = self.events.setdefault(instance_uuid, event.Event())
+        state = None
+        with eventlet.Timeout(timeout, False):
+            state = waiting.wait()
+        if waiting.ready() and self.events.get(instance_uuid) is waiting:
+            self.events[instance_uuid] = event.Event()
+        return state
+
+    def wait_for(self, instance_uuid, check, timeout=None):
+        """
+        Return the first result of check() other than None. check is
+        called at once, then each time the instance is reported active
+        or in error, and every instance_poll_interval seconds otherwise.
+        Returns None once timeout seconds have passed, if given.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        self.register(instance_uuid)
+        try:
+            while True:
+                result = check()
+                if result is not None:
+                    return result
+                interval = cfg.CONF.sfc_driver.instance_poll_interval
+                if deadline is not None:
+                    interval = min(interval, deadline - time.time())
+                    if interval <= 0:
+                        return None
+                self.wait(instance_uuid, interval)
+        finally:
+            self.discard(instance_uuid)
@@ -0,0 +1,161 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Routing of config messages from config handles to relay agents.
+
+A config handle routes to the appliance instances of every appliance
+using it, and each instance to the host running it, whose relay agent
+takes its config messages. The instances of a handle are resolved from
+the database once and kept until an appliance, chain appliance or
+appliance instance delta drops them; hosts are learned from the nova
+notifications of the instances, so a message is fanned out without
+asking nova where each instance runs.
+
+The table is kept by each API worker, while deltas may be written and
+notifications received by another one. So when the committed runtime
+version moves, the handles the deltas since the version the table was
+at may have changed are dropped, and a host is kept only for
+route_host_ttl seconds after it was learned.
+"""
+
+import time
+
+from oslo.config import cfg
+
+from nscs.crdservice.openstack.common import log as logging
+from nscs.crdservice.openstack.common.gettextutils import _
+
+LOG = logging.getLogger(__name__)
+
+sfc_routing_opts = [
+    cfg.IntOpt('route_host_ttl', default=300,
+               help=_("Seconds the host of an appliance instance, learned "
+                      "from a notification or asked of nova, is used to "
+                      "route config messages before it is asked again")),
+]
+
+cfg.CONF.register_opts(sfc_routing_opts, "sfc_driver")
+
+
+class ConfigRoutes(object):
+    """
+    Instance UUIDs by config handle id, up to date as of runtime version
+    version, and (tenant id, host, time learned) by instance UUID.
+    generation counts the invalidations, so that instances resolved while
+    a delta was written are not kept.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.routes = {}
+        self.hosts = {}
+        self.version = None
+        self.generation = 0
+        self.stats = {'hits': 0, 'misses': 0, 'located': 0,
+                      'invalidations': 0, 'dropped': 0, 'expired': 0}
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def invalidate(self):
+        """Drop the instances of every config handle."""
+        self.routes.clear()
+        self.generation += 1
+        self.stats['invalidations'] += 1
+
+    def drop(self, config_handle_ids, instance_uuids):
+        """
+        Drop the instances of the config handles of config_handle_ids
+        and of the handles routing to one of instance_uuids.
+        """
+        dropped = [handle for handle, routed in self.routes.iteritems()
+                   if handle in config_handle_ids or
+                   instance_uuids.intersection(routed)]
+        for handle in dropped:
+            del self.routes[handle]
+        self.generation += 1
+        self.stats['dropped'] += len(dropped)
+
+    def advance(self, version, changes):
+        """
+        Bring the table to the committed runtime version version.
+        changes(since) returns the (config handle ids, instance UUIDs) of
+        the routes the deltas newer than version since may have changed,
+        or None when the deltas no longer tell; every route is dropped
+        then.
+        """
+        if version == self.version:
+            return
+        affected = None
+        if self.routes and self.version is not None and self.version < version:
+            affected = changes(self.version)
+        if affected is None:
+            self.invalidate()
+        else:
+            self.drop(*affected)
+        self.version = version
+
+    def set_host(self, instance_uuid, tenant_id, hostname):
+        self.hosts[instance_uuid] = (tenant_id, hostname, time.time())
+
+    def forget_instance(self, instance_uuid):
+        self.hosts.pop(instance_uuid, None)
+        self.drop((), set([instance_uuid]))
+
+    def route(self, config_handle_id, resolve, locate, version, changes):
+        """
+        Return (instance uuid, tenant id, host) of the instances behind a
+        config handle. resolve(config_handle_id) lists the instance UUIDs
+        of a handle not in the table; locate(instance_uuid) returns the
+        (tenant id, host) of an instance no notification has placed, or
+        None to leave the instance out. version is the committed runtime
+        version, and changes is given to advance() when it has moved.
+        """
+        self.advance(version, changes)
+        generation = self.generation
+        instance_uuids = self.routes.get(config_handle_id)
+        if instance_uuids is None:
+            self.stats['misses'] += 1
+            instance_uuids = resolve(config_handle_id)
+            if generation == self.generation:
+                self.routes[config_handle_id] = instance_uuids
+            LOG.debug(_("Resolved config handle %(handle)s to %(count)d "
+                        "instances, route stats %(stats)s"),
+                      {'handle': config_handle_id,
+                       'count': len(instance_uuids), 'stats': self.stats})
+        else:
+            self.stats['hits'] += 1
+        result = []
+        now = time.time()
+        ttl = cfg.CONF.sfc_driver.route_host_ttl
+        for instance_uuid in instance_uuids:
+            host = self.hosts.get(instance_uuid)
+            if host is not None and now - host[2] >= ttl:
+                self.stats['expired'] += 1
+                host = None
+            if host is None:
+                location = locate(instance_uuid)
+                if location is None:
+                    self.hosts.pop(instance_uuid, None)
+                    continue
+                self.stats['located'] += 1
+                host = self.hosts[instance_uuid] = location + (now,)
+            tenant_id, hostname, learned_at = host
+            result.append((instance_uuid, tenant_id, hostname))
+        return result
@@ -0,0 +1,362 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-memory index of the selection rules of a chainset.
+
+Each range of a rule match (source and destination address, source and
+destination port) is kept in an interval tree, so the rules overlapping
+a new one, or matching a flow, are found without comparing them with
+every rule. Rules are given as the rule dicts of the plugin, with their
+typed match fields.
+"""
+
+import random
+
+RANGES = ('sip', 'dip', 'sp', 'dp')
+EXACT = ('protocol_num', 'eth_value_num', 'src_mac', 'dest_mac')
+
+DUPLICATE = 'duplicate'
+SHADOWED = 'shadowed'
+OVERLAP = 'overlap'
+
+
+class _Node(object):
+    __slots__ = ('key', 'start', 'end', 'priority', 'max_end', 'left',
+                 'right')
+
+    def __init__(self, key, start, end):
+        self.key = key
+        self.start = start
+        self.end = end
+        self.priority = random.random()
+        self.max_end = end
+        self.left = None
+        self.right = None
+
+    def order(self):
+        return (self.start, self.key)
+
+
+def _update(node):
+    node.max_end = node.end
+    for child in (node.left, node.right):
+        if child is not None and child.max_end > node.max_end:
+            node.max_end = child.max_end
+
+
+def _split(node, order):
+    """Split a tree into the nodes ordered before order and the rest."""
+    if node is None:
+        return None, None
+    if node.order() < order:
+        node.right, right = _split(node.right, order)
+        _update(node)
+        return node, right
+    left, node.left = _split(node.left, order)
+    _update(node)
+    return left, node
+
+
+def _merge(left, right):
+    """Merge two trees, all nodes of left ordered before those of right."""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _insert(node, new):
+    if node is None:
+        return new
+    if new.priority > node.priority:
+        new.left, new.right = _split(node, new.order())
+        _update(new)
+        return new
+    if new.order() < node.order():
+        node.left = _insert(node.left, new)
+    else:
+        node.right = _insert(node.right, new)
+    _update(node)
+    return node
+
+
+def _remove(node, order):
+    """Remove the node of order; returns the tree and whether it was in."""
+    if node is None:
+        return None, False
+    if node.order() == order:
+        return _merge(node.left, node.right), True
+    if order < node.order():
+        node.left, removed = _remove(node.left, order)
+    else:
+        node.right, removed = _remove(node.right, order)
+    if removed:
+        _update(node)
+    return node, removed
+
+
+class IntervalTree(object):
+    """
+    Closed intervals [start, end] identified by a key, in a treap ordered
+    by start and augmented with the largest end of each subtree. Insert
+    and remove take O(log n), finding the k intervals overlapping a range
+    O(log n + k), expected.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, key, start, end):
+        self.root = _insert(self.root, _Node(key, start, end))
+        self.size += 1
+
+    def remove(self, key, start):
+        self.root, removed = _remove(self.root, (start, key))
+        if removed:
+            self.size -= 1
+        return removed
+
+    def overlapping(self, start, end, limit=None):
+        """
+        Return the keys of the intervals that overlap [start, end], or
+        None once there are more than limit of them.
+        """
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end < start:
+                continue
+            stack.append(node.left)
+            if node.start <= end:
+                if node.end >= start:
+                    found.append(node.key)
+                    if limit is not None and len(found) > limit:
+                        return None
+                stack.append(node.right)
+        return found
+
+
+def _match(rule):
+    """Return the match of a rule dict; None stands for 'any'."""
+    match = {}
+    for prefix in RANGES:
+        start = rule.get('%s_start_num' % prefix)
+        if start is None:
+            match[prefix] = None
+        else:
+            match[prefix] = (start, rule.get('%s_end_num' % prefix))
+    match['protocol_num'] = rule.get('protocol_num')
+    match['eth_value_num'] = rule.get('eth_value_num')
+    for field in ('src_mac', 'dest_mac'):
+        value = None
+        if (rule.get('%s_type' % field) or '').lower() == 'value':
+            value = (rule.get(field) or '').lower() or None
+        match[field] = value
+    return match
+
+
+def _overlaps(match, other, prefixes):
+    for prefix in prefixes:
+        if (other[prefix] is not None and
+                (other[prefix][0] > match[prefix][1] or
+                 other[prefix][1] < match[prefix][0])):
+            return False
+    for field in EXACT:
+        if (match[field] is not None and other[field] is not None and
+                match[field] != other[field]):
+            return False
+    return True
+
+
+def _covers(outer, inner):
+    """Return whether every packet matched by inner is matched by outer."""
+    for prefix in RANGES:
+        if outer[prefix] is None:
+            continue
+        if inner[prefix] is None:
+            return False
+        if (inner[prefix][0] < outer[prefix][0] or
+                inner[prefix][1] > outer[prefix][1]):
+            return False
+    for field in EXACT:
+        if outer[field] is not None and outer[field] != inner[field]:
+            return False
+    return True
+
+
+class RuleIndex(object):
+    """
+    Selection rules of one chainset, indexed by their match ranges.
+
+    Rules are grouped by which of their ranges are 'any', and each group
+    keeps an interval tree per range it matches on. A lookup takes, in
+    each group, the rules found by the tree that returns the fewest, and
+    checks the rest of their match directly. Trees are searched address
+    ranges first, each search stopping once it has found more rules than
+    the best so far.
+
+    A conflict between two rules with overlapping matches is one of:
+    duplicate, the matches are equal; shadowed, the match of rule_id lies
+    within that of conflicting_rule_id; overlap, the matches intersect
+    and the rules steer to different chains.
+
+    version is the runtime version whose rule deltas the index has taken
+    in; the owner sets it when it brings the index up to date.
+    """
+
+    def __init__(self):
+        self.rules = {}
+        self.groups = {}
+        self.version = 0
+
+    def __len__(self):
+        return len(self.rules)
+
+    def add(self, rule):
+        """Index a rule, replacing the rule with the same id."""
+        self.remove(rule['id'])
+        match = _match(rule)
+        self.rules[rule['id']] = (match, rule.get('chain_id'))
+        ranges = tuple(prefix for prefix in RANGES
+                       if match[prefix] is not None)
+        if ranges not in self.groups:
+            self.groups[ranges] = (set(), dict((prefix, IntervalTree())
+                                               for prefix in ranges))
+        ids, trees = self.groups[ranges]
+        ids.add(rule['id'])
+        for prefix in ranges:
+            trees[prefix].insert(rule['id'], *match[prefix])
+
+    def remove(self, rule_id):
+        entry = self.rules.pop(rule_id, None)
+        if entry is None:
+            return
+        match = entry[0]
+        ranges = tuple(prefix for prefix in RANGES
+                       if match[prefix] is not None)
+        ids, trees = self.groups[ranges]
+        ids.discard(rule_id)
+        for prefix in ranges:
+            trees[prefix].remove(rule_id, match[prefix][0])
+        if not ids:
+            del self.groups[ranges]
+
+    def _overlapping(self, match, exclude=None):
+        prefixes = [prefix for prefix in RANGES if match[prefix] is not None]
+        found = []
+        for ids, trees in self.groups.values():
+            candidates = None
+            for prefix in prefixes:
+                if prefix not in trees:
+                    continue
+                limit = None if candidates is None else len(candidates) - 1
+                hits = trees[prefix].overlapping(match[prefix][0],
+                                                 match[prefix][1], limit)
+                if hits is not None:
+                    candidates = hits
+            if candidates is None:
+                candidates = ids
+            for rule_id in candidates:
+                if (rule_id != exclude and
+                        _overlaps(match, self.rules[rule_id][0], prefixes)):
+                    found.append(rule_id)
+        return found
+
+    def overlapping(self, rule):
+        """Return the ids of the indexed rules whose match overlaps rule."""
+        return self._overlapping(_match(rule), rule.get('id'))
+
+    def _rank(self, rule_id):
+        """Sort key putting the rules with the narrowest match first."""
+        match = self.rules[rule_id][0]
+        widths = tuple(float('inf') if match[prefix] is None
+                       else match[prefix][1] - match[prefix][0]
+                       for prefix in RANGES)
+        return widths + (len([field for field in EXACT
+                              if match[field] is None]), rule_id)
+
+    def lookup(self, flow):
+        """
+        Return (rank, rule id, chain id) of the rules matching flow, the
+        most specific rule first. flow holds the sip, dip, sp and dp values
+        and the EXACT fields; a field left None matches any rule.
+        """
+        match = dict((field, flow.get(field)) for field in EXACT)
+        for prefix in RANGES:
+            value = flow.get(prefix)
+            match[prefix] = None if value is None else (value, value)
+        return sorted((self._rank(rule_id), rule_id, self.rules[rule_id][1])
+                      for rule_id in self._overlapping(match))
+
+    def _classify(self, rule_id, match, chain_id, other_id):
+        other, other_chain_id = self.rules[other_id]
+        within = _covers(other, match)
+        around = _covers(match, other)
+        if within and around:
+            return {'type': DUPLICATE, 'rule_id': rule_id,
+                    'conflicting_rule_id': other_id}
+        if within:
+            return {'type': SHADOWED, 'rule_id': rule_id,
+                    'conflicting_rule_id': other_id}
+        if around:
+            return {'type': SHADOWED, 'rule_id': other_id,
+                    'conflicting_rule_id': rule_id}
+        if chain_id != other_chain_id:
+            return {'type': OVERLAP, 'rule_id': rule_id,
+                    'conflicting_rule_id': other_id}
+
+    def conflicts(self, rule):
+        """
+        Return the conflicts of rule, indexed or not, with the indexed
+        rules other than itself.
+        """
+        match = _match(rule)
+        result = []
+        for other_id in self._overlapping(match, rule.get('id')):
+            conflict = self._classify(rule.get('id'), match,
+                                      rule.get('chain_id'), other_id)
+            if conflict:
+                result.append(conflict)
+        return result
+
+    def report(self):
+        """Return every conflict between the indexed rules, once."""
+        result = []
+        seen = set()
+        for rule_id, (match, chain_id) in self.rules.items():
+            for other_id in self._overlapping(match, rule_id):
+                pair = frozenset((rule_id, other_id))
+                if pair in seen:
+                    continue
+                seen.add(pair)
+                conflict = self._classify(rule_id, match, chain_id, other_id)
+                if conflict:
+                    result.append(conflict)
+        return sorted(result, key=lambda conflict: (
+            conflict['type'], conflict['rule_id'],
+            conflict['conflicting_rule_id']))
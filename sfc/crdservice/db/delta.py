@@ -22,22 +22,30 @@ from nscs.crdservice.api.v2 import attributes
 from nscs.crdservice.common import exceptions as q_exc
 from nscs.crdservice.db import api as qdbapi
 from nscs.crdservice.db import model_base
+from nscs.crdservice.openstack.common import jsonutils
+from nscs.crdservice.openstack.common.gettextutils import _
 from nscs.crdservice.openstack.common import log as logging
 from nscs.crdservice.openstack.common import uuidutils
 from nscs.crdservice.plugins.common import constants
 from nscs.crdservice.common import utils
+from nscs.crdservice import context as crd_context
 from nscs.crdservice.openstack.common import timeutils
 from nscs.crdservice.db import db_base_plugin_v2
 
 from nscs.crdservice.openstack.common import rpc
 from nscs.crdservice.openstack.common.rpc.proxy import RpcProxy as rpc_proxy
+from sfc.crdservice.common import clients
 from sfc.crdservice.common import exceptions as sfc_exc
+from sfc.crdservice.common import readiness
+from sfc.crdservice.common import routing
+from sfc.crdservice.db import rule_match
+from sfc.crdservice.dispatcher.ofcontroller import sfc as sfc_dispatcher
 
-from novaclient.v1_1 import client as nova_client
 from nscs.crdservice.common import topics
 from oslo.config import cfg
 import time
 
+import contextlib
 import datetime
 LOG = logging.getLogger(__name__)
 
@@ -50,6 +58,18 @@ crd_nwservices_opts = [
 
 cfg.CONF.register_opts(crd_nwservices_opts, "nscs_authtoken")
 
+sfc_delta_opts = [
+    cfg.BoolOpt('compact_updates', default=False,
+                help=_("Store and send only the changed fields of update "
+                       "deltas; consumers merge them into their copy")),
+    cfg.IntOpt('version_lease_timeout', default=300,
+               help=_("Seconds after which a leased runtime version whose "
+                      "writer neither committed nor rolled back is given "
+                      "up")),
+]
+
+cfg.CONF.register_opts(sfc_delta_opts, "sfc_delta")
+
 ############    
 #Network Service  Tables added by Veera
 ############
@@ -62,6 +82,11 @@ class HasTenant(object):
 class HasId(object):
     """id mixin, add to subclasses that have an id."""
     id = sa.Column(sa.String(36), primary_key=True, default=uuidutils.generate_uuid)
+
+
+class HasChangedFields(object):
+    """Changed fields mixin, set on update deltas stored in compact form."""
+    changed_fields = sa.Column(sa.String(1024))
     
  
 ###Networkfunctions table for delta
@@ -113,7 +138,8 @@ class sfc_vendors_delta(model_base.BASEV2, HasId, HasTenant):
     logged_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
     version_id = sa.Column(sa.Integer, sa.ForeignKey('crd_versions.runtime_version'), nullable=False)
     
-class sfc_appliances_delta(model_base.BASEV2, HasId, HasTenant):
+class sfc_appliances_delta(model_base.BASEV2, HasId, HasTenant,
+                           HasChangedFields):
     """Represents a v2 crd FSL service."""
     appliance_id = sa.Column(sa.String(36), nullable=False)
     name = sa.Column(sa.String(50))
@@ -136,7 +162,8 @@ class sfc_appliances_delta(model_base.BASEV2, HasId, HasTenant):
     version_id = sa.Column(sa.Integer, sa.ForeignKey('crd_versions.runtime_version'), nullable=False)
     
     
-class sfc_chains_delta(model_base.BASEV2, HasId, HasTenant):
+class sfc_chains_delta(model_base.BASEV2, HasId, HasTenant,
+                       HasChangedFields):
     """Represents a v2 crd FSL service."""
     chain_id = sa.Column(sa.String(36), nullable=False)
     name = sa.Column(sa.String(50))
@@ -146,7 +173,8 @@ class sfc_chains_delta(model_base.BASEV2, HasId, HasTenant):
     logged_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
     version_id = sa.Column(sa.Integer, sa.ForeignKey('crd_versions.runtime_version'), nullable=False)
     
-class sfc_chain_appliances_delta(model_base.BASEV2, HasId, HasTenant):
+class sfc_chain_appliances_delta(model_base.BASEV2, HasId, HasTenant,
+                                 HasChangedFields):
     """Represents a v2 crd FSL service."""
     chain_appliance_map_id = sa.Column(sa.String(36), nullable=False)
     name = sa.Column(sa.String(50))
@@ -158,7 +186,9 @@ class sfc_chain_appliances_delta(model_base.BASEV2, HasId, HasTenant):
     logged_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
     version_id = sa.Column(sa.Integer, sa.ForeignKey('crd_versions.runtime_version'), nullable=False)
 
-class sfc_chain_bypass_rules_delta(model_base.BASEV2, HasId, HasTenant):
+class sfc_chain_bypass_rules_delta(model_base.BASEV2, HasId, HasTenant,
+                                   HasChangedFields,
+                                   rule_match.HasTypedMatch):
     """Represents a v2 crd FSL service."""
     chain_bypass_rule_id = sa.Column(sa.String(36), nullable=False)
     chain_id = sa.Column(sa.String(36), nullable=False)
@@ -190,7 +220,8 @@ class sfc_chain_bypass_rules_delta(model_base.BASEV2, HasId, HasTenant):
     version_id = sa.Column(sa.Integer, sa.ForeignKey('crd_versions.runtime_version'), nullable=False)
     
 ### Chainset for delta
-class sfc_chainsets_delta(model_base.BASEV2, HasId, HasTenant):
+class sfc_chainsets_delta(model_base.BASEV2, HasId, HasTenant,
+                          HasChangedFields):
     """Represents a v2 crd FSL service."""
     chainset_id = sa.Column(sa.String(36), nullable=False)
     name = sa.Column(sa.String(50), nullable=False)
@@ -201,7 +232,8 @@ class sfc_chainsets_delta(model_base.BASEV2, HasId, HasTenant):
     logged_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
     version_id = sa.Column(sa.Integer, sa.ForeignKey('crd_versions.runtime_version'), nullable=False)
 
-class sfc_chainrules_delta(model_base.BASEV2, HasId, HasTenant):
+class sfc_chainrules_delta(model_base.BASEV2, HasId, HasTenant,
+                           HasChangedFields, rule_match.HasTypedMatch):
     """Represents a v2 crd FSL service."""
     chain_rule_id = sa.Column(sa.String(36))
     name = sa.Column(sa.String(50))
@@ -231,7 +263,8 @@ class sfc_chainrules_delta(model_base.BASEV2, HasId, HasTenant):
     logged_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
     version_id = sa.Column(sa.Integer, sa.ForeignKey('crd_versions.runtime_version'), nullable=False)
     
-class sfc_chainmaps_delta(model_base.BASEV2, HasId, HasTenant):
+class sfc_chainmaps_delta(model_base.BASEV2, HasId, HasTenant,
+                          HasChangedFields):
     """Represents a v2 crd FSL service."""
     chain_map_id = sa.Column(sa.String(36), nullable=False)
     name = sa.Column(sa.String(50))
@@ -245,7 +278,8 @@ class sfc_chainmaps_delta(model_base.BASEV2, HasId, HasTenant):
     version_id = sa.Column(sa.Integer, sa.ForeignKey('crd_versions.runtime_version'), nullable=False)
     
   
-class sfc_appliance_instances_delta(model_base.BASEV2, HasId, HasTenant):
+class sfc_appliance_instances_delta(model_base.BASEV2, HasId, HasTenant,
+                                    HasChangedFields):
     appliance_instance_id = sa.Column(sa.String(36))
     appliance_map_id = sa.Column(sa.String(36))
     instance_uuid = sa.Column(sa.String(36))
@@ -257,7 +291,8 @@ class sfc_appliance_instances_delta(model_base.BASEV2, HasId, HasTenant):
     logged_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
     version_id = sa.Column(sa.Integer, sa.ForeignKey('crd_versions.runtime_version'), nullable=False)
     
-class sfc_chainset_zone_delta(model_base.BASEV2, HasId, HasTenant):
+class sfc_chainset_zone_delta(model_base.BASEV2, HasId, HasTenant,
+                              HasChangedFields):
     """Represents a SFC Chainset Zone Delta."""
     zone_id = sa.Column(sa.String(36))
     zone = sa.Column(sa.String(50))
@@ -268,6 +303,100 @@ class sfc_chainset_zone_delta(model_base.BASEV2, HasId, HasTenant):
     logged_at = sa.Column(sa.DateTime, default=datetime.datetime.now, nullable=False)
     version_id = sa.Column(sa.Integer, sa.ForeignKey('crd_versions.runtime_version'), nullable=False)
 
+class sfc_delta_horizon(model_base.BASEV2, HasId):
+    """
+    Progress of the delta background jobs, one row per job: the newest
+    version compacted (HORIZON_ID) or sent from the outbox (OUTBOX_ID),
+    and the lease of the process running the job.
+    """
+    version_id = sa.Column(sa.Integer, nullable=False, default=0)
+    locked_by = sa.Column(sa.String(36))
+    locked_until = sa.Column(sa.DateTime)
+
+
+class sfc_version_leases(model_base.BASEV2):
+    """
+    Runtime versions created ahead of the transaction writing their
+    deltas. The writing transaction deletes the row, so a version stays
+    leased until its deltas are committed.
+    """
+    __tablename__ = 'sfc_version_leases'
+    version_id = sa.Column(sa.Integer, primary_key=True, autoincrement=False)
+    leased_until = sa.Column(sa.DateTime, nullable=False)
+
+
+class sfc_delta_outbox(model_base.BASEV2):
+    """Consumer messages committed with their delta rows, not yet sent."""
+    __tablename__ = 'sfc_delta_outbox'
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    version_id = sa.Column(sa.Integer, nullable=False, index=True)
+    message = sa.Column(sa.Text, nullable=False)
+    attempts = sa.Column(sa.Integer, nullable=False, default=0)
+    created_at = sa.Column(sa.DateTime, default=datetime.datetime.now,
+                           nullable=False)
+
+
+# Delta tables folded by the compactor: (delta table, object id column)
+COMPACTED_DELTAS = (
+    (sfc_networkfunctions_delta, 'networkfunction_id'),
+    (sfc_categories_delta, 'category_id'),
+    (sfc_category_networkfunctions_delta, 'category_networkfunction_id'),
+    (sfc_vendors_delta, 'vendor_id'),
+    (sfc_appliances_delta, 'appliance_id'),
+    (sfc_chains_delta, 'chain_id'),
+    (sfc_chain_appliances_delta, 'chain_appliance_map_id'),
+    (sfc_chain_bypass_rules_delta, 'chain_bypass_rule_id'),
+    (sfc_chainsets_delta, 'chainset_id'),
+    (sfc_chainrules_delta, 'chain_rule_id'),
+    (sfc_chainmaps_delta, 'chain_map_id'),
+    (sfc_appliance_instances_delta, 'appliance_instance_id'),
+    (sfc_chainset_zone_delta, 'zone_id'),
+)
+
+# Columns an update delta keeps in compact form besides its changed fields:
+# bookkeeping plus the ids consumers use to address the object.
+COMPACT_KEYS = ('id', 'tenant_id', 'name', 'operation', 'user_id',
+                'logged_at', 'version_id', 'changed_fields',
+                'appliance_id', 'chain_id', 'chain_appliance_map_id',
+                'chain_bypass_rule_id', 'chainset_id', 'chain_rule_id',
+                'chain_map_id', 'appliance_instance_id', 'appliance_map_id',
+                'zone_id')
+
+# Lookups of an object's deltas by operation and version, and scans of
+# every delta newer than a version.
+for model, object_column in COMPACTED_DELTAS:
+    sa.Index('ix_%s_object_version' % model.__tablename__,
+             model.__table__.c[object_column], model.__table__.c.operation,
+             model.__table__.c.version_id)
+    sa.Index('ix_%s_version' % model.__tablename__,
+             model.__table__.c.version_id)
+
+# Rule deltas of a chainset newer than the version of its rule index
+sa.Index('ix_sfc_chainrules_delta_chainset_version',
+         sfc_chainrules_delta.chainset_id, sfc_chainrules_delta.version_id)
+
+HORIZON_ID = 'sfc_delta'
+OUTBOX_ID = 'sfc_outbox'
+COMPACTION_CHUNK = 500
+
+# Delta tables replayed to consumers on resync:
+# (delta table, dict builder, consumer method suffix, operations not sent)
+CONSUMER_DELTAS = (
+    (sfc_appliances_delta, '_make_appliances_delta_dict', '_appliance', ()),
+    (sfc_chains_delta, '_make_chains_delta_dict', '_chain', ()),
+    (sfc_chain_appliances_delta, '_make_chain_appliances_delta_dict',
+     '_chain_appliance', ('update',)),
+    (sfc_chain_bypass_rules_delta, '_make_chain_bypass_rules_delta_dict',
+     '_chain_bypass_rules', ()),
+    (sfc_chainsets_delta, '_make_chainsets_delta_dict', '_chainsets', ()),
+    (sfc_chainrules_delta, '_make_chainrules_delta_dict', '_chainrule', ()),
+    (sfc_chainmaps_delta, '_make_chainmaps_delta_dict', '_chainmap', ()),
+    (sfc_appliance_instances_delta, '_make_appliance_instances_delta_dict',
+     '_appliance_instance', ()),
+    (sfc_chainset_zone_delta, '_make_chainset_zones_delta_dict',
+     '_chainset_zone', ()),
+)
+
 class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
     """
     A class that wraps the implementation of the Crd
@@ -310,7 +439,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
                 
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_version(context, tenant_id)
             networkfunctions_delta = sfc_networkfunctions_delta(tenant_id=tenant_id,
                                          id=uuidutils.generate_uuid(),
                                          networkfunction_id=n['id'],
@@ -366,7 +495,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
                 
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_version(context, tenant_id)
             categories_delta = sfc_categories_delta(tenant_id=tenant_id,
                                          id=uuidutils.generate_uuid(),
                                          category_id=n['id'],
@@ -423,7 +552,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
                 
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_version(context, tenant_id)
             category_networkfunctions_delta = sfc_category_networkfunctions_delta(tenant_id=tenant_id,
                                          id=uuidutils.generate_uuid(),
                                          category_networkfunction_id=n['id'],
@@ -482,7 +611,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
                 
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_version(context, tenant_id)
             vendors_delta = sfc_vendors_delta(tenant_id=tenant_id,
                                          id=uuidutils.generate_uuid(),
                                          vendor_id=n['id'],
@@ -532,6 +661,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                'operation': appliances_delta['operation'],
                'user_id': appliances_delta['user_id'],
                'logged_at': appliances_delta['logged_at'],
+               'changed_fields': appliances_delta['changed_fields'],
                'version_id': appliances_delta['version_id']}
         return self._fields(res, fields)
     
@@ -551,7 +681,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
                 
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_version(context, tenant_id)
             appliances_delta = sfc_appliances_delta(tenant_id=tenant_id,
                                          id=uuidutils.generate_uuid(),
                                          appliance_id=n['id'],
@@ -573,16 +703,15 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                          user_id=user_id,
                                          logged_at=datetime.datetime.now(),
                                          version_id=version_id)
+            self._strip_unchanged(n, appliances_delta)
             context.session.add(appliances_delta)
-        payload = self._make_appliances_delta_dict(appliances_delta)
-        method = n['operation']+"_appliance"
-        
-        fanoutmsg = {}
-        fanoutmsg.update({'method':method,'payload':payload})
-        delta={}
-        version = payload['version_id']
-        delta[version] = fanoutmsg
-        rpc.fanout_cast(context,'crd-consumer', rpc_proxy.make_msg('call_consumer',payload=delta))
+            self._invalidate_routes(context)
+            payload = self._make_appliances_delta_dict(appliances_delta)
+            method = n['operation']+"_appliance"
+
+            fanoutmsg = {}
+            fanoutmsg.update({'method':method,'payload':payload})
+            self._queue_fanout(context, payload['version_id'], fanoutmsg)
         
         return self._make_appliances_delta_dict(appliances_delta)
     
@@ -608,6 +737,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                'operation': chains_delta['operation'],
                'user_id': chains_delta['user_id'],
                'logged_at': chains_delta['logged_at'],
+               'changed_fields': chains_delta['changed_fields'],
                'version_id': chains_delta['version_id']}
         return self._fields(res, fields)
     
@@ -627,7 +757,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
                 
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_version(context, tenant_id)
             chains_delta = sfc_chains_delta(tenant_id=tenant_id,
                                          id=uuidutils.generate_uuid(),
                                          chain_id=n['id'],
@@ -637,15 +767,13 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                          user_id=user_id,
                                          logged_at=datetime.datetime.now(),
                                          version_id=version_id)
+            self._strip_unchanged(n, chains_delta)
             context.session.add(chains_delta)
-        payload = self._make_chains_delta_dict(chains_delta)
-        method = n['operation']+"_chain"
-        fanoutmsg = {}
-        fanoutmsg.update({'method':method,'payload':payload})
-        delta={}
-        version = payload['version_id']
-        delta[version] = fanoutmsg
-        rpc.fanout_cast(context,'crd-consumer', rpc_proxy.make_msg('call_consumer',payload=delta))
+            payload = self._make_chains_delta_dict(chains_delta)
+            method = n['operation']+"_chain"
+            fanoutmsg = {}
+            fanoutmsg.update({'method':method,'payload':payload})
+            self._queue_fanout(context, payload['version_id'], fanoutmsg)
                
         return self._make_chains_delta_dict(chains_delta)
     
@@ -673,6 +801,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
 	       'operation': chain_appliances_delta['operation'],
                'user_id': chain_appliances_delta['user_id'],
                'logged_at': chain_appliances_delta['logged_at'],
+               'changed_fields': chain_appliances_delta['changed_fields'],
                'version_id': chain_appliances_delta['version_id']}
         return self._fields(res, fields)
     
@@ -692,7 +821,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
                 
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_version(context, tenant_id)
             chain_appliances_delta = sfc_chain_appliances_delta(tenant_id=tenant_id,
                                          id=uuidutils.generate_uuid(),
                                          name=n['name'],
@@ -704,16 +833,15 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                          user_id=user_id,
                                          logged_at=datetime.datetime.now(),
                                          version_id=version_id)
+            self._strip_unchanged(n, chain_appliances_delta)
             context.session.add(chain_appliances_delta)
-        payload = self._make_chain_appliances_delta_dict(chain_appliances_delta)
-        method = n['operation']+"_chain_appliance"
-        if n['operation'] != 'update':
-            fanoutmsg = {}
-            fanoutmsg.update({'method':method,'payload':payload})
-            delta={}
-            version = payload['version_id']
-            delta[version] = fanoutmsg
-            rpc.fanout_cast(context,'crd-consumer', rpc_proxy.make_msg('call_consumer',payload=delta))
+            self._invalidate_routes(context)
+            payload = self._make_chain_appliances_delta_dict(chain_appliances_delta)
+            method = n['operation']+"_chain_appliance"
+            if n['operation'] != 'update':
+                fanoutmsg = {}
+                fanoutmsg.update({'method':method,'payload':payload})
+                self._queue_fanout(context, payload['version_id'], fanoutmsg)
         return self._make_chain_appliances_delta_dict(chain_appliances_delta)
     
     def _get_chain_appliances_delta(self, context, id):
@@ -757,7 +885,9 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                'operation': chain_bypass_rule['operation'],
                'user_id': chain_bypass_rule['user_id'],
                'logged_at': chain_bypass_rule['logged_at'],
+               'changed_fields': chain_bypass_rule['changed_fields'],
                'version_id': chain_bypass_rule['version_id']}
+        res.update(rule_match.match_dict(chain_bypass_rule))
         return self._fields(res, fields)
     
     def get_chain_bypass_rules_delta(self, context, id, fields=None):
@@ -776,7 +906,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
                 
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_version(context, tenant_id)
             chain_bypass_rules_delta = sfc_chain_bypass_rules_delta(tenant_id=tenant_id,
                                          id=uuidutils.generate_uuid(),
                                          chain_bypass_rule_id= cbr['id'],
@@ -807,15 +937,15 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                          user_id=user_id,
                                          logged_at=datetime.datetime.now(),
                                          version_id=version_id)
+            for field in rule_match.MATCH_FIELDS:
+                setattr(chain_bypass_rules_delta, field, cbr.get(field))
+            self._strip_unchanged(cbr, chain_bypass_rules_delta)
             context.session.add(chain_bypass_rules_delta)
-        payload = self._make_chain_bypass_rules_delta_dict(chain_bypass_rules_delta)
-        method = cbr['operation']+"_chain_bypass_rules"
-        fanoutmsg = {}
-        fanoutmsg.update({'method':method,'payload':payload})
-        delta={}
-        version = payload['version_id']
-        delta[version] = fanoutmsg
-        rpc.fanout_cast(context,'crd-consumer', rpc_proxy.make_msg('call_consumer',payload=delta))    
+            payload = self._make_chain_bypass_rules_delta_dict(chain_bypass_rules_delta)
+            method = cbr['operation']+"_chain_bypass_rules"
+            fanoutmsg = {}
+            fanoutmsg.update({'method':method,'payload':payload})
+            self._queue_fanout(context, payload['version_id'], fanoutmsg)
         return self._make_chain_bypass_rules_delta_dict(chain_bypass_rules_delta)
     
     def _get_chain_bypass_rules_delta(self, context, id):
@@ -839,6 +969,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                'operation': chainsets_delta['operation'],
                'user_id': chainsets_delta['user_id'],
                'logged_at': chainsets_delta['logged_at'],
+               'changed_fields': chainsets_delta['changed_fields'],
                'version_id': chainsets_delta['version_id']}
         return self._fields(res, fields)
     
@@ -858,7 +989,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
                 
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_version(context, tenant_id)
             chainsets_delta = sfc_chainsets_delta(tenant_id=tenant_id,
                                          id=uuidutils.generate_uuid(),
                                          chainset_id= cbr['id'],
@@ -869,15 +1000,13 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                          user_id=user_id,
                                          logged_at=datetime.datetime.now(),
                                          version_id=version_id)
+            self._strip_unchanged(cbr, chainsets_delta)
             context.session.add(chainsets_delta)
-        payload = self._make_chainsets_delta_dict(chainsets_delta)
-        method = cbr['operation']+"_chainsets"
-        fanoutmsg = {}
-        fanoutmsg.update({'method':method,'payload':payload})
-        delta={}
-        version = payload['version_id']
-        delta[version] = fanoutmsg
-        rpc.fanout_cast(context,'crd-consumer', rpc_proxy.make_msg('call_consumer',payload=delta))
+            payload = self._make_chainsets_delta_dict(chainsets_delta)
+            method = cbr['operation']+"_chainsets"
+            fanoutmsg = {}
+            fanoutmsg.update({'method':method,'payload':payload})
+            self._queue_fanout(context, payload['version_id'], fanoutmsg)
         return self._make_chainsets_delta_dict(chainsets_delta)
     
     def _get_chainsets_delta(self, context, id):
@@ -919,7 +1048,9 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                'ip_protocol' : chainrules_delta['ip_protocol'],
                'user_id': chainrules_delta['user_id'],
                'logged_at': chainrules_delta['logged_at'],
+               'changed_fields': chainrules_delta['changed_fields'],
                'version_id': chainrules_delta['version_id']}
+        res.update(rule_match.match_dict(chainrules_delta))
         return self._fields(res, fields)
     
     def get_chainrules_delta(self, context, id, fields=None):
@@ -938,7 +1069,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
                 
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_version(context, tenant_id)
             chainrules_delta = sfc_chainrules_delta(tenant_id=tenant_id,
                                          id=uuidutils.generate_uuid(),
                                          chain_rule_id = n['id'],
@@ -968,15 +1099,15 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                          user_id=user_id,
                                          logged_at=datetime.datetime.now(),
                                          version_id=version_id)
+            for field in rule_match.MATCH_FIELDS:
+                setattr(chainrules_delta, field, n.get(field))
+            self._strip_unchanged(n, chainrules_delta)
             context.session.add(chainrules_delta)
-        payload = self._make_chainrules_delta_dict(chainrules_delta)
-        method = n['operation']+"_chainrule"
-        fanoutmsg = {}
-        fanoutmsg.update({'method':method,'payload':payload})
-        delta={}
-        version = payload['version_id']
-        delta[version] = fanoutmsg
-        rpc.fanout_cast(context,'crd-consumer', rpc_proxy.make_msg('call_consumer',payload=delta))
+            payload = self._make_chainrules_delta_dict(chainrules_delta)
+            method = n['operation']+"_chainrule"
+            fanoutmsg = {}
+            fanoutmsg.update({'method':method,'payload':payload})
+            self._queue_fanout(context, payload['version_id'], fanoutmsg)
         return self._make_chainrules_delta_dict(chainrules_delta)
     
     def _get_chainrules_delta(self, context, id):
@@ -1004,6 +1135,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                'operation': chainmaps_delta['operation'],
                'user_id': chainmaps_delta['user_id'],
                'logged_at': chainmaps_delta['logged_at'],
+               'changed_fields': chainmaps_delta['changed_fields'],
                'version_id': chainmaps_delta['version_id']}
         return self._fields(res, fields)
     
@@ -1023,7 +1155,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
                 
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_version(context, tenant_id)
             chainmaps_delta = sfc_chainmaps_delta(tenant_id=tenant_id,
                                          id=uuidutils.generate_uuid(),
                                          chain_map_id = n['id'],
@@ -1036,15 +1168,13 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                          user_id=user_id,
                                          logged_at=datetime.datetime.now(),
                                          version_id=version_id)
+            self._strip_unchanged(n, chainmaps_delta)
             context.session.add(chainmaps_delta)
-        payload = self._make_chainmaps_delta_dict(chainmaps_delta)
-        method = n['operation']+"_chainmap"
-        fanoutmsg = {}
-        fanoutmsg.update({'method':method,'payload':payload})
-        delta={}
-        version = payload['version_id']
-        delta[version] = fanoutmsg
-        rpc.fanout_cast(context,'crd-consumer', rpc_proxy.make_msg('call_consumer',payload=delta))
+            payload = self._make_chainmaps_delta_dict(chainmaps_delta)
+            method = n['operation']+"_chainmap"
+            fanoutmsg = {}
+            fanoutmsg.update({'method':method,'payload':payload})
+            self._queue_fanout(context, payload['version_id'], fanoutmsg)
         return self._make_chainmaps_delta_dict(chainmaps_delta)
     
     def _get_chainmaps_delta(self, context, id):
@@ -1070,6 +1200,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                'operation': appliance_instances_delta['operation'],
                'user_id': appliance_instances_delta['user_id'],
                'logged_at': appliance_instances_delta['logged_at'],
+               'changed_fields': appliance_instances_delta['changed_fields'],
                'version_id': appliance_instances_delta['version_id']}
         return self._fields(res, fields)
     
@@ -1089,7 +1220,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
                 
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_version(context, tenant_id)
             appliance_instances_delta = sfc_appliance_instances_delta(tenant_id=tenant_id,
                                          id=uuidutils.generate_uuid(),
                                          appliance_instance_id = n['id'],
@@ -1102,16 +1233,15 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                          user_id=user_id,
                                          logged_at=datetime.datetime.now(),
                                          version_id=version_id)
+            self._strip_unchanged(n, appliance_instances_delta)
             context.session.add(appliance_instances_delta)
-        payload = self._make_appliance_instances_delta_dict(appliance_instances_delta)
-        payload.update({'chain_id': n['chain_id']})
-        method = n['operation']+"_appliance_instance"
-        fanoutmsg = {}
-        fanoutmsg.update({'method':method,'payload':payload})
-        delta={}
-        version = payload['version_id']
-        delta[version] = fanoutmsg
-        rpc.fanout_cast(context,'crd-consumer', rpc_proxy.make_msg('call_consumer',payload=delta))
+            self._invalidate_routes(context)
+            payload = self._make_appliance_instances_delta_dict(appliance_instances_delta)
+            payload.update({'chain_id': n['chain_id']})
+            method = n['operation']+"_appliance_instance"
+            fanoutmsg = {}
+            fanoutmsg.update({'method':method,'payload':payload})
+            self._queue_fanout(context, payload['version_id'], fanoutmsg)
         
         if n['instance_uuid'] and n['vlan_in'] and n['vlan_out']:
             res = {'header': 'request',
@@ -1178,6 +1308,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                'operation': chainset_zones_delta['operation'],
                'user_id': chainset_zones_delta['user_id'],
                'logged_at': chainset_zones_delta['logged_at'],
+               'changed_fields': chainset_zones_delta['changed_fields'],
                'version_id': chainset_zones_delta['version_id']}
         return self._fields(res, fields)
     
@@ -1197,7 +1328,7 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
         user_id = context.user_id
                 
         with context.session.begin(subtransactions=True):
-            version_id = self.create_version(context, tenant_id)
+            version_id = self.allocate_version(context, tenant_id)
             chainset_zones_delta = sfc_chainset_zone_delta(tenant_id=tenant_id,
                                          id=uuidutils.generate_uuid(),
                                          zone_id = n['id'],
@@ -1208,15 +1339,13 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
                                          user_id=user_id,
                                          logged_at=datetime.datetime.now(),
                                          version_id=version_id)
+            self._strip_unchanged(n, chainset_zones_delta)
             context.session.add(chainset_zones_delta)
-        payload = self._make_chainset_zones_delta_dict(chainset_zones_delta)
-        method = n['operation']+"_chainset_zone"
-        fanoutmsg = {}
-        fanoutmsg.update({'method':method,'payload':payload})
-        delta={}
-        version = payload['version_id']
-        delta[version] = fanoutmsg
-        rpc.fanout_cast(context,'crd-consumer', rpc_proxy.make_msg('call_consumer',payload=delta))
+            payload = self._make_chainset_zones_delta_dict(chainset_zones_delta)
+            method = n['operation']+"_chainset_zone"
+            fanoutmsg = {}
+            fanoutmsg.update({'method':method,'payload':payload})
+            self._queue_fanout(context, payload['version_id'], fanoutmsg)
         return self._make_chainset_zones_delta_dict(chainset_zones_delta)
     
     def _get_chainset_zones_delta(self, context, id):
@@ -1228,24 +1357,463 @@ class SfcDeltaDb(db_base_plugin_v2.CrdDbPluginV2):
             LOG.error('Multiple chainset_zones_deltas match for %s' % id)
             raise sfc_exc.chainset_zones_deltaNotFound(chainset_zones_delta_id=id)
         return chainset_zones_delta
-    
+
+    ######################### Consumer Snapshot ###############################
+    def get_snapshot_rows(self, context, delta_model, object_column,
+                          live_model, eager=None, marker=None, limit=None,
+                          ids=None):
+        """
+        Return (live row, newest create version) pairs for every row of
+        live_model that has a create delta, using one grouped query instead
+        of a delta lookup per row. Relationships named in eager are joined
+        in the same query. Rows are ordered by id; marker and limit select
+        the page after the row with id marker, ids restricts the rows.
+        """
+        object_id = getattr(delta_model, object_column)
+        latest = context.session.query(
+            object_id.label('object_id'),
+            sa.func.max(delta_model.version_id).label('version_id')).filter(
+                delta_model.operation == 'create').group_by(
+                    object_id).subquery()
+        query = self._model_query(context, live_model).add_columns(
+            latest.c.version_id).join(
+                latest, live_model.id == latest.c.object_id)
+        for relation in eager or []:
+            query = query.options(orm.joinedload(relation))
+        if ids is not None:
+            query = query.filter(live_model.id.in_(ids))
+        if marker:
+            query = query.filter(live_model.id > marker)
+        query = query.order_by(live_model.id)
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+    def get_changed_object_ids(self, context, delta_model, object_column,
+                               version):
+        """Return the ids of objects with a delta newer than version."""
+        object_id = getattr(delta_model, object_column)
+        query = context.session.query(object_id).filter(
+            delta_model.version_id > version).distinct()
+        return [row[0] for row in query]
+
+    def get_changed_chainset_rule_ids(self, context, chainset_id, version,
+                                      until):
+        """
+        Return the ids of the selection rules of a chainset with a delta
+        newer than version, up to the committed version until.
+        """
+        query = context.session.query(
+            sfc_chainrules_delta.chain_rule_id).filter(
+                sfc_chainrules_delta.chainset_id == chainset_id,
+                sfc_chainrules_delta.version_id > version,
+                sfc_chainrules_delta.version_id <= until).distinct()
+        return [row[0] for row in query]
+
+    def get_runtime_version(self, context):
+        """
+        Return the committed runtime version, 0 if none: the newest version
+        handed out, but below the oldest version still leased, since its
+        deltas may yet commit after those of newer versions.
+        """
+        versions = model_base.BASEV2.metadata.tables['crd_versions']
+        version = context.session.query(
+            sa.func.max(versions.c.runtime_version)).scalar() or 0
+        leased = context.session.query(
+            sa.func.min(sfc_version_leases.version_id)).filter(
+                sfc_version_leases.leased_until > timeutils.utcnow()).scalar()
+        if leased:
+            version = min(version, leased - 1)
+        return version
+
+    ######################### Runtime Versions ###############################
+    def allocate_version(self, context, tenant_id):
+        """
+        Return the runtime version of the next delta written with context:
+        the version of the enclosing delta_batch, else a version created
+        in a short transaction of its own and leased until the writing
+        transaction ends, so that concurrent writers do not wait on each
+        other for the version table and consumers are sent nothing newer
+        than a version still being written. Call it inside the writing
+        transaction.
+        """
+        batch = getattr(context, 'sfc_delta_batch', None)
+        if batch:
+            return batch[0]
+        version = self._lease_version(tenant_id)
+        self._release_on_rollback(context, version)
+        context.session.query(sfc_version_leases).filter_by(
+            version_id=version).delete(synchronize_session=False)
+        return version
+
+    def _lease_version(self, tenant_id):
+        """
+        Create a runtime version in a short transaction of its own and
+        lease it for version_lease_timeout seconds. Expired leases, of
+        writers that died, are dropped on the way.
+        """
+        context = crd_context.Context('crd', 'crd', is_admin=True)
+        now = timeutils.utcnow()
+        timeout = cfg.CONF.sfc_delta.version_lease_timeout
+        with context.session.begin(subtransactions=True):
+            context.session.query(sfc_version_leases).filter(
+                sfc_version_leases.leased_until <= now).delete(
+                    synchronize_session=False)
+            version = self.create_version(context, tenant_id)
+            context.session.add(sfc_version_leases(
+                version_id=version,
+                leased_until=now + datetime.timedelta(seconds=timeout)))
+        return version
+
+    def _release_on_rollback(self, context, version):
+        """
+        Give up the lease of version if the transaction writing its deltas
+        rolls back, rather than holding back newer versions until the lease
+        expires.
+        """
+        session = context.session
+        if session.transaction is None:
+            return
+        leased = getattr(session, 'sfc_leased_versions', None)
+        if leased is None:
+            leased = session.sfc_leased_versions = []
+
+            def _release(session):
+                if leased:
+                    admin = crd_context.Context('crd', 'crd', is_admin=True)
+                    with admin.session.begin(subtransactions=True):
+                        admin.session.query(sfc_version_leases).filter(
+                            sfc_version_leases.version_id.in_(leased)).delete(
+                                synchronize_session=False)
+                    del leased[:]
+
+            def _forget(session):
+                del leased[:]
+            sa.event.listen(session, 'after_rollback', _release)
+            sa.event.listen(session, 'after_commit', _forget)
+        leased.append(version)
+
+    @contextlib.contextmanager
+    def delta_batch(self, context, tenant_id):
+        """
+        Write every delta of the enclosed calls under one runtime version
+        and queue their consumer messages as a single apply_delta_batch
+        message. Use inside the transaction that writes the deltas.
+        """
+        version = self.allocate_version(context, tenant_id)
+        messages = []
+        context.sfc_delta_batch = (version, messages)
+        try:
+            yield version
+        finally:
+            del context.sfc_delta_batch
+        if messages:
+            self._queue_fanout(context, version, {
+                'method': 'apply_delta_batch',
+                'payload': {'deltas': [[version, message]
+                                       for message in messages]}})
+
+    ######################### Compact Updates ###############################
+    def _invalidate_routes(self, context):
+        """
+        Drop the config handle routes after a change of the appliances
+        or instances behind them. Inside a transaction they are dropped
+        again when it commits, since until then they resolve to the old
+        rows.
+        """
+        routes = routing.ConfigRoutes.get_instance()
+        routes.invalidate()
+        session = context.session
+        if session.transaction is None:
+            return
+        pending = getattr(session, 'sfc_route_invalidation', None)
+        if pending is None:
+            pending = session.sfc_route_invalidation = []
+
+            def _flush(session):
+                if pending:
+                    del pending[:]
+                    routes.invalidate()
+            sa.event.listen(session, 'after_commit', _flush)
+        pending.append(True)
+
+    def _strip_unchanged(self, n, delta):
+        """
+        With compact_updates on, clear the columns of an update delta that
+        the update did not change. n['changed_fields'] lists the changed
+        fields; without it, or when a field has no column of the same name,
+        the full row is kept.
+        """
+        changed = n.get('changed_fields')
+        if (not cfg.CONF.sfc_delta.compact_updates or changed is None or
+                n['operation'] != 'update'):
+            return
+        columns = delta.__table__.columns
+        if [field for field in changed if field not in columns]:
+            return
+        kept = set(changed).union(COMPACT_KEYS)
+        for column in columns:
+            if column.nullable and column.name not in kept:
+                setattr(delta, column.name, None)
+        delta.changed_fields = ','.join(changed)
+
+    def _compact_payload(self, payload):
+        """
+        Reduce the consumer payload of a compact update delta to its
+        changed fields and the ids in COMPACT_KEYS. Full deltas are
+        returned without the changed_fields key.
+        """
+        changed = payload.pop('changed_fields', None)
+        if not changed:
+            return payload
+        changed = changed.split(',')
+        kept = set(changed).union(COMPACT_KEYS)
+        payload = dict((field, value) for field, value in payload.iteritems()
+                       if field in kept)
+        payload['changed_fields'] = changed
+        return payload
+
+    ######################### Job Leases ###############################
+    def _take_lease(self, context, job_id, owner, lease):
+        """
+        Hold the lease of a background job for owner for the next lease
+        seconds, unless another owner holds it; returns whether owner
+        holds it.
+        """
+        now = timeutils.utcnow()
+        with context.session.begin(subtransactions=True):
+            job = context.session.query(sfc_delta_horizon).filter_by(
+                id=job_id).with_lockmode('update').first()
+            if not job:
+                job = sfc_delta_horizon(id=job_id, version_id=0)
+                context.session.add(job)
+            elif (job.locked_by not in (None, owner) and
+                  job.locked_until and job.locked_until > now):
+                return False
+            job.locked_by = owner
+            job.locked_until = now + datetime.timedelta(seconds=lease)
+        return True
+
+    def _release_lease(self, context, job_id, owner):
+        with context.session.begin(subtransactions=True):
+            context.session.query(sfc_delta_horizon).filter_by(
+                id=job_id, locked_by=owner).update(
+                    {'locked_by': None, 'locked_until': None},
+                    synchronize_session=False)
+
+    ######################### Delta Outbox ###############################
+    def _queue_fanout(self, context, version_id, message):
+        """
+        Queue a consumer message in the transaction that writes its delta
+        row; the dispatcher sends it once the transaction has committed.
+        Inside a delta_batch the message joins the batch message instead.
+        """
+        message['payload'] = self._compact_payload(message['payload'])
+        batch = getattr(context, 'sfc_delta_batch', None)
+        if batch:
+            batch[1].append(message)
+            return
+        context.session.add(sfc_delta_outbox(version_id=version_id,
+                                             message=jsonutils.dumps(message)))
+        sfc_dispatcher.SfcBatchDispatcher.get_instance().notify(self)
+
+    def drain_outbox(self, context, send, limit, owner, lease):
+        """
+        Pass up to limit queued messages, in version order, to send as a
+        list of (version_id, message) and delete them once sent. Only
+        versions up to the committed runtime version are taken; every
+        version is leased until its write commits, so a message never
+        overtakes one of an older version still being written, whatever
+        order the writers commit in. One process drains at a time, under
+        the outbox lease held for owner for lease seconds and given up
+        once the outbox is empty; no row is locked while send runs. When
+        send fails the messages
+        stay queued with one more attempt counted, so every message is
+        delivered at least once. Returns the number sent.
+        """
+        if not self._take_lease(context, OUTBOX_ID, owner, lease):
+            return 0
+        committed = self.get_runtime_version(context)
+        rows = context.session.query(
+            sfc_delta_outbox.id, sfc_delta_outbox.version_id,
+            sfc_delta_outbox.message).filter(
+                sfc_delta_outbox.version_id <= committed).order_by(
+                    sfc_delta_outbox.version_id, sfc_delta_outbox.id).limit(
+                        limit).all()
+        ids = [row[0] for row in rows]
+        try:
+            if rows:
+                send([(version_id, jsonutils.loads(message))
+                      for id, version_id, message in rows])
+        except Exception:
+            with context.session.begin(subtransactions=True):
+                context.session.query(sfc_delta_outbox).filter(
+                    sfc_delta_outbox.id.in_(ids)).update(
+                        {'attempts': sfc_delta_outbox.attempts + 1},
+                        synchronize_session=False)
+            self._release_lease(context, OUTBOX_ID, owner)
+            raise
+        with context.session.begin(subtransactions=True):
+            if ids:
+                context.session.query(sfc_delta_outbox).filter(
+                    sfc_delta_outbox.id.in_(ids)).delete(
+                        synchronize_session=False)
+                context.session.query(sfc_delta_horizon).filter_by(
+                    id=OUTBOX_ID).update({'version_id': rows[-1][1]},
+                                         synchronize_session=False)
+        if len(rows) < limit:
+            self._release_lease(context, OUTBOX_ID, owner)
+        return len(rows)
+
+    ######################### Delta Compaction ###############################
+    def get_compaction_horizon(self, context):
+        """
+        Return the version up to which delta histories have been folded.
+        Consumers older than this can not be resynced from the deltas.
+        """
+        horizon = context.session.query(sfc_delta_horizon).filter_by(
+            id=HORIZON_ID).first()
+        if horizon:
+            return horizon.version_id
+        return 0
+
+    def compact_deltas(self, context, low_water, lease):
+        """
+        Fold the history of every object up to low_water into a single
+        create row holding its latest state and drop the histories that
+        end in a delete. The horizon is moved first, so consumers behind
+        it are sent a snapshot instead of a partially compacted history.
+        Only the process holding the compaction lease compacts; the lease
+        lasts lease seconds and is renewed before each table.
+        """
+        if low_water <= self.get_compaction_horizon(context):
+            return
+        owner = uuidutils.generate_uuid()
+        if not self._take_lease(context, HORIZON_ID, owner, lease):
+            LOG.debug(_("Delta compaction running in another process"))
+            return
+        try:
+            with context.session.begin(subtransactions=True):
+                horizon = context.session.query(sfc_delta_horizon).filter_by(
+                    id=HORIZON_ID).first()
+                if low_water <= horizon.version_id:
+                    return
+                horizon.version_id = low_water
+            for model, object_column in COMPACTED_DELTAS:
+                if not self._take_lease(context, HORIZON_ID, owner, lease):
+                    LOG.warn(_("Delta compaction lease lost, stopped before "
+                               "%s"), model.__tablename__)
+                    return
+                self._compact_delta_table(context, model, object_column,
+                                          low_water)
+        finally:
+            self._release_lease(context, HORIZON_ID, owner)
+
+    def _compact_delta_table(self, context, model, object_column, low_water):
+        object_id = getattr(model, object_column)
+        latest = dict(context.session.query(
+            object_id, sa.func.max(model.version_id)).filter(
+                model.version_id <= low_water).group_by(object_id))
+        dropped, folded, partial = [], [], []
+        columns = [model.id, object_id, model.version_id, model.operation]
+        if hasattr(model, 'changed_fields'):
+            columns.append(model.changed_fields)
+        rows = context.session.query(*columns).filter(
+            model.version_id <= low_water).yield_per(COMPACTION_CHUNK)
+        for row in rows:
+            id, obj, version, operation = row[:4]
+            if version < latest[obj] or operation == 'delete':
+                dropped.append(id)
+            elif operation != 'create':
+                folded.append(id)
+                if row[4:] and row[4]:
+                    partial.append(obj)
+        with context.session.begin(subtransactions=True):
+            for obj in partial:
+                self._fill_compact_delta(context, model, object_column, obj,
+                                         low_water)
+            for i in range(0, len(dropped), COMPACTION_CHUNK):
+                context.session.query(model).filter(
+                    model.id.in_(dropped[i:i + COMPACTION_CHUNK])).delete(
+                        synchronize_session=False)
+            for i in range(0, len(folded), COMPACTION_CHUNK):
+                context.session.query(model).filter(
+                    model.id.in_(folded[i:i + COMPACTION_CHUNK])).update(
+                        {'operation': 'create'}, synchronize_session=False)
+        LOG.debug(_("Compacted %(table)s up to version %(ver)s: %(dropped)s "
+                    "rows dropped, %(folded)s folded"),
+                  {'table': model.__tablename__, 'ver': low_water,
+                   'dropped': len(dropped), 'folded': len(folded)})
+
+    def _fill_compact_delta(self, context, model, object_column, obj,
+                            low_water):
+        """
+        Give the newest delta of obj at or below low_water, a compact
+        update, the full state replayed from the history being folded.
+        """
+        rows = context.session.query(model).filter(
+            getattr(model, object_column) == obj,
+            model.version_id <= low_water).order_by(model.version_id).all()
+        names = [column.name for column in model.__table__.columns
+                 if column.name not in COMPACT_KEYS]
+        state = {}
+        for row in rows:
+            if row.changed_fields:
+                state.update((name, getattr(row, name))
+                             for name in row.changed_fields.split(','))
+            else:
+                state.update((name, getattr(row, name)) for name in names)
+        latest = rows[-1]
+        for name, value in state.iteritems():
+            if name in names:
+                setattr(latest, name, value)
+        latest.changed_fields = None
+
+    def get_deltas_since(self, context, version, until):
+        """
+        Return the consumer messages of every delta newer than version, up
+        to the committed version until, as a list of (version_id, message)
+        pairs in version order. The deltas of one version, written by a
+        bulk call, keep the order they were written in.
+        """
+        deltas = []
+        for model, make_dict, suffix, skipped in CONSUMER_DELTAS:
+            query = context.session.query(model).filter(
+                model.version_id > version, model.version_id <= until)
+            if skipped:
+                query = query.filter(~model.operation.in_(skipped))
+            if model is sfc_appliance_instances_delta:
+                # Instance messages carry the chain of their appliance map
+                chains = context.session.query(
+                    sfc_chain_appliances_delta.chain_appliance_map_id,
+                    sfc_chain_appliances_delta.chain_id).distinct().subquery()
+                rows = query.add_columns(chains.c.chain_id).outerjoin(
+                    chains, model.appliance_map_id ==
+                    chains.c.chain_appliance_map_id)
+            else:
+                rows = ((row, None) for row in query)
+            make_dict = getattr(self, make_dict)
+            for row, chain_id in rows:
+                payload = make_dict(row)
+                if model is sfc_appliance_instances_delta:
+                    payload['chain_id'] = chain_id
+                deltas.append((row['version_id'], row['logged_at'],
+                               {'method': row['operation'] + suffix,
+                                'payload': self._compact_payload(payload)}))
+        deltas.sort(key=lambda d: d[:2])
+        return [(version_id, message)
+                for version_id, logged_at, message in deltas]
+
 def novaclient():
-    return nova_client.Client(cfg.CONF.nscs_authtoken.admin_user,
-                              cfg.CONF.nscs_authtoken.admin_password,
-                              cfg.CONF.nscs_authtoken.admin_tenant_name,
-                              auth_url=cfg.CONF.nscs_authtoken.auth_url,
-                              service_type="compute")
+    return clients.admin_novaclient(cfg.CONF.nscs_authtoken)
 
 def _get_relay_topic_name(hostname):
     return '%s.%s' % (topics.RELAY_AGENT, hostname)
 
 def wait_for_instance_active(instance_uuid, timeout=300):
-    #LOG.debug('Looping for 300 secs')
-    for i in range(0, timeout):
-        time.sleep(1)
-        #LOG.debug('After Sleep.')
-        nt = novaclient()
-        LOG.debug('novaclient = %s' % str(nt))
+    nt = novaclient()
+
+    def _check():
         try:
             instance_details = nt.servers.get(instance_uuid)
         except Exception, msg:
@@ -1268,6 +1836,9 @@ def wait_for_instance_active(instance_uuid, timeout=300):
                 'OS-EXT-STS:vm_state') == 'error':
             raise q_exc.InstanceErrorState(instance_id=instance_uuid)
 
+    return readiness.InstanceReadiness.get_instance().wait_for(
+        instance_uuid, _check, timeout)
+
 def prepare_msg(instance_id, tenant_id, msg,
                 update_type='config_update'):
     m = rpc_proxy.make_msg(update_type,
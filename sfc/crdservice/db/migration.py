@@ -0,0 +1,150 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-place schema upgrades for SFC tables.
+
+register_models() only creates missing tables, so columns and indexes
+added to an existing SFC model are added here, and new derived columns
+are filled in. The upgrade is run once per release with sfc-db-upgrade,
+before the CRD service starts; it records SCHEMA_VERSION, which the
+service checks on start. Every step checks the live schema or data first,
+so running it again is harmless.
+"""
+
+import sqlalchemy as sa
+from sqlalchemy.engine import reflection
+from sqlalchemy.schema import CreateColumn
+
+from oslo.config import cfg
+
+from nscs.crdservice.common import config as logging_config
+from nscs.crdservice.db import api as db_api
+from nscs.crdservice.db import model_base
+from nscs.crdservice.openstack.common import log as logging
+from nscs.crdservice.common import exceptions as q_exc
+from nscs.crdservice.openstack.common.gettextutils import _
+from sfc.crdservice.db import rule_match
+from sfc.crdservice.db import sfc_db
+
+LOG = logging.getLogger(__name__)
+
+# Raise whenever a column, an index or a step is added
+SCHEMA_VERSION = 3
+# Schema version whose upgrade fills the typed match columns of rules
+TYPED_MATCH_VERSION = 1
+SCHEMA_ID = 'sfc'
+
+
+class sfc_schema_version(model_base.BASEV2):
+    """Schema version the SFC tables were last upgraded to."""
+    __tablename__ = 'sfc_schema_version'
+    id = sa.Column(sa.String(36), primary_key=True)
+    version = sa.Column(sa.Integer, nullable=False)
+
+
+def _sfc_tables(inspector):
+    """The existing SFC tables, with their delta tables."""
+    tables = set(inspector.get_table_names())
+    return [table for table in model_base.BASEV2.metadata.sorted_tables
+            if table.name.startswith('sfc_') and table.name in tables]
+
+
+def _add_missing_columns(engine, inspector):
+    for table in _sfc_tables(inspector):
+        existing = set(column['name']
+                       for column in inspector.get_columns(table.name))
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = CreateColumn(column).compile(dialect=engine.dialect)
+            LOG.info(_("Adding column %(column)s to %(table)s"),
+                     {'column': column.name, 'table': table.name})
+            engine.execute('ALTER TABLE %s ADD COLUMN %s' % (table.name,
+                                                             ddl))
+
+
+def _add_missing_indexes(engine, inspector):
+    for table in _sfc_tables(inspector):
+        existing = set(index['name']
+                       for index in inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            LOG.info(_("Creating index %(index)s on %(table)s"),
+                     {'index': index.name, 'table': table.name})
+            index.create(bind=engine)
+
+
+def _backfill_rule_matches(engine):
+    """Fill the typed match columns of rules written before they existed."""
+    for model in (sfc_db.SFCChainBypassRule, sfc_db.SFCChainSelectionRule):
+        table = model.__table__
+        unset = sa.and_(*[table.c[field] == None
+                          for field in rule_match.MATCH_FIELDS])
+        with engine.begin() as connection:
+            rows = connection.execute(table.select().where(unset)).fetchall()
+            for row in rows:
+                try:
+                    match = rule_match.typed_match(dict(row.items()))
+                except q_exc.InvalidInput as e:
+                    LOG.warning(_("Rule %(id)s keeps untyped matches: "
+                                  "%(error)s"), {'id': row['id'], 'error': e})
+                    continue
+                if [value for value in match.values() if value is not None]:
+                    connection.execute(table.update().where(
+                        table.c.id == row['id']).values(**match))
+
+
+def schema_version(engine):
+    """Return the schema version the SFC tables were upgraded to."""
+    table = sfc_schema_version.__table__
+    row = engine.execute(table.select().where(
+        table.c.id == SCHEMA_ID)).first()
+    return row['version'] if row else 0
+
+
+def check_schema():
+    """Warn when the SFC tables are older than the models."""
+    version = schema_version(db_api.get_engine())
+    if version < SCHEMA_VERSION:
+        LOG.warning(_("SFC tables are at schema version %(version)s, run "
+                      "sfc-db-upgrade to bring them to %(latest)s"),
+                    {'version': version, 'latest': SCHEMA_VERSION})
+
+
+def upgrade():
+    """Bring existing SFC tables up to date with the models."""
+    db_api.register_models()
+    engine = db_api.get_engine()
+    version = schema_version(engine)
+    inspector = reflection.Inspector.from_engine(engine)
+    _add_missing_columns(engine, inspector)
+    _add_missing_indexes(engine, inspector)
+    if version < TYPED_MATCH_VERSION:
+        # Rules written since carry their typed matches
+        _backfill_rule_matches(engine)
+    table = sfc_schema_version.__table__
+    with engine.begin() as connection:
+        connection.execute(table.delete().where(table.c.id == SCHEMA_ID))
+        connection.execute(table.insert().values(id=SCHEMA_ID,
+                                                 version=SCHEMA_VERSION))
+    LOG.info(_("SFC tables upgraded to schema version %s"), SCHEMA_VERSION)
+
+
+def main():
+    cfg.CONF(project='crd')
+    logging_config.setup_logging(cfg.CONF)
+    upgrade()
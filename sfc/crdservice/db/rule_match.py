@@ -0,0 +1,187 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Typed match columns of selection and bypass rules.
+
+The rule APIs keep addresses, ports, protocol and ethertype as strings.
+Their numeric values are stored next to them when a rule is written, so
+range and overlap queries run in the database and consumers get numbers
+without parsing. A NULL range or value matches anything ('any').
+"""
+
+import netaddr
+import sqlalchemy as sa
+
+from nscs.crdservice.common import exceptions as q_exc
+from nscs.crdservice.openstack.common.gettextutils import _
+
+RANGES = ('sip', 'dip', 'sp', 'dp')
+VALUES = ('protocol_num', 'eth_value_num')
+MATCH_FIELDS = tuple('%s_%s_num' % (prefix, bound)
+                     for prefix in RANGES
+                     for bound in ('start', 'end')) + VALUES
+
+PROTOCOLS = {'icmp': 1, 'tcp': 6, 'udp': 17, 'sctp': 132}
+
+
+class HasTypedMatch(object):
+    """Typed match mixin for rule tables and their deltas."""
+    # IPv6 addresses need 128 bits, more than any integer column type.
+    sip_start_num = sa.Column(sa.Numeric(39, 0))
+    sip_end_num = sa.Column(sa.Numeric(39, 0))
+    dip_start_num = sa.Column(sa.Numeric(39, 0))
+    dip_end_num = sa.Column(sa.Numeric(39, 0))
+    sp_start_num = sa.Column(sa.Integer)
+    sp_end_num = sa.Column(sa.Integer)
+    dp_start_num = sa.Column(sa.Integer)
+    dp_end_num = sa.Column(sa.Integer)
+    protocol_num = sa.Column(sa.Integer)
+    eth_value_num = sa.Column(sa.Integer)
+
+
+def _invalid(field, value):
+    msg = _("Invalid %(field)s '%(value)s'") % {'field': field,
+                                                'value': value}
+    return q_exc.InvalidInput(error_message=msg)
+
+
+def _address_range(rule, prefix):
+    kind = (rule.get('%s_type' % prefix) or '').lower()
+    start = rule.get('%s_start' % prefix)
+    end = rule.get('%s_end' % prefix)
+    try:
+        if kind == 'single':
+            first = int(netaddr.IPAddress(start))
+            return first, first
+        if kind == 'range':
+            return (int(netaddr.IPAddress(start)),
+                    int(netaddr.IPAddress(end)))
+        if kind == 'subnet':
+            # The network address and its netmask or prefix length.
+            network = netaddr.IPNetwork('%s/%s' % (start, end))
+            return network.first, network.last
+    except (netaddr.AddrFormatError, TypeError, ValueError):
+        raise _invalid('%s_start' % prefix, start)
+    return None, None
+
+
+def _port_range(rule, prefix):
+    kind = (rule.get('%s_type' % prefix) or '').lower()
+    start = rule.get('%s_start' % prefix) or 0
+    end = rule.get('%s_end' % prefix) or 0
+    try:
+        if kind == 'single':
+            return int(start), int(start)
+        if kind == 'range':
+            return int(start), int(end)
+    except (TypeError, ValueError):
+        raise _invalid('%s_start' % prefix, start)
+    return None, None
+
+
+def _protocol(rule):
+    protocol = (rule.get('ip_protocol') or '').strip().lower()
+    if not protocol or protocol == 'any':
+        return None
+    if protocol in PROTOCOLS:
+        return PROTOCOLS[protocol]
+    try:
+        return int(protocol)
+    except ValueError:
+        raise _invalid('ip_protocol', protocol)
+
+
+def _eth_value(rule):
+    if (rule.get('eth_type') or '').lower() != 'value':
+        return None
+    value = (rule.get('eth_value') or '').strip()
+    if value[:2].lower() == '0x':
+        value = value[2:]
+    try:
+        # Ethertypes are written in hex, as 0x0800, 0800 or 86DD.
+        return int(value, 16)
+    except ValueError:
+        raise _invalid('eth_value', rule.get('eth_value'))
+
+
+def typed_match(rule):
+    """
+    Return the typed match fields of a rule given with its string fields.
+    Raises InvalidInput when a string cannot be parsed.
+    """
+    match = {}
+    for prefix in RANGES:
+        parse = _address_range if prefix in ('sip', 'dip') else _port_range
+        (match['%s_start_num' % prefix],
+         match['%s_end_num' % prefix]) = parse(rule, prefix)
+    match['protocol_num'] = _protocol(rule)
+    match['eth_value_num'] = _eth_value(rule)
+    return match
+
+
+def typed_flow(flow):
+    """
+    Return the typed values of a flow given with strings: sip, dip, sp,
+    dp, ip_protocol, eth_value, src_mac and dest_mac. A value left out is
+    None and matches any rule.
+    """
+    typed = {}
+    for prefix in RANGES:
+        if flow.get(prefix) in (None, ''):
+            typed[prefix] = None
+            continue
+        parse = _address_range if prefix in ('sip', 'dip') else _port_range
+        typed[prefix] = parse({'%s_type' % prefix: 'single',
+                               '%s_start' % prefix: flow[prefix]},
+                              prefix)[0]
+    typed['protocol_num'] = _protocol(flow)
+    typed['eth_value_num'] = None
+    if flow.get('eth_value'):
+        typed['eth_value_num'] = _eth_value({'eth_type': 'value',
+                                             'eth_value': flow['eth_value']})
+    for field in ('src_mac', 'dest_mac'):
+        typed[field] = (flow.get(field) or '').lower() or None
+    return typed
+
+
+def match_dict(row):
+    """Return the typed match fields of a row as ints (None for 'any')."""
+    return dict((field, None if row[field] is None else int(row[field]))
+                for field in MATCH_FIELDS)
+
+
+def overlapping(query, model, match):
+    """
+    Restrict query to the rules of model whose match overlaps match, a
+    dict of typed match fields. Rules and match fields left 'any' overlap
+    everything.
+    """
+    for prefix in RANGES:
+        first = match.get('%s_start_num' % prefix)
+        last = match.get('%s_end_num' % prefix)
+        if first is None:
+            continue
+        start = getattr(model, '%s_start_num' % prefix)
+        end = getattr(model, '%s_end_num' % prefix)
+        query = query.filter(sa.or_(start == None,
+                                    sa.and_(start <= last, end >= first)))
+    for field in VALUES:
+        value = match.get(field)
+        if value is None:
+            continue
+        column = getattr(model, field)
+        query = query.filter(sa.or_(column == None, column == value))
+    return query
@@ -13,19 +13,42 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import copy
+import datetime
+import threading
+
+from oslo.config import cfg
 import sqlalchemy as sa
 from sqlalchemy import orm
 from sqlalchemy.orm import exc, relationship
 
 # CRD Service based imports
+from nscs.crdservice.db import api as db_api
 from nscs.crdservice.db import model_base, db_base_plugin_v2
 from nscs.crdservice.common import exceptions as q_exc
+from nscs.crdservice.openstack.common import jsonutils
 from nscs.crdservice.openstack.common import log as logging
 from nscs.crdservice.openstack.common import uuidutils
+from nscs.crdservice.openstack.common.gettextutils import _
 from sfc.crdservice.common import exceptions as sfc_exc
+from sfc.crdservice.db import delta as sfc_delta_db
+from sfc.crdservice.db import rule_match
 
 LOG = logging.getLogger(__name__)
 
+sfc_db_opts = [
+    cfg.IntOpt('row_cache_size', default=1024,
+               help=_("Number of appliance, chain, chainset and chain "
+                      "appliance map rows kept in the read-through cache of "
+                      "the database plugin, 0 disables the cache")),
+    cfg.StrOpt('default_vlan_quota', default='100-199',
+               help=_("VLAN range, as start-end, given to the appliance "
+                      "instances of a tenant without a VLAN quota")),
+]
+
+cfg.CONF.register_opts(sfc_db_opts, "sfc_db")
+
 
 ############    
 # Service Function Chaining Tables
@@ -93,7 +116,8 @@ class SFCAppliance(model_base.BASEV2, model_base.HasId, model_base.HasTenant):
                                             backref='sfc_appliances')
     appliance_vendors = orm.relationship(SFCVendor,
                                          backref='sfc_appliances')
-    config_handle_id = sa.Column(sa.String(36), sa.ForeignKey('crd_config_handles.id'), nullable=False)
+    config_handle_id = sa.Column(sa.String(36), sa.ForeignKey('crd_config_handles.id'), nullable=False,
+                                 index=True)
 
 
 class SFCChain(model_base.BASEV2, model_base.HasId, model_base.HasTenant):
@@ -105,12 +129,12 @@ class SFCChain(model_base.BASEV2, model_base.HasId, model_base.HasTenant):
 
 
 class SFCChainBypassRule(model_base.BASEV2, model_base.HasId,
-                         model_base.HasTenant):
+                         model_base.HasTenant, rule_match.HasTypedMatch):
     """Represents a v2 crd FSL service."""
     __tablename__ = 'sfc_chain_bypass_rules'
     name = sa.Column(sa.String(50), nullable=False)
     chain_id = sa.Column(sa.String(36), sa.ForeignKey('sfc_chains.id'),
-                         nullable=False)
+                         nullable=False, index=True)
     src_mac_type = sa.Column(sa.String(50))
     dest_mac_type = sa.Column(sa.String(50))
     src_mac = sa.Column(sa.String(50))
@@ -133,6 +157,11 @@ class SFCChainBypassRule(model_base.BASEV2, model_base.HasId,
     nwservice_count = sa.Column(sa.String(50))
     nwservice_names = sa.Column(sa.Text())
 
+sa.Index('ix_sfc_chain_bypass_rules_sip_num',
+         SFCChainBypassRule.sip_start_num, SFCChainBypassRule.sip_end_num)
+sa.Index('ix_sfc_chain_bypass_rules_dip_num',
+         SFCChainBypassRule.dip_start_num, SFCChainBypassRule.dip_end_num)
+
 
 class SFCChainSet(model_base.BASEV2, model_base.HasId, model_base.HasTenant):
     """Represents a v2 crd FSL service."""
@@ -143,7 +172,7 @@ class SFCChainSet(model_base.BASEV2, model_base.HasId, model_base.HasTenant):
 
 
 class SFCChainSelectionRule(model_base.BASEV2, model_base.HasId,
-                            model_base.HasTenant):
+                            model_base.HasTenant, rule_match.HasTypedMatch):
     """Represents a v2 crd FSL service."""
     __tablename__ = 'sfc_chain_selection_rules'
     name = sa.Column(sa.String(50), nullable=False)
@@ -151,8 +180,8 @@ class SFCChainSelectionRule(model_base.BASEV2, model_base.HasId,
     #                        nullable=False)
     #chain_id = sa.Column(sa.String(36), sa.ForeignKey('sfc_chains.id'),
     #                     nullable=False)
-    chainset_id = sa.Column(sa.String(36))
-    chain_id = sa.Column(sa.String(36))
+    chainset_id = sa.Column(sa.String(36), index=True)
+    chain_id = sa.Column(sa.String(36), index=True)
     src_mac_type = sa.Column(sa.String(50))
     dest_mac_type = sa.Column(sa.String(50))
     src_mac = sa.Column(sa.String(50))
@@ -173,6 +202,13 @@ class SFCChainSelectionRule(model_base.BASEV2, model_base.HasId,
     dp_end = sa.Column(sa.String(50))
     ip_protocol = sa.Column(sa.String(50))
 
+sa.Index('ix_sfc_chain_selection_rules_sip_num',
+         SFCChainSelectionRule.sip_start_num,
+         SFCChainSelectionRule.sip_end_num)
+sa.Index('ix_sfc_chain_selection_rules_dip_num',
+         SFCChainSelectionRule.dip_start_num,
+         SFCChainSelectionRule.dip_end_num)
+
 
 class SFCChainsetNetworkMap(model_base.BASEV2, model_base.HasId,
                             model_base.HasTenant):
@@ -183,7 +219,7 @@ class SFCChainsetNetworkMap(model_base.BASEV2, model_base.HasId,
     inbound_network_id = sa.Column(sa.String(36), nullable=False)
     outbound_network_id = sa.Column(sa.String(36), nullable=False)
     chainset_id = sa.Column(sa.String(36), sa.ForeignKey('sfc_chainsets.id'),
-                            nullable=False)
+                            nullable=False, index=True)
 
 
 class SFCChainAppliance(model_base.BASEV2, model_base.HasId,
@@ -195,10 +231,17 @@ class SFCChainAppliance(model_base.BASEV2, model_base.HasId,
                                                       ondelete='CASCADE'),
                          nullable=False)
     appliance_id = sa.Column(sa.String(36), sa.ForeignKey('sfc_appliances.id'),
-                             nullable=False)
+                             nullable=False, index=True)
     sequence_number = sa.Column(sa.Integer)
     chain_appliance = orm.relationship(SFCAppliance,
                                        backref='sfc_chain_appliances')
+    chain = orm.relationship(SFCChain,
+                             backref=orm.backref('appliance_maps',
+                                                 order_by=sequence_number,
+                                                 passive_deletes=True))
+
+sa.Index('ix_sfc_chain_appliances_chain_id_appliance_id',
+         SFCChainAppliance.chain_id, SFCChainAppliance.appliance_id)
 
 
 class SFCInternalSubnet(model_base.BASEV2, model_base.HasId):
@@ -228,13 +271,33 @@ class SFCApplianceInstance(model_base.BASEV2, model_base.HasId,
     __tablename__ = "sfc_appliance_instances"
     appliance_map_id = sa.Column(sa.String(36), sa.ForeignKey('sfc_chain_appliances.id',
                                                                 ondelete='CASCADE'),
-                                   nullable=False)
-    instance_uuid = sa.Column(sa.String(36))
+                                   nullable=False, index=True)
+    instance_uuid = sa.Column(sa.String(36), index=True)
     network_id = sa.Column(sa.String(36))
     vlan_in = sa.Column(sa.Integer)
     vlan_out = sa.Column(sa.Integer)
     chain_appliance = orm.relationship(SFCChainAppliance,
                                        backref='sfc_appliance_instances')
+
+sa.Index('ix_sfc_appliance_instances_network_id_tenant_id',
+         SFCApplianceInstance.network_id, SFCApplianceInstance.tenant_id)
+
+
+class SFCVLANAllocation(model_base.BASEV2):
+    """
+    One VLAN of a network, free when instance_id is NULL. The rows of a
+    network are created for the VLAN quota of its tenant on the first
+    allocation; deleting an appliance instance frees its VLANs.
+    """
+    __tablename__ = "sfc_vlan_allocations"
+    network_id = sa.Column(sa.String(36), primary_key=True,
+                           autoincrement=False)
+    vlan_id = sa.Column(sa.Integer, primary_key=True, autoincrement=False)
+    tenant_id = sa.Column(sa.String(255))
+    instance_id = sa.Column(sa.String(36),
+                            sa.ForeignKey('sfc_appliance_instances.id',
+                                          ondelete='SET NULL'),
+                            index=True)
     
     
 class SFCChainsetZone(model_base.BASEV2, model_base.HasId,
@@ -242,10 +305,164 @@ class SFCChainsetZone(model_base.BASEV2, model_base.HasId,
     """Represents a v2 crd FSL service."""
     __tablename__ = 'sfc_chainset_zones'
     chainset_id = sa.Column(sa.String(36), sa.ForeignKey('sfc_chainsets.id', ondelete="CASCADE"),
-                            nullable=False)
+                            nullable=False, index=True)
     zone = sa.Column(sa.String(50))
     direction = sa.Column(sa.String(50))
 
+
+# States of a launch job; a job stops in one of JOB_FINISHED
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_CANCELLING = 'cancelling'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+JOB_FINISHED = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class SFCLaunchJob(model_base.BASEV2, model_base.HasId, model_base.HasTenant):
+    """
+    A chain launch or scale-out run in the background. progress holds,
+    as JSON, the state and instance of each appliance map of the chain;
+    owner, as host:pid, the API worker that queued and runs the job.
+    """
+    __tablename__ = 'sfc_launch_jobs'
+    operation = sa.Column(sa.String(16), nullable=False)
+    status = sa.Column(sa.String(16), nullable=False, index=True)
+    chainset_id = sa.Column(sa.String(36))
+    chainmap_id = sa.Column(sa.String(36))
+    rule_id = sa.Column(sa.String(36))
+    instance_id = sa.Column(sa.String(36))
+    progress = sa.Column(sa.Text)
+    error = sa.Column(sa.Text)
+    created_at = sa.Column(sa.DateTime, default=datetime.datetime.now,
+                           nullable=False)
+    started_at = sa.Column(sa.DateTime)
+    finished_at = sa.Column(sa.DateTime)
+    owner = sa.Column(sa.String(255))
+
+
+# Rows of the row cache and the delta tables written when they change:
+# (kind, delta table, object id column, or None when a change may alter
+#  every row of kind)
+ROW_CACHE_DELTAS = (
+    ('appliance', sfc_delta_db.sfc_appliances_delta, 'appliance_id'),
+    ('appliance', sfc_delta_db.sfc_categories_delta, None),
+    ('appliance', sfc_delta_db.sfc_vendors_delta, None),
+    ('chain', sfc_delta_db.sfc_chains_delta, 'chain_id'),
+    ('chainset', sfc_delta_db.sfc_chainsets_delta, 'chainset_id'),
+    ('appliance_map', sfc_delta_db.sfc_chain_appliances_delta,
+     'chain_appliance_map_id'),
+    ('appliance_map', sfc_delta_db.sfc_appliances_delta, None),
+    ('appliance_map', sfc_delta_db.sfc_chains_delta, None),
+)
+
+
+class RowCache(object):
+    """
+    LRU cache of the dicts of single appliance, chain, chainset and chain
+    appliance map rows, keyed by (kind, id), shared by every SFCPluginDb
+    of the process. The db methods writing these rows invalidate the
+    entries they change; changes made by other API workers are found in
+    the delta tables, since version, the committed runtime version the
+    cache was last brought up to.
+
+    generation counts invalidations: a row read from the database is only
+    cached if no invalidation happened since the read started, so a read
+    racing a write never caches the old row.
+    """
+    _instance = None
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.version = None
+        self.generation = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0,
+                      'invalidations': 0}
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls(cfg.CONF.sfc_db.row_cache_size)
+        return cls._instance
+
+    def get(self, kind, id):
+        """Return a copy of the cached dict of a row, or None."""
+        if not self.max_entries:
+            return None
+        with self.lock:
+            entry = self.entries.pop((kind, id), None)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.entries[(kind, id)] = entry
+            self.stats['hits'] += 1
+            return copy.deepcopy(entry)
+
+    def put(self, kind, id, value, generation):
+        """Cache value unless an invalidation happened since generation."""
+        if not self.max_entries:
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[(kind, id)] = copy.deepcopy(value)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+                if not self.stats['evictions'] % self.max_entries:
+                    LOG.debug(_("Row cache turned over, stats %s"),
+                              self._get_stats())
+
+    def invalidate(self, kind, id=None):
+        """Drop the entry of a row, or of every row of kind if id is None."""
+        with self.lock:
+            self.generation += 1
+            self.stats['invalidations'] += 1
+            if id is not None:
+                self.entries.pop((kind, id), None)
+                return
+            for key in [key for key in self.entries if key[0] == kind]:
+                del self.entries[key]
+
+    def advance(self, since, version, changed):
+        """
+        Move the cache from runtime version since to version, dropping
+        the rows changed in between, given as (kind, ids) pairs, ids None
+        for every row of kind; changed None drops every row. Ignored when
+        another caller has moved the cache already.
+        """
+        with self.lock:
+            if self.version != since:
+                return
+            self.generation += 1
+            self.version = version
+            if changed is None:
+                self.entries.clear()
+                return
+            for kind, ids in changed:
+                if ids is None:
+                    keys = [key for key in self.entries if key[0] == kind]
+                else:
+                    keys = [(kind, id) for id in ids]
+                for key in keys:
+                    if self.entries.pop(key, None) is not None:
+                        self.stats['invalidations'] += 1
+
+    def _get_stats(self):
+        stats = dict(self.stats, entries=len(self.entries))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = float(stats['hits']) / lookups if lookups else 0.0
+        return stats
+
+    def get_stats(self):
+        """Return the counters, the number of entries and the hit rate."""
+        with self.lock:
+            return self._get_stats()
+
+
 class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
     """
     A class that wraps the implementation of the Crd
@@ -258,10 +475,148 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
     are a logical way.
     """
 
+    # Row cache of this instance, the one of the process when None
+    row_cache = None
+
     @staticmethod
     def __get_id(obj):
         return obj.get('id') or uuidutils.generate_uuid()
 
+    def _get_row_cache(self):
+        return self.row_cache or RowCache.get_instance()
+
+    def _sync_row_cache(self, context, cache):
+        """
+        Bring the row cache up to the committed runtime version, dropping
+        the rows other API workers changed since the version it was at.
+        """
+        deltadb = sfc_delta_db.SfcDeltaDb()
+        version = deltadb.get_runtime_version(context)
+        since = cache.version
+        if since == version:
+            return
+        changed = None
+        # Deletes below the compaction horizon are gone from the deltas
+        if (since is not None and since < version and
+                deltadb.get_compaction_horizon(context) <= since):
+            changed = []
+            for kind, model, column in ROW_CACHE_DELTAS:
+                ids = deltadb.get_changed_object_ids(
+                    context, model, column or 'id', since)
+                if ids:
+                    changed.append((kind, ids if column else None))
+        cache.advance(since, version, changed)
+
+    def _cached_get(self, context, kind, id, fields, read):
+        """
+        Return the dict of a row through the row cache, read(context, id)
+        reading it from the database on a miss. Rows read inside a
+        transaction are not cached, as the transaction may not commit.
+        """
+        cache = self._get_row_cache()
+        if cache.max_entries:
+            self._sync_row_cache(context, cache)
+        res = cache.get(kind, id)
+        if res is not None and (context.is_admin or
+                                res['tenant_id'] == context.tenant_id):
+            return self._fields(res, fields)
+        generation = cache.generation
+        res = read(context, id)
+        if context.session.transaction is None:
+            cache.put(kind, id, res, generation)
+        return self._fields(res, fields)
+
+    def _invalidate(self, context, kind, id=None):
+        """
+        Drop a row from the row cache. Inside a transaction it is dropped
+        again when the transaction commits, since until then concurrent
+        readers still read the old row.
+        """
+        cache = self._get_row_cache()
+        cache.invalidate(kind, id)
+        session = context.session
+        if session.transaction is None:
+            return
+        pending = getattr(session, 'sfc_row_invalidations', None)
+        if pending is None:
+            pending = session.sfc_row_invalidations = []
+
+            def _flush(session):
+                while pending:
+                    cache.invalidate(*pending.pop())
+            sa.event.listen(session, 'after_commit', _flush)
+        pending.append((kind, id))
+
+    def get_row_cache_stats(self):
+        return self._get_row_cache().get_stats()
+
+    def get_for_update(self, context, kind, id):
+        """
+        Return the dict of a row of one of the row cache kinds read from
+        the database, not the cache, and locked until the caller's
+        transaction ends. An update reads the row it compares its result
+        with this way, so the fields it reports changed are the ones it
+        changed.
+        """
+        model, get, make = {
+            'appliance': (SFCAppliance, self._get_appliance,
+                          self._make_appliance_dict),
+            'chain': (SFCChain, self._get_chain, self._make_chain_dict),
+            'chainset': (SFCChainSet, self._get_chainset,
+                         self._make_chainset_dict),
+            'appliance_map': (SFCChainAppliance, self._get_appliance_map,
+                              self._make_appliance_map_dict)}[kind]
+        with context.session.begin(subtransactions=True):
+            query = self._model_query(context, model).filter(model.id == id)
+            row = query.with_lockmode('update').populate_existing().first()
+            if row is None:
+                # Raises the not found error of the kind
+                row = get(context, id)
+            return make(row)
+
+    def _get_collection(self, context, model, dict_func, filters=None,
+                        fields=None, sorts=None, limit=None,
+                        marker_obj=None, page_reverse=False):
+        """
+        Return a page of a collection, keyset paginated after marker_obj
+        in the order of sorts. When every field asked for is a column of
+        model, only those columns are read and the dicts are built from
+        them, without loading the rows.
+        """
+        query = self._get_collection_query(context, model, filters=filters,
+                                           sorts=sorts, limit=limit,
+                                           marker_obj=marker_obj,
+                                           page_reverse=page_reverse)
+        columns = self._projected_columns(model, fields)
+        if columns is None:
+            items = [dict_func(c, fields) for c in query]
+        else:
+            query = query.with_entities(*columns)
+            items = [self._make_projected_dict(columns, row) for row in query]
+        if limit and page_reverse:
+            items.reverse()
+        return items
+
+    @staticmethod
+    def _projected_columns(model, fields):
+        """Return the columns of model named by fields, or None."""
+        if not fields:
+            return None
+        table_columns = model.__table__.columns
+        if [field for field in fields if field not in table_columns]:
+            return None
+        return [getattr(model, field) for field in set(fields)]
+
+    @staticmethod
+    def _make_projected_dict(columns, row):
+        res = {}
+        for column, value in zip(columns, row):
+            # Numeric columns hold the typed rule matches, ints in the dicts.
+            if value is not None and isinstance(column.type, sa.Numeric):
+                value = int(value)
+            res[column.key] = value
+        return res
+
     def _make_networkfunction_dict(self, networkfunction, fields=None):
         res = {'id': networkfunction['id'],
                'name': networkfunction['name'],
@@ -274,10 +629,17 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         networkfunction = self._get_networkfunction(context, id)
         return self._make_networkfunction_dict(networkfunction, fields)
 
-    def get_networkfunctions(self, context, filters=None, fields=None):
+    def get_networkfunctions(self, context, filters=None, fields=None,
+                             sorts=None, limit=None, marker=None,
+                             page_reverse=False):
+        marker_obj = self._get_marker_obj(
+            context, 'networkfunction', limit, marker)
         return self._get_collection(context, SFCNetworkFunction,
                                     self._make_networkfunction_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     def create_networkfunction(self, context, networkfunction):
         n = networkfunction['networkfunction']
@@ -337,10 +699,16 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         category = self._get_category(context, id)
         return self._make_category_dict(category, fields)
 
-    def get_categories(self, context, filters=None, fields=None):
+    def get_categories(self, context, filters=None, fields=None,
+                       sorts=None, limit=None, marker=None,
+                       page_reverse=False):
+        marker_obj = self._get_marker_obj(context, 'category', limit, marker)
         return self._get_collection(context, SFCCategory,
                                     self._make_category_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     def create_category(self, context, category):
         n = category['category']
@@ -382,6 +750,8 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
                 self.delete_category_networkfunction(context, category.id,
                                                      nf_id)
             context.session.delete(category)
+        # Appliance dicts carry the category name.
+        self._invalidate(context, 'appliance')
 
     def update_category(self, context, id, category):
         n = category['category']
@@ -391,6 +761,7 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
             if 'shared' in n:
                 self._validate_shared_update(context, id, category, n)
             category.update(n)
+        self._invalidate(context, 'appliance')
         return self._make_category_dict(category)
 
     def _make_category_networkfunction_dict(self, category_networkfunction,
@@ -464,10 +835,16 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         vendor = self._get_vendor(context, id)
         return self._make_vendor_dict(vendor, fields)
 
-    def get_vendors(self, context, filters=None, fields=None):
+    def get_vendors(self, context, filters=None, fields=None,
+                    sorts=None, limit=None, marker=None,
+                    page_reverse=False):
+        marker_obj = self._get_marker_obj(context, 'vendor', limit, marker)
         return self._get_collection(context, SFCVendor,
                                     self._make_vendor_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     def create_vendor(self, context, vendor):
         n = vendor['vendor']
@@ -495,6 +872,8 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         vendor = self._get_vendor(context, id)
         with context.session.begin(subtransactions=True):
             context.session.delete(vendor)
+        # Appliance dicts carry the vendor name.
+        self._invalidate(context, 'appliance')
 
     def update_vendor(self, context, id, vendor):
         n = vendor['vendor']
@@ -503,6 +882,7 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
             if 'shared' in n:
                 self._validate_shared_update(context, id, vendor, n)
             vendor.update(n)
+        self._invalidate(context, 'appliance')
         return self._make_vendor_dict(vendor)
 
     def _make_appliance_dict(self, appliance, fields=None):
@@ -535,13 +915,21 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         return self._fields(res, fields)
 
     def get_appliance(self, context, id, fields=None):
-        appliance = self._get_appliance(context, id)
-        return self._make_appliance_dict(appliance, fields)
-
-    def get_appliances(self, context, filters=None, fields=None):
+        return self._cached_get(
+            context, 'appliance', id, fields,
+            lambda context, id: self._make_appliance_dict(
+                self._get_appliance(context, id)))
+
+    def get_appliances(self, context, filters=None, fields=None,
+                       sorts=None, limit=None, marker=None,
+                       page_reverse=False):
+        marker_obj = self._get_marker_obj(context, 'appliance', limit, marker)
         return self._get_collection(context, SFCAppliance,
                                     self._make_appliance_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     def create_appliance(self, context, appliance):
         n = appliance['appliance']
@@ -580,6 +968,9 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         appliance = self._get_appliance(context, id)
         with context.session.begin(subtransactions=True):
             context.session.delete(appliance)
+        self._invalidate(context, 'appliance', id)
+        # Chain appliance map dicts carry the appliance name.
+        self._invalidate(context, 'appliance_map')
 
     def update_appliance(self, context, id, appliance):
         n = appliance['appliance']
@@ -589,6 +980,8 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
             if 'shared' in n:
                 self._validate_shared_update(context, id, appliance, n)
             appliance.update(n)
+        self._invalidate(context, 'appliance', id)
+        self._invalidate(context, 'appliance_map')
         return self._make_appliance_dict(appliance)
 
     def _make_chain_dict(self, chain, fields=None):
@@ -600,14 +993,22 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
 
         return self._fields(res, fields)
 
-    def get_chains(self, context, filters=None, fields=None):
+    def get_chains(self, context, filters=None, fields=None,
+                   sorts=None, limit=None, marker=None,
+                   page_reverse=False):
+        marker_obj = self._get_marker_obj(context, 'chain', limit, marker)
         return self._get_collection(context, SFCChain,
                                     self._make_chain_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     def get_chain(self, context, id, fields=None):
-        chain = self._get_chain(context, id)
-        return self._make_chain_dict(chain, fields)
+        return self._cached_get(
+            context, 'chain', id, fields,
+            lambda context, id: self._make_chain_dict(
+                self._get_chain(context, id)))
 
     def create_chain(self, context, chain):
         n = chain['chain']
@@ -638,14 +1039,45 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         chain = self._get_chain(context, id)
         with context.session.begin(subtransactions=True):
             context.session.delete(chain)
+        self._invalidate(context, 'chain', id)
+        # The maps of the chain are deleted with it.
+        self._invalidate(context, 'appliance_map')
 
     def update_chain(self, context, id, chain):
         n = chain['chain']
         with context.session.begin(subtransactions=True):
             chain = self._get_chain(context, id)
             chain.update(n)
+        self._invalidate(context, 'chain', id)
         return self._make_chain_dict(chain)
 
+    def get_chain_topology(self, context, chain_id):
+        """
+        Return the chain with its appliance maps in sequence order, each
+        with its appliance and its instances, read in a single query.
+        """
+        query = self._model_query(context, SFCChain).options(
+            orm.joinedload_all('appliance_maps.chain_appliance.'
+                               'appliance_categories'),
+            orm.joinedload_all('appliance_maps.chain_appliance.'
+                               'appliance_vendors'),
+            orm.joinedload_all('appliance_maps.sfc_appliance_instances'))
+        try:
+            chain = query.filter(SFCChain.id == chain_id).one()
+        except exc.NoResultFound:
+            raise q_exc.ChainNotFound(chain_id=chain_id)
+        res = self._make_chain_dict(chain)
+        res['appliance_maps'] = []
+        for appliance_map in chain.appliance_maps:
+            entry = self._make_appliance_map_dict(appliance_map)
+            entry['appliance'] = self._make_appliance_dict(
+                appliance_map.chain_appliance)
+            entry['instances'] = [
+                self._make_chain_appliance_map_instance_dict(instance)
+                for instance in appliance_map.sfc_appliance_instances]
+            res['appliance_maps'].append(entry)
+        return res
+
     ### Chain related
     def _make_appliance_map_dict(self, appliance_map, fields=None):
         img_name = ''
@@ -664,13 +1096,22 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         return self._fields(res, fields)
 
     def get_chain_appliance_map(self, context, id, chain_id=None, fields=None):
-        appliance_map = self._get_appliance_map(context, id)
-        return self._make_appliance_map_dict(appliance_map, fields)
-
-    def get_chain_appliance_maps(self, context, filters=None, fields=None):
+        return self._cached_get(
+            context, 'appliance_map', id, fields,
+            lambda context, id: self._make_appliance_map_dict(
+                self._get_appliance_map(context, id)))
+
+    def get_chain_appliance_maps(self, context, filters=None, fields=None,
+                                 sorts=None, limit=None, marker=None,
+                                 page_reverse=False):
+        marker_obj = self._get_marker_obj(
+            context, 'appliance_map', limit, marker)
         return self._get_collection(context, SFCChainAppliance,
                                     self._make_appliance_map_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     def create_chain_appliance_map(self, context, appliance_map, chain_id):
         n = appliance_map['appliance']
@@ -702,6 +1143,7 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         filters['chain_map_id'] = [id]
         with context.session.begin(subtransactions=True):
             context.session.delete(appliance_map)
+        self._invalidate(context, 'appliance_map', id)
 
     def update_chain_appliance_map(self, context, id, chain_id,
                                    appliance_map):
@@ -709,6 +1151,7 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         with context.session.begin(subtransactions=True):
             appliance_map = self._get_appliance_map(context, id)
             appliance_map.update(n)
+        self._invalidate(context, 'appliance_map', id)
         return self._make_appliance_map_dict(appliance_map)
 
     def _make_chain_bypass_rule_dict(self, chain_bypass_rule, fields=None):
@@ -737,12 +1180,20 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
                'ip_protocol': chain_bypass_rule['ip_protocol'],
                'nwservice_count': chain_bypass_rule['nwservice_count'],
                'nwservice_names': chain_bypass_rule['nwservice_names']}
+        res.update(rule_match.match_dict(chain_bypass_rule))
         return self._fields(res, fields)
 
-    def get_chain_bypass_rules(self, context, filters=None, fields=None):
+    def get_chain_bypass_rules(self, context, filters=None, fields=None,
+                               sorts=None, limit=None, marker=None,
+                               page_reverse=False):
+        marker_obj = self._get_marker_obj(
+            context, 'chain_bypass_rule', limit, marker)
         return self._get_collection(context, SFCChainBypassRule,
                                     self._make_chain_bypass_rule_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     def get_chain_bypass_rule(self, context, id, chain_id, fields=None):
         chain_bypass_rule = self._get_chain_bypass_rule(context, id)
@@ -751,6 +1202,7 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
     def create_chain_bypass_rule(self, context, chain_bypass_rule, chain_id):
         cbr = chain_bypass_rule['bypass_rule']
         tenant_id = self._get_tenant_id_for_create(context, cbr)
+        match = rule_match.typed_match(cbr)
 
         with context.session.begin(subtransactions=True):
             rule = SFCChainBypassRule(tenant_id=tenant_id,
@@ -777,7 +1229,8 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
                                       dp_end=cbr['dp_end'],
                                       ip_protocol=cbr['ip_protocol'],
                                       nwservice_count=cbr['nwservice_count'],
-                                      nwservice_names=cbr['nwservice_names'])
+                                      nwservice_names=cbr['nwservice_names'],
+                                      **match)
             context.session.add(rule)
         return self._make_chain_bypass_rule_dict(rule)
 
@@ -802,8 +1255,23 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         with context.session.begin(subtransactions=True):
             chain_bypass_rule = self._get_chain_bypass_rule(context, id)
             chain_bypass_rule.update(n)
+            chain_bypass_rule.update(
+                rule_match.typed_match(chain_bypass_rule))
         return self._make_chain_bypass_rule_dict(chain_bypass_rule)
 
+    def get_overlapping_chain_bypass_rules(self, context, chain_id, rule,
+                                           fields=None):
+        """
+        Return the bypass rules of a chain whose match overlaps rule,
+        given with its string match fields.
+        """
+        query = self._model_query(context, SFCChainBypassRule).filter(
+            SFCChainBypassRule.chain_id == chain_id)
+        query = rule_match.overlapping(query, SFCChainBypassRule,
+                                       rule_match.typed_match(rule))
+        return [self._make_chain_bypass_rule_dict(bypass_rule, fields)
+                for bypass_rule in query]
+
     def _make_chainset_dict(self, chainset, fields=None):
         res = {'id': chainset['id'],
                'name': chainset['name'],
@@ -812,14 +1280,22 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
                'tenant_id': chainset['tenant_id']}
         return self._fields(res, fields)
 
-    def get_chainsets(self, context, filters=None, fields=None):
+    def get_chainsets(self, context, filters=None, fields=None,
+                      sorts=None, limit=None, marker=None,
+                      page_reverse=False):
+        marker_obj = self._get_marker_obj(context, 'chainset', limit, marker)
         return self._get_collection(context, SFCChainSet,
                                     self._make_chainset_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     def get_chainset(self, context, id, fields=None):
-        chainset = self._get_chainset(context, id)
-        return self._make_chainset_dict(chainset, fields)
+        return self._cached_get(
+            context, 'chainset', id, fields,
+            lambda context, id: self._make_chainset_dict(
+                self._get_chainset(context, id)))
 
     def create_chainset(self, context, chainset):
         n = chainset['chainset']
@@ -847,12 +1323,14 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         chainset = self._get_chainset(context, id)
         with context.session.begin(subtransactions=True):
             context.session.delete(chainset)
+        self._invalidate(context, 'chainset', id)
 
     def update_chainset(self, context, id, chainset):
         n = chainset['chainset']
         with context.session.begin(subtransactions=True):
             chainset = self._get_chainset(context, id)
             chainset.update(n)
+        self._invalidate(context, 'chainset', id)
         return self._make_chainset_dict(chainset)
 
     def _make_chainset_rule_dict(self, chainset_rule, fields=None):
@@ -880,12 +1358,20 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
                'dp_start': chainset_rule['dp_start'],
                'dp_end': chainset_rule['dp_end'],
                'ip_protocol': chainset_rule['ip_protocol']}
+        res.update(rule_match.match_dict(chainset_rule))
         return self._fields(res, fields)
 
-    def get_chainset_rules(self, context, filters=None, fields=None):
+    def get_chainset_rules(self, context, filters=None, fields=None,
+                           sorts=None, limit=None, marker=None,
+                           page_reverse=False):
+        marker_obj = self._get_marker_obj(
+            context, 'chainset_rule', limit, marker)
         return self._get_collection(context, SFCChainSelectionRule,
                                     self._make_chainset_rule_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     def get_chainset_rule(self, context, id, chainset_id, fields=None):
         chainset_rule = self._get_chainset_rule(context, id)
@@ -894,6 +1380,7 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
     def create_chainset_rule(self, context, chainset_rule, chainset_id):
         cbr = chainset_rule['rule']
         tenant_id = self._get_tenant_id_for_create(context, cbr)
+        match = rule_match.typed_match(cbr)
 
         with context.session.begin(subtransactions=True):
             rule = SFCChainSelectionRule(tenant_id=tenant_id,
@@ -919,7 +1406,8 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
                                          dp_end=cbr['dp_end'],
                                          ip_protocol=cbr['ip_protocol'],
                                          chain_id=cbr.get('chain_id') or '',
-                                         chainset_id=chainset_id)
+                                         chainset_id=chainset_id,
+                                         **match)
             context.session.add(rule)
         return self._make_chainset_rule_dict(rule)
 
@@ -943,8 +1431,37 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         with context.session.begin(subtransactions=True):
             chainset_rule = self._get_chainset_rule(context, id)
             chainset_rule.update(n)
+            chainset_rule.update(rule_match.typed_match(chainset_rule))
         return self._make_chainset_rule_dict(chainset_rule)
 
+    def get_overlapping_chainset_rules(self, context, chainset_id, rule,
+                                       fields=None):
+        """
+        Return the selection rules of a chainset whose match overlaps
+        rule, given with its string match fields.
+        """
+        query = self._model_query(context, SFCChainSelectionRule).filter(
+            SFCChainSelectionRule.chainset_id == chainset_id)
+        query = rule_match.overlapping(query, SFCChainSelectionRule,
+                                       rule_match.typed_match(rule))
+        return [self._make_chainset_rule_dict(chainset_rule, fields)
+                for chainset_rule in query]
+
+    def get_flow_chainset_ids(self, context, flow):
+        """
+        Return the ids of the chainsets with a selection rule whose ranges
+        and values may match flow, given with its typed values.
+        """
+        match = {'protocol_num': flow.get('protocol_num'),
+                 'eth_value_num': flow.get('eth_value_num')}
+        for prefix in rule_match.RANGES:
+            match['%s_start_num' % prefix] = flow.get(prefix)
+            match['%s_end_num' % prefix] = flow.get(prefix)
+        query = self._model_query(context, SFCChainSelectionRule)
+        query = rule_match.overlapping(query, SFCChainSelectionRule, match)
+        return [row[0] for row in query.with_entities(
+            SFCChainSelectionRule.chainset_id).distinct()]
+
     def _make_chainmap_dict(self, chainmap, fields=None):
         res = {'id': chainmap['id'],
                'name': chainmap['name'],
@@ -954,10 +1471,16 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
                'outbound_network_id': chainmap['outbound_network_id']}
         return self._fields(res, fields)
 
-    def get_chainmaps(self, context, filters=None, fields=None):
+    def get_chainmaps(self, context, filters=None, fields=None,
+                      sorts=None, limit=None, marker=None,
+                      page_reverse=False):
+        marker_obj = self._get_marker_obj(context, 'chainmap', limit, marker)
         return self._get_collection(context, SFCChainsetNetworkMap,
                                     self._make_chainmap_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     def get_chainmap(self, context, id, fields=None):
         chainmap = self._get_chainmap(context, id)
@@ -1057,10 +1580,16 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         vlanquota = self._get_vlanquota(context, id)
         return self._make_vlanquota_dict(vlanquota, fields)
 
-    def get_vlanquotas(self, context, filters=None, fields=None):
+    def get_vlanquotas(self, context, filters=None, fields=None,
+                       sorts=None, limit=None, marker=None,
+                       page_reverse=False):
+        marker_obj = self._get_marker_obj(context, 'vlanquota', limit, marker)
         return self._get_collection(context, SFCVLANQuota,
                                     self._make_vlanquota_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     def create_vlanquota(self, context, vlanquota):
         n = vlanquota['vlanquota']
@@ -1099,6 +1628,88 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
             vlanquota.update(n)
         return self._make_vlanquota_dict(vlanquota)
 
+    def _get_vlan_range(self, context, tenant_id):
+        """Return the (first, last) VLAN of the quota of a tenant."""
+        quota = context.session.query(SFCVLANQuota).filter_by(
+            tenant_id=tenant_id).first()
+        if quota:
+            return int(quota.vlan_start), int(quota.vlan_end)
+        first, last = cfg.CONF.sfc_db.default_vlan_quota.split('-')
+        return int(first), int(last)
+
+    def _sync_vlan_allocations(self, tenant_id, network_id, first, last):
+        """
+        Create the missing allocation rows of network_id in [first, last],
+        in a session of its own so that a concurrent launch creating the
+        same rows does not abort the caller's transaction. VLANs already
+        held by instances launched before the allocator are taken.
+        """
+        session = db_api.get_session()
+        try:
+            with session.begin(subtransactions=True):
+                known = set(row.vlan_id for row in session.query(
+                    SFCVLANAllocation.vlan_id).filter_by(
+                        network_id=network_id))
+                used = {}
+                for instance in session.query(SFCApplianceInstance).filter_by(
+                        network_id=network_id):
+                    used[instance.vlan_in] = instance.id
+                    used[instance.vlan_out] = instance.id
+                for vlan_id in xrange(first, last + 1):
+                    if vlan_id not in known:
+                        session.add(SFCVLANAllocation(
+                            network_id=network_id, vlan_id=vlan_id,
+                            tenant_id=tenant_id,
+                            instance_id=used.get(vlan_id)))
+        except sa.exc.IntegrityError:
+            LOG.debug(_("VLAN allocations of network %s created "
+                        "concurrently"), network_id)
+
+    def allocate_vlan_pairs(self, context, network_id, instance_ids,
+                            tenant_id=None):
+        """
+        Allocate an in and an out VLAN on network_id to each appliance
+        instance of instance_ids, within the VLAN quota of the tenant, and
+        return {instance id: (vlan_in, vlan_out)}. The free VLANs are
+        taken with one locking query, lowest first.
+        """
+        tenant_id = tenant_id or context.tenant_id
+        count = 2 * len(instance_ids)
+        first, last = self._get_vlan_range(context, tenant_id)
+
+        def _free_vlans():
+            query = context.session.query(SFCVLANAllocation).filter(
+                SFCVLANAllocation.network_id == network_id,
+                SFCVLANAllocation.instance_id == None,
+                SFCVLANAllocation.vlan_id >= first,
+                SFCVLANAllocation.vlan_id <= last)
+            return query.order_by(SFCVLANAllocation.vlan_id).with_lockmode(
+                'update').limit(count).all()
+
+        with context.session.begin(subtransactions=True):
+            rows = _free_vlans()
+            if len(rows) < count:
+                self._sync_vlan_allocations(tenant_id, network_id, first,
+                                            last)
+                rows = _free_vlans()
+            if len(rows) < count:
+                raise sfc_exc.VlanRangeExhausted(
+                    network_id=network_id, vlan_range='%s-%s' % (first, last))
+            pairs = {}
+            for index, instance_id in enumerate(instance_ids):
+                vlan_in, vlan_out = rows[2 * index], rows[2 * index + 1]
+                vlan_in.instance_id = instance_id
+                vlan_out.instance_id = instance_id
+                pairs[instance_id] = (vlan_in.vlan_id, vlan_out.vlan_id)
+        return pairs
+
+    def release_vlans(self, context, instance_id):
+        """Free the VLANs allocated to an appliance instance."""
+        with context.session.begin(subtransactions=True):
+            context.session.query(SFCVLANAllocation).filter_by(
+                instance_id=instance_id).update({'instance_id': None},
+                                                synchronize_session=False)
+
     #def _make_vlan_pair_dict(self, vlanpair, fields=None):
     #    res = {'id': vlanpair['id'],
     #           'instance_id': vlanpair['instance_id'],
@@ -1196,11 +1807,87 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
 
         return self._make_chain_appliance_map_instance_dict(chain_appliance_map_instance)
     
-    def get_chain_appliance_map_instances(self, context, filters=None, fields=None):
+    def get_chain_appliance_map_instance(self, context, id, fields=None):
+        chain_appliance_map_instance = \
+            self._get_chain_appliance_map_instance_handle(context, id)
+        return self._make_chain_appliance_map_instance_dict(
+            chain_appliance_map_instance, fields)
+
+    def get_chain_appliance_map_instances(self, context, filters=None, fields=None,
+                                          sorts=None, limit=None, marker=None,
+                                          page_reverse=False):
+        marker_obj = self._get_marker_obj(
+            context, 'chain_appliance_map_instance_handle', limit, marker)
         return self._get_collection(context, SFCApplianceInstance,
                                     self._make_chain_appliance_map_instance_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
     
+    def get_config_handle_instance_uuids(self, context, config_handle_id):
+        """
+        Return the instance UUIDs of the appliance instances of every
+        appliance using a config handle, in one query.
+        """
+        query = context.session.query(SFCApplianceInstance.instance_uuid)
+        query = query.join(
+            SFCChainAppliance,
+            SFCApplianceInstance.appliance_map_id == SFCChainAppliance.id)
+        query = query.join(
+            SFCAppliance, SFCChainAppliance.appliance_id == SFCAppliance.id)
+        query = query.filter(SFCAppliance.config_handle_id == config_handle_id)
+        return [row.instance_uuid for row in query if row.instance_uuid]
+
+    def get_config_route_changes(self, context, since):
+        """
+        Return the config handles and the instance UUIDs whose routes the
+        appliance, chain appliance and appliance instance deltas newer than
+        version since may have changed, as (handle ids, instance UUIDs), or
+        None when deltas since then were compacted away. The handles are
+        those the changed rows belong to now; the instances those they
+        have now and those they had, so that the handles they were moved
+        away from are found too.
+        """
+        deltadb = sfc_delta_db.SfcDeltaDb()
+        if since < deltadb.get_compaction_horizon(context):
+            return None
+        appliance_ids = deltadb.get_changed_object_ids(
+            context, sfc_delta_db.sfc_appliances_delta, 'appliance_id', since)
+        map_ids = set(deltadb.get_changed_object_ids(
+            context, sfc_delta_db.sfc_chain_appliances_delta,
+            'chain_appliance_map_id', since))
+        instances_delta = sfc_delta_db.sfc_appliance_instances_delta
+        instance_uuids = set()
+        # Compact updates clear instance_uuid, never appliance_map_id
+        for instance_uuid, map_id in context.session.query(
+                instances_delta.instance_uuid,
+                instances_delta.appliance_map_id).filter(
+                    instances_delta.version_id > since).distinct():
+            if instance_uuid:
+                instance_uuids.add(instance_uuid)
+            if map_id:
+                map_ids.add(map_id)
+        conditions = []
+        if appliance_ids:
+            conditions.append(
+                SFCChainAppliance.appliance_id.in_(appliance_ids))
+        if map_ids:
+            conditions.append(SFCChainAppliance.id.in_(map_ids))
+        if not conditions:
+            return set(), instance_uuids
+        query = context.session.query(SFCAppliance.config_handle_id).join(
+            SFCChainAppliance,
+            SFCChainAppliance.appliance_id == SFCAppliance.id)
+        handles = set(row.config_handle_id for row in query.filter(
+            sa.or_(*conditions)).distinct() if row.config_handle_id)
+        query = context.session.query(SFCApplianceInstance.instance_uuid).join(
+            SFCChainAppliance,
+            SFCApplianceInstance.appliance_map_id == SFCChainAppliance.id)
+        instance_uuids.update(row.instance_uuid for row in query.filter(
+            sa.or_(*conditions)) if row.instance_uuid)
+        return handles, instance_uuids
+
     def delete_chain_appliance_map_instance(self, context, id):
         chain_appliance_map_instance = self._get_chain_appliance_map_instance_handle(context, id)
         LOG.debug(_("@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@"))
@@ -1208,6 +1895,7 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
         LOG.debug(_("@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@"))
         
         with context.session.begin(subtransactions=True):
+            self.release_vlans(context, id)
             context.session.delete(chain_appliance_map_instance)
     
     def _make_chainset_zone_dict(self, chainset_zone, fields=None):
@@ -1218,10 +1906,17 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
                'chainset_id': chainset_zone['chainset_id']}
         return self._fields(res, fields)
 
-    def get_chainset_zones(self, context, filters=None, fields=None):
+    def get_chainset_zones(self, context, filters=None, fields=None,
+                           sorts=None, limit=None, marker=None,
+                           page_reverse=False):
+        marker_obj = self._get_marker_obj(
+            context, 'chainset_zone', limit, marker)
         return self._get_collection(context, SFCChainsetZone,
                                     self._make_chainset_zone_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
 
     def get_chainset_zone(self, context, id, chainset_id, fields=None):
         chainset_zone = self._get_chainset_zone(context, id)
@@ -1261,4 +1956,127 @@ class SFCPluginDb(db_base_plugin_v2.CrdDbPluginV2):
             chainset_zone = self._get_chainset_zone(context, id)
             chainset_zone.update(n)
         return self._make_chainset_zone_dict(chainset_zone)
+
+    def _make_launch_job_dict(self, job, fields=None):
+        elapsed = None
+        if job['started_at']:
+            end = job['finished_at'] or datetime.datetime.now()
+            elapsed = (end - job['started_at']).total_seconds()
+        res = {'id': job['id'],
+               'tenant_id': job['tenant_id'],
+               'operation': job['operation'],
+               'status': job['status'],
+               'chainset_id': job['chainset_id'],
+               'chainmap_id': job['chainmap_id'],
+               'rule_id': job['rule_id'],
+               'instance_id': job['instance_id'],
+               'progress': jsonutils.loads(job['progress'] or '[]'),
+               'error': job['error'],
+               'created_at': job['created_at'],
+               'started_at': job['started_at'],
+               'finished_at': job['finished_at'],
+               'elapsed': elapsed}
+        return self._fields(res, fields)
+
+    def get_launch_jobs(self, context, filters=None, fields=None,
+                        sorts=None, limit=None, marker=None,
+                        page_reverse=False):
+        marker_obj = self._get_marker_obj(context, 'launch_job', limit, marker)
+        return self._get_collection(context, SFCLaunchJob,
+                                    self._make_launch_job_dict,
+                                    filters=filters, fields=fields,
+                                    sorts=sorts, limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse)
+
+    def get_launch_job(self, context, id, fields=None):
+        job = self._get_launch_job(context, id)
+        return self._make_launch_job_dict(job, fields)
+
+    def create_launch_job(self, context, launch_job):
+        n = launch_job['launch_job']
+        tenant_id = self._get_tenant_id_for_create(context, n)
+
+        with context.session.begin(subtransactions=True):
+            job = SFCLaunchJob(tenant_id=tenant_id,
+                               id=self.__get_id(n),
+                               operation=n['operation'],
+                               status=JOB_PENDING,
+                               chainset_id=n.get('chainset_id'),
+                               chainmap_id=n.get('chainmap_id'),
+                               rule_id=n.get('rule_id'),
+                               instance_id=n.get('instance_id'),
+                               owner=n.get('owner'))
+            context.session.add(job)
+        return self._make_launch_job_dict(job)
+
+    def _get_launch_job(self, context, id):
+        try:
+            job = self._get_by_id(context, SFCLaunchJob, id)
+        except exc.NoResultFound:
+            raise sfc_exc.LaunchJobNotFound(job_id=id)
+        return job
+
+    def update_launch_job(self, context, id, launch_job):
+        n = dict(launch_job['launch_job'])
+        if 'progress' in n:
+            n['progress'] = jsonutils.dumps(n['progress'])
+        with context.session.begin(subtransactions=True):
+            job = self._get_launch_job(context, id)
+            job.update(n)
+        return self._make_launch_job_dict(job)
+
+    def delete_launch_job(self, context, id):
+        with context.session.begin(subtransactions=True):
+            job = self._get_launch_job(context, id)
+            if job['status'] not in JOB_FINISHED:
+                raise sfc_exc.LaunchJobNotFinished(job_id=id,
+                                                   status=job['status'])
+            context.session.delete(job)
+
+    def get_launch_job_status(self, context, id):
+        """
+        Return the status of a job as stored, even when the job is
+        already loaded in the session of context.
+        """
+        return context.session.query(SFCLaunchJob.status).filter_by(
+            id=id).scalar()
+
+    def set_launch_job_status(self, context, id, statuses, status, **kwargs):
+        """
+        Move a job to status if it is in one of statuses, in one UPDATE
+        so that a concurrent change of the status is never overwritten.
+        Return whether the job was moved.
+        """
+        values = dict(kwargs, status=status)
+        with context.session.begin(subtransactions=True):
+            count = self._model_query(context, SFCLaunchJob).filter(
+                SFCLaunchJob.id == id,
+                SFCLaunchJob.status.in_(statuses)).update(
+                    values, synchronize_session='fetch')
+        return count > 0
+
+    def fail_orphaned_launch_jobs(self, context, host, alive):
+        """
+        Fail the unfinished jobs of the API workers of host that are gone,
+        alive(pid) telling whether a worker still runs, and the jobs
+        queued before jobs had owners. Return the ids of the jobs failed.
+        """
+        prefix = host + ':'
+        query = self._model_query(context, SFCLaunchJob).filter(
+            ~SFCLaunchJob.status.in_(JOB_FINISHED),
+            sa.or_(SFCLaunchJob.owner == None,
+                   SFCLaunchJob.owner.startswith(prefix)))
+        orphaned = [job.id for job in query
+                    if job.owner is None or
+                    not alive(int(job.owner[len(prefix):]))]
+        failed = []
+        for id in orphaned:
+            if self.set_launch_job_status(
+                    context, id, [JOB_PENDING, JOB_RUNNING, JOB_CANCELLING],
+                    JOB_FAILED, error='Interrupted by a restart of the '
+                    'API worker running it',
+                    finished_at=datetime.datetime.now()):
+                failed.append(id)
+        return failed
     
\ No newline at end of file
@@ -18,13 +18,36 @@ from nscs.crdservice import context as crd_context
 from nscs.crdservice.openstack.common import rpc
 from nscs.crdservice.openstack.common.rpc import dispatcher
 from nscs.crdservice.openstack.common.rpc import proxy
+from nscs.crdservice.openstack.common import uuidutils
+from oslo.config import cfg
 
+import eventlet
 import re
 import socket
+import threading
 import time
 
 LOG = logging.getLogger(__name__)
 
+dispatcher_opts = [
+    cfg.IntOpt('fanout_batch_size', default=200,
+               help=_("Maximum number of delta messages sent to consumers "
+                      "in one call_consumer fanout")),
+    cfg.FloatOpt('fanout_batch_window', default=0.05,
+                 help=_("Seconds between queueing a delta message and "
+                        "draining the outbox, so that later messages join "
+                        "the same fanout")),
+    cfg.FloatOpt('outbox_poll_interval', default=2.0,
+                 help=_("Seconds between scans of the delta outbox for "
+                        "messages left unsent")),
+    cfg.IntOpt('outbox_lease', default=30,
+               help=_("Seconds a process keeps the right to send the "
+                      "delta outbox after its last drain; another process "
+                      "takes over once it has expired")),
+]
+
+cfg.CONF.register_opts(dispatcher_opts, "sfc_delta")
+
 
 class SfcDispatcher(object):
     """
@@ -33,4 +56,84 @@ class SfcDispatcher(object):
     def send_fanout(self, context, method, payload):
         LOG.info(_("Payload in Send Fanout %s\n"), payload)
         consumer_topic = "crd-consumer"
-        self.fanout_cast(context, self.make_msg(method, payload=payload), consumer_topic, version=self.RPC_API_VERSION)
\ No newline at end of file
+        self.fanout_cast(context, self.make_msg(method, payload=payload), consumer_topic, version=self.RPC_API_VERSION)
+
+
+class SfcBatchDispatcher(object):
+    """
+    Send the delta messages queued in the outbox to the CRD consumers. A
+    drain starts fanout_batch_window seconds after the first notify, so
+    messages written meanwhile share its call_consumer fanouts of up to
+    fanout_batch_size messages; the outbox is also polled every
+    outbox_poll_interval seconds to retry failed sends. Batches of more
+    than one message are wrapped in a single apply_delta_batch entry whose
+    deltas list is in version order, so consumers apply them in order
+    whatever they do with the call_consumer dict. Every API worker runs a
+    dispatcher; the outbox lease lets one of them send at a time.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.consumer_topic = 'crd-consumer'
+        self.lock = threading.Lock()
+        self.drain_lock = threading.Lock()
+        self.outbox = None
+        self.timer = None
+        self.poller = None
+        self.owner = uuidutils.generate_uuid()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def start(self, outbox):
+        """Poll outbox for messages that were not sent on notify."""
+        self.outbox = outbox
+        if self.poller is None:
+            self.poller = eventlet.spawn(self._poll)
+
+    def notify(self, outbox):
+        """Schedule a drain of outbox, which has new messages."""
+        with self.lock:
+            if self.outbox is None:
+                self.outbox = outbox
+            if self.timer is None:
+                self.timer = eventlet.spawn_after(
+                    max(cfg.CONF.sfc_delta.fanout_batch_window, 0),
+                    self.flush)
+
+    def _poll(self):
+        while True:
+            eventlet.sleep(cfg.CONF.sfc_delta.outbox_poll_interval)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.timer = None
+        batch_size = cfg.CONF.sfc_delta.fanout_batch_size
+        with self.drain_lock:
+            ctx = crd_context.Context('crd', 'crd', is_admin=True)
+            try:
+                while (self.outbox.drain_outbox(
+                        ctx, self.send_batch, batch_size, self.owner,
+                        cfg.CONF.sfc_delta.outbox_lease) == batch_size):
+                    pass
+            except Exception, msg:
+                LOG.error(_("Sending delta messages to consumers failed, "
+                            "will retry: %s"), msg)
+
+    def send_batch(self, batch):
+        batch = sorted(batch, key=lambda entry: entry[0])
+        if len(batch) == 1:
+            delta = dict(batch)
+        else:
+            delta = {batch[-1][0]: {'method': 'apply_delta_batch',
+                                    'payload': {'deltas': [list(entry) for
+                                                           entry in batch]}}}
+        LOG.debug(_("Sending %s delta messages to consumers"), len(batch))
+        ctx = crd_context.Context('crd', 'crd', is_admin=True)
+        rpc.fanout_cast(ctx, self.consumer_topic,
+                        proxy.RpcProxy.make_msg('call_consumer',
+                                                payload=delta))
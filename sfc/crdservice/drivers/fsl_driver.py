@@ -14,6 +14,8 @@
 #    under the License.
 
 from oslo.config import cfg
+import eventlet
+from eventlet import queue
 import time
 import socket
 
@@ -31,6 +33,10 @@ from novaclient.v1_1 import client as nova_client
 from keystoneclient.v2_0 import client as keystone_client
 from neutronclient.v2_0 import client as neutron_client
 
+from sfc.crdservice.common import clients
+from sfc.crdservice.common import exceptions as sfc_exc
+from sfc.crdservice.common import readiness
+from sfc.crdservice.common import routing
 from sfc.crdservice.db import sfc_db
 from sfc.crdservice.db import delta as sfc_delta_db
 from cns.crdservice.db import nova as nova_db
@@ -46,6 +52,15 @@ crd_nwservices_opts = [
 
 cfg.CONF.register_opts(crd_nwservices_opts, "nscs_authtoken")
 
+sfc_driver_opts = [
+    cfg.IntOpt('launch_pool_size', default=1,
+               help=_("Number of appliances of a chain that launch_chain "
+                      "waits for at the same time, all of them booted up "
+                      "front; 1 boots them one after another")),
+]
+
+cfg.CONF.register_opts(sfc_driver_opts, "sfc_driver")
+
 
 class SFCDriver(proxy.RpcProxy):
     """
@@ -96,12 +111,9 @@ class SFCDriver(proxy.RpcProxy):
         return tenant_id, instance_uuid, hostname
 
     def wait_for_instance_active(self, instance_uuid, timeout=300):
-        #LOG.debug('Looping for 300 secs')
-        for i in range(0, timeout):
-            time.sleep(1)
-            #LOG.debug('After Sleep.')
-            nt = novaclient()
-            #LOG.debug('novaclient = %s' % str(nt))
+        nt = novaclient()
+
+        def _check():
             try:
                 instance_details = nt.servers.get(instance_uuid)
             except Exception, msg:
@@ -124,6 +136,9 @@ class SFCDriver(proxy.RpcProxy):
                     'OS-EXT-STS:vm_state') == 'error':
                 raise q_exc.InstanceErrorState(instance_id=instance_uuid)
 
+        return readiness.InstanceReadiness.get_instance().wait_for(
+            instance_uuid, _check, timeout)
+
     def prepare_msg(self, instance_id, tenant_id, msg,
                     update_type='config_update'):
         m = self.make_msg(update_type,
@@ -137,46 +152,38 @@ class SFCDriver(proxy.RpcProxy):
         return '%s.%s' % (topics.RELAY_AGENT, hostname)
 
     def send_cast(self, logical_id, msg):
-        #LOG.debug('In send_cast\n')
-        self.db = sfc_db.SFCPluginDb()
+        """
+        Send a config message to the relay agent of every instance of the
+        appliances using config handle logical_id, as routed by the config
+        routing table as of the committed runtime version.
+        """
+        routes = routing.ConfigRoutes.get_instance()
+        version = sfc_delta_db.SfcDeltaDb().get_runtime_version(self.context)
+        for instance_uuid, tenant_id, hostname in routes.route(
+                logical_id, self._resolve_config_handle,
+                self._locate_instance, version, self._config_route_changes):
+            self.cast(self.rpc_context,
+                      self.prepare_msg(instance_uuid, tenant_id, msg),
+                      topic=self._get_relay_topic_name(hostname))
+
+    def _resolve_config_handle(self, config_handle_id):
+        db = sfc_db.SFCPluginDb()
+        return db.get_config_handle_instance_uuids(self.context,
+                                                   config_handle_id)
+
+    def _config_route_changes(self, since):
+        db = sfc_db.SFCPluginDb()
+        return db.get_config_route_changes(self.context, since)
+
+    def _locate_instance(self, instance_uuid):
+        """Ask nova the (tenant id, host) of an instance not yet seen."""
         try:
-            appliance_id = None
-            filters = {}
-            filters['config_handle_id'] = [logical_id]
-            appliances = self.db.get_appliances(self.context,
-                                                filters=filters)
-            for appliance in appliances:
-                LOG.debug(_("##########################Appliance: %s"), str(appliance))
-                appliance_id = appliance['id']
-            
-            if appliance_id:
-                filters = {}
-                filters['appliance_id'] = [appliance_id]
-                chain_appliance_maps = self.db.get_chain_appliance_maps(self.context,
-                                                                       filters=filters)
-                if chain_appliance_maps:
-                    ###TODO :: Need to get instances from new table service_instances
-                    appliance_map = chain_appliance_maps[0]
-                    #instance_uuid = appliance_map['instance_uuid']
-                    if appliance_map:
-                        chain_appliance_id = appliance_map['id']
-                        # Get instances from the table sfc_appliance_instances
-                        filters = {}
-                        filters['appliance_map_id'] = [chain_appliance_id]
-                        appliance_instances = self.db.get_chain_appliance_map_instances(self.context,
-                                                                              filters=filters)
-                        
-                        if appliance_instances:
-                            for app_instance in appliance_instances:
-                                instance_uuid = app_instance['instance_uuid']
-                                if instance_uuid:
-                                    tenant_id, instance_id, hostname = self.get_instance_details(instance_uuid)
-                                    self.cast(self.rpc_context,
-                                              self.prepare_msg(instance_id, tenant_id, msg),
-                                              topic=self._get_relay_topic_name(hostname))
-            
+            tenant_id, instance_id, hostname = self.get_instance_details(
+                instance_uuid)
         except q_exc.InstanceNotFound, msg:
             LOG.error(msg)
+            return None
+        return tenant_id, hostname
 
     def send_delete_instance(self, instance_id, tenant_id, hostname):
         try:
@@ -191,6 +198,16 @@ class SFCDriver(proxy.RpcProxy):
             LOG.error(msg)
 
 
+    def delete_instances(self, context, instance_uuids):
+        """Delete the nova servers of removed appliance instances."""
+        nt = novaclient(context)
+        for instance_uuid in instance_uuids:
+            try:
+                nt.servers.delete(instance_uuid)
+            except Exception:
+                LOG.exception(_('Failed to delete instance %s'),
+                              instance_uuid)
+
     def send_vlancast(self, instance_uuid, msg):
         try:
             instance_id, tenant_id, hostname = self.wait_for_instance_active(
@@ -203,7 +220,23 @@ class SFCDriver(proxy.RpcProxy):
                   topic=self._get_relay_topic_name(hostname))
 
 
-    def launch_chain(self, context, chainset_id, chainmap_id, rule_id):
+    def launch_chain(self, context, chainset_id, chainmap_id, rule_id,
+                     progress=None):
+        """
+        Boot and record the appliance instances of the chain a rule steers
+        to. progress, if given, is called as progress(appliance_map,
+        state, instance_uuid) when an appliance is pending, booting,
+        booted, then recorded active or in error. LaunchJobCancelled raised
+        by it while an appliance is pending or booting stops the launch
+        before the server of the appliance is created; the servers booted
+        until then are still waited for and recorded, and the exception is
+        raised again once they are. The servers booted are deleted again
+        when the launch fails before they are recorded; when
+        launch_pool_size is above 1 each instance is recorded as soon as it
+        is ready, and the instances recorded before a failure stay.
+        """
+        if progress is None:
+            progress = lambda appliance_map, state, instance_uuid=None: None
         self.db = sfc_db.SFCPluginDb()
         self.delta_db = sfc_delta_db.SfcDeltaDb()
         self.crdnovadb = nova_db.NovaDb()
@@ -231,11 +264,9 @@ class SFCDriver(proxy.RpcProxy):
 
 
         filters = {}
-        filters['chain_id'] = [chain_id]
-        appliance_maps = self.db.get_chain_appliance_maps(context, filters)
+        topology = self.db.get_chain_topology(context, chain_id)
+        appliance_maps = topology['appliance_maps']
         appliance_count = len(appliance_maps)
-        appliance_maps = sorted(appliance_maps,
-                                key=lambda k: k['sequence_number'])
         #LOG.debug(
         # '#############################################################################\n')
         #LOG.debug('appliance count = %s' % str(appliance_count))
@@ -247,72 +278,162 @@ class SFCDriver(proxy.RpcProxy):
         #LOG.debug('inner subnets = %s' % str(inner_subnets))
         #LOG.debug(
         # '#############################################################################\n')
-        last_net = None
-        count = 1
+        nics = []
+        if inbound_net_id == outbound_net_id:
+            nic = {"net-id": inbound_net_id, "v4-fixed-ip": ""}
+            nics.append(nic)
+        else:
+            nic1 = {"net-id": inbound_net_id, "v4-fixed-ip": ""}
+            nics.append(nic1)
+
+            nic2 = {"net-id": outbound_net_id, "v4-fixed-ip": ""}
+            nics.append(nic2)
+
         for appliance_map in appliance_maps:
-            name = appliance_map['name']
-            network_name = 'internal_net_' + name
-            appliance_map_id = appliance_map['id']
-            chain_id = appliance_map['chain_id']
-            appliance_id = appliance_map['appliance_id']
-            appliance = self.db.get_appliance(context,
-                                              appliance_id)
-            glance_image_id = appliance['image_id']
-            flavor_id = appliance['flavor_id']
-            security_group_id = appliance['security_group_id']
-
-            security_groups = []
-            secgrp = nt.security_groups.get(appliance['security_group_id'])
-            security_group_name = secgrp.__getattribute__('name')
-            security_groups.append(security_group_name)
-
-            nics = []
-            if inbound_net_id == outbound_net_id:
-                nic = {"net-id": inbound_net_id, "v4-fixed-ip": ""}
-                nics.append(nic)
+            progress(appliance_map, 'pending')
+        pool_size = cfg.CONF.sfc_driver.launch_pool_size
+        booted = []
+        ready = []
+        recorded = set()
+        cancelled = None
+        try:
+            try:
+                for appliance_map in appliance_maps:
+                    instance_uuid = self._boot_appliance(nt, chain_id,
+                                                         appliance_map, nics,
+                                                         progress)
+                    booted.append((appliance_map, instance_uuid))
+                    if pool_size <= 1:
+                        ready.append((appliance_map, instance_uuid,
+                                      self._wait_appliance_instance(
+                                          instance_uuid)))
+            except sfc_exc.LaunchJobCancelled, e:
+                # A cancelled launch boots no further appliance and keeps
+                # the servers it has booted.
+                cancelled = e
+            if pool_size <= 1:
+                # The instances of the chain are recorded together, so
+                # that their VLANs are taken in one allocation.
+                with context.session.begin(subtransactions=True):
+                    self._add_appliance_instances(context, booted, nics)
+                recorded.update(instance_uuid for appliance_map,
+                                instance_uuid in booted)
+                for appliance_map, instance_uuid, state in ready:
+                    progress(appliance_map, state, instance_uuid)
             else:
-                nic1 = {"net-id": inbound_net_id, "v4-fixed-ip": ""}
-                nics.append(nic1)
-                
-                nic2 = {"net-id": outbound_net_id, "v4-fixed-ip": ""}
-                nics.append(nic2)
-            
-            config_handle_id = appliance['config_handle_id']
-            if (config_handle_id == ''):
-                msg = _(
-                    'Failed to launch chain  %s, No Cnfiguration '
-                    'associated') % chain_id
-                LOG.error(msg)
-                
-
-            LOG.debug(
-                '@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@\n')
-            LOG.debug('NICS = %s' % str(nics))
-            LOG.debug('Name = %s' % str(name))
-            LOG.debug('Galnce Image ID = %s' % str(glance_image_id))
-            LOG.debug('Security Groups = %s' % str(security_groups))
-            LOG.debug(
-                '@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@\n')
-            dev_mapping = None
-            custom_script = None
-            keypair_id = None
-            meta = {'vmtype': 'service'}
-            instance_count = 1
-
-            instance = nt.servers.create(name,
-                                         glance_image_id,
-                                         flavor_id,
-                                         meta=meta,
-                                         security_groups=security_groups,
-                                         nics=nics,
-                                         instance_count=int(instance_count))
-            LOG.debug('^^^^^^^^^^^^^^^^^^^^^^^^^^^^')
-            LOG.debug('INSTANCE = %s' % str(instance))
-            LOG.debug('^^^^^^^^^^^^^^^^^^^^^^^^^^^^')
-            msg = _('Instance %s was successfully launched.') % instance.id
-            LOG.debug(msg)
-            instance_uuid = instance.id
+                self._record_when_ready(context, booted, nics, pool_size,
+                                        progress, recorded)
+        except Exception:
+            LOG.exception(_('Failed to launch chain %s, deleting the '
+                            'instances booted for it'), chain_id)
+            self.delete_instances(context, [
+                instance_uuid for appliance_map, instance_uuid in booted
+                if instance_uuid not in recorded])
+            raise
+        if cancelled:
+            raise cancelled
+        #LOG.debug("Returning ChainID - %s" % str(chain_id))    
+        return chain_id
+
+    def _record_when_ready(self, context, booted, nics, pool_size, progress,
+                           recorded):
+        """
+        Wait for booted appliance instances, given as (appliance map,
+        instance uuid) pairs, pool_size at a time, and record each in a
+        transaction of its own as soon as it is ready. The uuids recorded
+        are added to recorded. Only this green thread uses the session of
+        context; the waiters read the CRD database with contexts of their
+        own.
+        """
+        pool = eventlet.GreenPool(pool_size)
+        finished = queue.LightQueue()
+        threads = []
+        for appliance_map, instance_uuid in booted:
+            thread = pool.spawn(self._wait_appliance_instance, instance_uuid)
+            thread.link(lambda thread, appliance_map, instance_uuid:
+                        finished.put((appliance_map, instance_uuid, thread)),
+                        appliance_map, instance_uuid)
+            threads.append(thread)
+        try:
+            for i in range(len(booted)):
+                appliance_map, instance_uuid, thread = finished.get()
+                state = thread.wait()
+                with context.session.begin(subtransactions=True):
+                    self._add_appliance_instances(
+                        context, [(appliance_map, instance_uuid)], nics)
+                recorded.add(instance_uuid)
+                progress(appliance_map, state, instance_uuid)
+        finally:
+            # Stop the waiters of instances no longer launched
+            for thread in threads:
+                thread.kill()
+
+    def _boot_appliance(self, nt, chain_id, appliance_map, nics, progress):
+        """Create the nova server of an appliance map, return its id."""
+        progress(appliance_map, 'booting')
+        name = appliance_map['name']
+        network_name = 'internal_net_' + name
+        appliance_map_id = appliance_map['id']
+        chain_id = appliance_map['chain_id']
+        appliance_id = appliance_map['appliance_id']
+        appliance = appliance_map['appliance']
+        glance_image_id = appliance['image_id']
+        flavor_id = appliance['flavor_id']
+        security_group_id = appliance['security_group_id']
+
+        security_groups = []
+        secgrp = nt.security_groups.get(appliance['security_group_id'])
+        security_group_name = secgrp.__getattribute__('name')
+        security_groups.append(security_group_name)
+
+        config_handle_id = appliance['config_handle_id']
+        if (config_handle_id == ''):
+            msg = _(
+                'Failed to launch chain  %s, No Cnfiguration '
+                'associated') % chain_id
+            LOG.error(msg)
             
+
+        LOG.debug(
+            '@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@\n')
+        LOG.debug('NICS = %s' % str(nics))
+        LOG.debug('Name = %s' % str(name))
+        LOG.debug('Galnce Image ID = %s' % str(glance_image_id))
+        LOG.debug('Security Groups = %s' % str(security_groups))
+        LOG.debug(
+            '@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@\n')
+        dev_mapping = None
+        custom_script = None
+        keypair_id = None
+        meta = {'vmtype': 'service'}
+        instance_count = 1
+
+        instance = nt.servers.create(name,
+                                     glance_image_id,
+                                     flavor_id,
+                                     meta=meta,
+                                     security_groups=security_groups,
+                                     nics=nics,
+                                     instance_count=int(instance_count))
+        LOG.debug('^^^^^^^^^^^^^^^^^^^^^^^^^^^^')
+        LOG.debug('INSTANCE = %s' % str(instance))
+        LOG.debug('^^^^^^^^^^^^^^^^^^^^^^^^^^^^')
+        msg = _('Instance %s was successfully launched.') % instance.id
+        LOG.debug(msg)
+        instance_uuid = instance.id
+        progress(appliance_map, 'booted', instance_uuid)
+        return instance_uuid
+
+    def _wait_appliance_instance(self, instance_uuid):
+        """
+        Wait for an appliance instance to be reported active or in error
+        and return its state. The CRD database is checked, in a context of
+        the waiter's own, when no notification arrives in time.
+        """
+        context = crd_context.Context('crd', 'crd', is_admin=True)
+        ready = readiness.InstanceReadiness.get_instance()
+        ready.register(instance_uuid)
+        try:
             while (1):
                 msg = _("Waiting for Instance in CRD DB ...%s") % str(
                     instance_uuid)
@@ -322,16 +443,31 @@ class SFCDriver(proxy.RpcProxy):
                 try:
                     crd_instance = self.crdnovadb.get_instance(context,
                                                                instance_uuid)
-                    if crd_instance['state'] == 'active' or crd_instance[
-                        'state'] == 'error':
+                    if crd_instance['state'] in readiness.READY_STATES:
+                        state = crd_instance['state']
                         break
                 except:
                     pass
-                time.sleep(5)
-            
+                state = ready.wait(instance_uuid,
+                                   cfg.CONF.sfc_driver.instance_poll_interval)
+                if state:
+                    break
+        finally:
+            ready.discard(instance_uuid)
+        return state
+
+    def _add_appliance_instances(self, context, booted, nics):
+        """
+        Record booted appliance instances, given as (appliance map,
+        instance uuid) pairs, with their VLANs and deltas. An instance
+        records the VLAN pair of one network, that of the last of nics;
+        the pairs of all of them are allocated there in one call.
+        """
+        appliance_instance_ids = []
+        for appliance_map, instance_uuid in booted:
             appliance_instance_body = {
                 'instance': {
-                    'appliance_map_id': appliance_map_id,
+                    'appliance_map_id': appliance_map['id'],
                     'instance_uuid': instance_uuid,
                     'tenant_id': context.tenant_id,
                     'network_id': None,
@@ -347,107 +483,45 @@ class SFCDriver(proxy.RpcProxy):
             delta.update({'appliance_instances_delta':data})
             result_delta = self.delta_db.create_appliance_instances_delta(context,delta)
             ###DELTA
-            
-            appliance_instance_id = appliance_instance['id']
-            
-            if instance_uuid:
-                fliters = []
-                filters['tenant_id'] = [context.tenant_id]
-                #vlanquotas = cfg.CONF.nscs_authtoken.vlan_quota
-                vlanquotas = '100-200'
-                #vlanquotas = self.db.get_vlanquotas(context, filters=filters)
-                if vlanquotas:
-                    vlan_range = vlanquotas.split('-')
-                    vlan_start = int(vlan_range[0])
-                    vlan_end = int(vlan_range[1])
-                    tot_vlans = []
-                    u = 0
-                    for u in range(vlan_start, vlan_end):
-                        tot_vlans.append(u)
-
-                    for n in nics:
-                        net_id = n['net-id']
-                        fliters = []
-                        filters['tenant_id'] = [context.tenant_id]
-                        filters['network_id'] = [net_id]
-                        vlan_pairs = self.db.get_chain_appliance_map_instances(context,
-                                                                     filters=filters)
-                        assigned_vlans = []
-                        for vp in vlan_pairs:
-                            vlan_in = vp['vlan_in']
-                            assigned_vlans.append(vlan_in)
-                            vlan_out = vp['vlan_out']
-                            assigned_vlans.append(vlan_out)
-                        diff_vlans = sorted(
-                            list(set(tot_vlans) - set(assigned_vlans)))
-                        y = 0
-                        vlan_in = 0
-                        vlan_out = 0
-                        for y in range(0, 2):
-                            if y == 0:
-                                #dir = 'ingress'
-                                vlan_in = diff_vlans[0]
-
-                            else:
-                                #dir = 'egress'
-                                vlan_out = diff_vlans[1]
-
-                            #vpair.append(vlid)
-
-                            if y > 0:
-                                ###Insert Vlan Pairs in CRD...
-                                appliance_instance_update_body = {
-                                    'appliance_instance': {'network_id': net_id,
-                                                           'vlan_in': vlan_in,
-                                                           'vlan_out': vlan_out,
-                                                           }
-                                        }
-                                #vlanpair = self.db.create_vlan_pair(context,
-                                #                                    vlanpair_body)
-                                v_new = self.db.update_chain_appliance_map_instance(context, appliance_instance_id,
-                                                                          appliance_instance_update_body)
-                                ###DELTA
-                                data = {}
-                                data = v_new
-                                data.update({'operation' : 'update'})
-                                delta={}
-                                delta.update({'appliance_instances_delta':data})
-                                result_delta = self.delta_db.create_appliance_instances_delta(context,delta)
-                                ###DELTA
-                                
-
-                                ###Send Vlan Pairs to Relay Agent
-
-                                #res = {'header': 'request',
-                                #       'instance_uuid': instance_uuid,
-                                #       'slug': 'vlanpair',
-                                #       'vlanin': vlan_in,
-                                #       'vlanout': vlan_out,
-                                #       'version': '1.0',
-                                #       'tenant_id': context.tenant_id}
-                                #LOG.debug('^^^^^^^^^^^^^^^^^^^^^^^^^^^^')
-                                #LOG.debug('VLAN Pair Message = %s' % str(res))
-                                #LOG.debug('^^^^^^^^^^^^^^^^^^^^^^^^^^^^')
-                                #self.send_vlancast(instance_uuid,
-                                #                   {'config': res})
-
-                            y += 1
-            
-            #config_handle_details = self.db.get_config_handle(context,
-            #                                                  config_handle_id)
+            appliance_instance_ids.append(appliance_instance['id'])
+
+        net_id = nics[-1]['net-id']
+        vlan_pairs = self.db.allocate_vlan_pairs(context, net_id,
+                                                 appliance_instance_ids)
+        for appliance_instance_id in appliance_instance_ids:
+            vlan_in, vlan_out = vlan_pairs[appliance_instance_id]
+            ###Insert Vlan Pairs in CRD...
+            appliance_instance_update_body = {
+                'appliance_instance': {'network_id': net_id,
+                                       'vlan_in': vlan_in,
+                                       'vlan_out': vlan_out,
+                                       }
+                    }
+            v_new = self.db.update_chain_appliance_map_instance(context, appliance_instance_id,
+                                                      appliance_instance_update_body)
+            ###DELTA
+            data = {}
+            data = v_new
+            data.update({'operation' : 'update'})
+            delta={}
+            delta.update({'appliance_instances_delta':data})
+            result_delta = self.delta_db.create_appliance_instances_delta(context,delta)
+            ###DELTA
+
+            ###Send Vlan Pairs to Relay Agent
+
             #res = {'header': 'request',
-            #       'config_handle_id': config_handle_id,
-            #       'slug': config_handle_details['slug'],
+            #       'instance_uuid': instance_uuid,
+            #       'slug': 'vlanpair',
+            #       'vlanin': vlan_in,
+            #       'vlanout': vlan_out,
             #       'version': '1.0',
-            #       'tenant_id': config_handle_details['tenant_id']}
-            #if config_handle_details['config_mode'] == 'NFV':
-            #    str1 = self.send_cast(config_handle_id, {'config':res})
-            #    pass
-
-            count += 1
-            #time.sleep(120)
-        #LOG.debug("Returning ChainID - %s" % str(chain_id))    
-        return chain_id
+            #       'tenant_id': context.tenant_id}
+            #LOG.debug('^^^^^^^^^^^^^^^^^^^^^^^^^^^^')
+            #LOG.debug('VLAN Pair Message = %s' % str(res))
+            #LOG.debug('^^^^^^^^^^^^^^^^^^^^^^^^^^^^')
+            #self.send_vlancast(instance_uuid,
+            #                   {'config': res})
 
     @classmethod
     def send_rpc_msg(cls, logical_id, msg):
@@ -483,13 +557,12 @@ class SFCDriver(proxy.RpcProxy):
 
 
 def novaclient(context=None):
+    """
+    Return the cached nova client of the token of context, or of the
+    service credentials without context.
+    """
     if not context:
-
-        return nova_client.Client(cfg.CONF.nscs_authtoken.admin_user,
-                                  cfg.CONF.nscs_authtoken.admin_password,
-                                  cfg.CONF.nscs_authtoken.admin_tenant_name,
-                                  auth_url=cfg.CONF.nscs_authtoken.auth_url,
-                                  service_type="compute")
+        return clients.admin_novaclient(cfg.CONF.nscs_authtoken)
     else:
         insecure = False
         auth_url = url_for(context, 'compute')
@@ -500,14 +573,20 @@ def novaclient(context=None):
         #LOG.debug(context.service_catalog)
         #LOG.debug(auth_url)
         #LOG.debug("##################################################")
-        c = nova_client.Client(context.user_name,
-                               context.auth_token,
-                               project_id=context.tenant_id,
-                               auth_url=auth_url,
-                               insecure=insecure)
-        c.client.auth_token = context.auth_token
-        c.client.management_url = auth_url
-        return c
+
+        def _build():
+            c = nova_client.Client(context.user_name,
+                                   context.auth_token,
+                                   project_id=context.tenant_id,
+                                   auth_url=auth_url,
+                                   insecure=insecure)
+            c.client.auth_token = context.auth_token
+            c.client.management_url = auth_url
+            return c
+
+        key = ('nova', context.user_name, context.tenant_id,
+               context.auth_token, auth_url)
+        return clients.ClientCache.get_instance().get(key, _build)
 
 
 def get_service_from_catalog(catalog, service_type):
@@ -535,6 +614,12 @@ def url_for(context, service_type, admin=False, endpoint_type=None):
 
 
 def crdclient(context=None):
-    c = neutron_client.Client(token=context.auth_token,
-                              endpoint_url=url_for(context, 'network'))
-    return c
+    """Return the cached neutron client of the token of context."""
+    endpoint_url = url_for(context, 'network')
+
+    def _build():
+        return neutron_client.Client(token=context.auth_token,
+                                     endpoint_url=endpoint_url)
+
+    key = ('neutron', context.auth_token, endpoint_url)
+    return clients.ClientCache.get_instance().get(key, _build)
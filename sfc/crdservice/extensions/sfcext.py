@@ -40,9 +40,11 @@ SFC_PLURALS = {
     'chainmaps': 'chainmap',
     'config_handles': 'config_handle',
     'launchs': 'launch',
+    'launch_jobs': 'launch_job',
     'vlanquotas': 'vlanquota',
     'nsdeltas': 'nsdelta',
     'vmscaleouts': 'vmscaleout',
+    'flow_lookups': 'flow_lookup',
 }
 
 SFC_SUB_PLURALS = {
@@ -54,6 +56,25 @@ SFC_SUB_PLURALS = {
     'zones': 'zone',
 }
 
+# Member actions of a collection: {collection: {action: HTTP method}}
+SFC_MEMBER_ACTIONS = {
+    'chains': {'bulk_bypass_rules': 'PUT', 'get_chain_topology': 'GET',
+               'delete_chain_cascade': 'DELETE'},
+    'chainsets': {'bulk_rules': 'PUT', 'conflicts': 'GET',
+                  'delete_chainset_cascade': 'DELETE'},
+    'launch_jobs': {'cancel_launch_job': 'PUT'},
+}
+
+# Sub-resource collections that accept a list of objects in one POST
+SFC_BULK_COLLECTIONS = ('bypass_rules', 'rules')
+
+# Collections listed with limit/marker pagination and sort_key/sort_dir
+# sorting done by the plugin in the database
+SFC_PAGINATED_COLLECTIONS = ('networkfunctions', 'categories', 'vendors',
+                             'appliances', 'chains', 'chainsets', 'chainmaps',
+                             'vlanquotas', 'launch_jobs', 'bypass_rules',
+                             'rules', 'instances', 'zones')
+
 RESOURCE_ATTRIBUTE_MAP = {
     'networkfunctions': {
         'id': {'allow_post': False, 'allow_put': False,
@@ -281,9 +302,44 @@ RESOURCE_ATTRIBUTE_MAP = {
         'chainmap_id': {'allow_post': True, 'allow_put': False,
                         'validate': {'type:regex': attr.UUID_PATTERN},
                         'is_visible': True},
+        'job_id': {'allow_post': False, 'allow_put': False,
+                   'is_visible': True},
+        'status': {'allow_post': False, 'allow_put': False,
+                   'is_visible': True},
         'tenant_id': {'allow_post': True, 'allow_put': False,
                       'is_visible': False},
     },
+    'launch_jobs': {
+        'id': {'allow_post': False, 'allow_put': False,
+               'is_visible': True},
+        'operation': {'allow_post': False, 'allow_put': False,
+                      'is_visible': True},
+        'status': {'allow_post': False, 'allow_put': False,
+                   'is_visible': True},
+        'chainset_id': {'allow_post': False, 'allow_put': False,
+                        'is_visible': True},
+        'chainmap_id': {'allow_post': False, 'allow_put': False,
+                        'is_visible': True},
+        'rule_id': {'allow_post': False, 'allow_put': False,
+                    'is_visible': True},
+        'instance_id': {'allow_post': False, 'allow_put': False,
+                        'is_visible': True},
+        'progress': {'allow_post': False, 'allow_put': False,
+                     'is_visible': True},
+        'error': {'allow_post': False, 'allow_put': False,
+                  'is_visible': True},
+        'created_at': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
+        'started_at': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
+        'finished_at': {'allow_post': False, 'allow_put': False,
+                        'is_visible': True},
+        'elapsed': {'allow_post': False, 'allow_put': False,
+                    'is_visible': True},
+        'tenant_id': {'allow_post': False, 'allow_put': False,
+                      'required_by_policy': True,
+                      'is_visible': True},
+    },
     'vlanquotas': {
         'vlan_start': {'allow_post': True, 'allow_put': True,
                        'default': '', 'is_visible': True},
@@ -313,6 +369,49 @@ RESOURCE_ATTRIBUTE_MAP = {
         'instance_id': {'allow_post': True, 'allow_put': False,
                         'validate': {'type:regex': attr.UUID_PATTERN},
                         'is_visible': True},
+        'job_id': {'allow_post': False, 'allow_put': False,
+                   'is_visible': True},
+        'status': {'allow_post': False, 'allow_put': False,
+                   'is_visible': True},
+        'tenant_id': {'allow_post': True, 'allow_put': False,
+                      'is_visible': False},
+    },
+    'flow_lookups': {
+        'chainset_id': {'allow_post': True, 'allow_put': False,
+                        'validate': {'type:string': None},
+                        'default': '', 'is_visible': True},
+        'src_mac': {'allow_post': True, 'allow_put': False,
+                    'validate': {'type:string': None},
+                    'default': '', 'is_visible': True},
+        'dest_mac': {'allow_post': True, 'allow_put': False,
+                     'validate': {'type:string': None},
+                     'default': '', 'is_visible': True},
+        'eth_value': {'allow_post': True, 'allow_put': False,
+                      'validate': {'type:string': None},
+                      'default': '', 'is_visible': True},
+        'sip': {'allow_post': True, 'allow_put': False,
+                'validate': {'type:string': None},
+                'default': '', 'is_visible': True},
+        'dip': {'allow_post': True, 'allow_put': False,
+                'validate': {'type:string': None},
+                'default': '', 'is_visible': True},
+        'sp': {'allow_post': True, 'allow_put': False,
+               'validate': {'type:string': None},
+               'default': '', 'is_visible': True},
+        'dp': {'allow_post': True, 'allow_put': False,
+               'validate': {'type:string': None},
+               'default': '', 'is_visible': True},
+        'ip_protocol': {'allow_post': True, 'allow_put': False,
+                        'validate': {'type:string': None},
+                        'default': '', 'is_visible': True},
+        'rule_id': {'allow_post': False, 'allow_put': False,
+                    'is_visible': True},
+        'chain_id': {'allow_post': False, 'allow_put': False,
+                     'is_visible': True},
+        'matched_rule_ids': {'allow_post': False, 'allow_put': False,
+                             'is_visible': True},
+        'appliance_maps': {'allow_post': False, 'allow_put': False,
+                           'is_visible': True},
         'tenant_id': {'allow_post': True, 'allow_put': False,
                       'is_visible': False},
     },
@@ -654,12 +753,15 @@ class Sfcext(extensions.ExtensionDescriptor):
                 params = RESOURCE_ATTRIBUTE_MAP[collection_name]
                 path_prefix = constants.COMMON_PREFIXES[constants.SFC]
 
-            member_actions = {}
+            member_actions = SFC_MEMBER_ACTIONS.get(collection_name, {})
+            paginated = collection_name in SFC_PAGINATED_COLLECTIONS
             controller = base.create_resource(collection_name,
                                               resource_name,
                                               plugin, params,
                                               member_actions=member_actions,
-                                              parent=parents)
+                                              parent=parents,
+                                              allow_pagination=paginated,
+                                              allow_sorting=paginated)
 
             resource = extensions.ResourceExtension(
                 collection_name,
@@ -704,11 +806,12 @@ class Sfcext(extensions.ExtensionDescriptor):
                 path_prefix = constants.COMMON_PREFIXES[constants.SFC]
 
             member_actions = {}
-            controller = base.create_resource(collection_name,
-                                              resource_name,
-                                              plugin, params,
-                                              member_actions=member_actions,
-                                              parent=parents)
+            paginated = collection_name in SFC_PAGINATED_COLLECTIONS
+            controller = base.create_resource(
+                collection_name, resource_name, plugin, params,
+                allow_bulk=collection_name in SFC_BULK_COLLECTIONS,
+                allow_pagination=paginated, allow_sorting=paginated,
+                member_actions=member_actions, parent=parents)
 
             resource = extensions.ResourceExtension(
                 collection_name,
@@ -913,6 +1016,18 @@ class SFCPluginBase(ServicePluginBase):
     def create_launch(self, context, launch):
         pass
 
+    @abc.abstractmethod
+    def get_launch_jobs(self, context, filters=None, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def get_launch_job(self, context, id, fields=None):
+        pass
+
+    @abc.abstractmethod
+    def delete_launch_job(self, context, id):
+        pass
+
     @abc.abstractmethod
     def get_vlanquotas(self, context, filters=None, fields=None):
         pass
@@ -936,3 +1051,7 @@ class SFCPluginBase(ServicePluginBase):
     @abc.abstractmethod
     def create_vmscaleout(self, context, vmscaleout):
         pass
+
+    @abc.abstractmethod
+    def create_flow_lookup(self, context, flow_lookup):
+        pass
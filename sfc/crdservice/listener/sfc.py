@@ -13,7 +13,6 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from novaclient.v1_1 import client as nova_client
 from oslo.config import cfg
 import socket
 import json
@@ -23,6 +22,9 @@ from nscs.crdservice.openstack.common import log as logging
 from nscs.crdservice.openstack.common import rpc
 from nscs.crdservice.openstack.common.rpc import dispatcher
 from nscs.crdservice.openstack.common.rpc import proxy
+from sfc.crdservice.common import clients
+from sfc.crdservice.common import readiness
+from sfc.crdservice.common import routing
 
 
 LOG = logging.getLogger(__name__)
@@ -101,10 +103,20 @@ class SFCListener(proxy.RpcProxy):
 	#LOG.debug(_("Message Delta %s\n"), str(foramted_txt))
         if event_type is not None:
             payload = message_data.get('payload', {})
+            if (event_type == 'compute.instance.update' and
+                    payload.get('state') in readiness.READY_STATES):
+                readiness.InstanceReadiness.get_instance().resolve(
+                    payload['instance_id'], payload['state'])
+                if payload.get('host'):
+                    routing.ConfigRoutes.get_instance().set_host(
+                        payload['instance_id'], payload['tenant_id'],
+                        payload['host'])
             if event_type == 'compute.instance.update' and  payload['state'] == 'deleted':
                 host_node = payload['host']
                 instance_id = payload['instance_id']
                 tenant_id = payload['tenant_id']
+                routing.ConfigRoutes.get_instance().forget_instance(
+                    instance_id)
                 if 'metadata' in payload:
                     if ('vmtype' in payload['metadata']) and \
                         (payload['metadata']['vmtype'] == 'service'):
@@ -116,9 +128,5 @@ class SFCListener(proxy.RpcProxy):
 
 
     def novaclient(self):
-        return  nova_client.Client(cfg.CONF.CRDNOVACLIENT.admin_user,
-                                   cfg.CONF.CRDNOVACLIENT.admin_password,
-                                   cfg.CONF.CRDNOVACLIENT.admin_tenant_name,
-                                   auth_url=cfg.CONF.CRDNOVACLIENT.auth_url,
-                                   service_type="compute")
+        return clients.admin_novaclient(cfg.CONF.CRDNOVACLIENT)
     
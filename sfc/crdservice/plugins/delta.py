@@ -12,25 +12,201 @@
 #    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 #    License for the specific language governing permissions and limitations
 #    under the License.
+from nscs.crdservice import context as crd_context
 from nscs.crdservice.openstack.common import log as logging
 from nscs.crdservice.openstack.common import context
 
 from sfc.crdservice.db import delta
 from sfc.crdservice.db import sfc_db
+from sfc.crdservice.dispatcher.ofcontroller import sfc as sfc_dispatcher
 
+from oslo.config import cfg
+
+import bisect
+import eventlet
 import re
 import socket
+import threading
 import time
 
 LOG = logging.getLogger(__name__)
 
+sfc_delta_opts = [
+    cfg.IntOpt('snapshot_page_size', default=500,
+               help=_("Maximum number of objects in one page of the "
+                      "snapshot sent to a bootstrapping consumer")),
+    cfg.IntOpt('snapshot_cache_max_bytes', default=64 * 1024 * 1024,
+               help=_("Approximate memory limit of the snapshot shared by "
+                      "bootstrapping consumers, 0 disables the cache")),
+    cfg.IntOpt('compaction_interval', default=3600,
+               help=_("Seconds between delta compaction runs, 0 disables "
+                      "compaction")),
+    cfg.IntOpt('retention_versions', default=10000,
+               help=_("Number of most recent runtime versions whose delta "
+                      "history is kept as is by the compactor")),
+]
+
+cfg.CONF.register_opts(sfc_delta_opts, "sfc_delta")
+
+# Resources sent to a consumer on bootstrap:
+# (delta table, object id column, live table, dict builder, consumer method,
+#  relationships loaded with the row)
+SNAPSHOT_RESOURCES = (
+    (delta.sfc_appliances_delta, 'appliance_id', sfc_db.SFCAppliance,
+     '_make_appliance_dict', 'create_appliance',
+     ('appliance_vendors', 'appliance_categories')),
+    (delta.sfc_chains_delta, 'chain_id', sfc_db.SFCChain,
+     '_make_chain_dict', 'create_chain', ()),
+    (delta.sfc_chain_appliances_delta, 'chain_appliance_map_id',
+     sfc_db.SFCChainAppliance, '_make_appliance_map_dict',
+     'create_chain_appliance', ('chain_appliance',)),
+    (delta.sfc_chain_bypass_rules_delta, 'chain_bypass_rule_id',
+     sfc_db.SFCChainBypassRule, '_make_chain_bypass_rule_dict',
+     'create_chain_bypass_rules', ()),
+    (delta.sfc_chainsets_delta, 'chainset_id', sfc_db.SFCChainSet,
+     '_make_chainset_dict', 'create_chainsets', ()),
+    (delta.sfc_chainrules_delta, 'chain_rule_id',
+     sfc_db.SFCChainSelectionRule, '_make_chainset_rule_dict',
+     'create_chainrule', ()),
+    (delta.sfc_chainset_zone_delta, 'zone_id', sfc_db.SFCChainsetZone,
+     '_make_chainset_zone_dict', 'create_chainset_zone', ()),
+    (delta.sfc_chainmaps_delta, 'chain_map_id',
+     sfc_db.SFCChainsetNetworkMap, '_make_chainmap_dict',
+     'create_chainmap', ()),
+    (delta.sfc_appliance_instances_delta, 'appliance_instance_id',
+     sfc_db.SFCApplianceInstance, '_make_chain_appliance_map_instance_dict',
+     'create_appliance_instance', ('chain_appliance',)),
+)
+
+
+class SnapshotCache(object):
+    """
+    Bootstrap snapshot shared by every consumer that joins at the same
+    runtime version. When the runtime version moves on, only the objects
+    whose delta rows are newer than the cached version are read again.
+    """
+    def __init__(self, sfcdelta, max_bytes):
+        self.sfcdelta = sfcdelta
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.version = None
+        self.entries = {}
+        self.sequences = []
+        self.size = 0
+        self.oversized_version = None
+        self.stats = {'hits': 0, 'misses': 0, 'builds': 0, 'extends': 0,
+                      'bypasses': 0}
+
+    def get(self, ctx, version, cursor=None, limit=None):
+        """
+        Return the ordered (sequence, create version, message) entries at
+        version after cursor, at most limit of them, or None when the
+        snapshot does not fit in the cache.
+        """
+        if not self.max_bytes:
+            return None
+        with self.lock:
+            if self.version == version:
+                self.stats['hits'] += 1
+            elif self.oversized_version == version:
+                self.stats['bypasses'] += 1
+            else:
+                self.stats['misses'] += 1
+                if self.version is not None and self.version < version:
+                    self._extend(ctx, version)
+                else:
+                    self._build(ctx, version)
+                # Once per runtime version, not once per page
+                LOG.info(_("Snapshot cache at version %(ver)s, %(size)s "
+                           "bytes, stats %(stats)s"),
+                         {'ver': self.version, 'size': self.size,
+                          'stats': self.stats})
+            if self.version != version:
+                return None
+            start = 0
+            if cursor:
+                start = bisect.bisect_right(self.sequences, cursor)
+            stop = None
+            if limit:
+                stop = start + limit
+            return [(sequence,) + self.entries[sequence][:2]
+                    for sequence in self.sequences[start:stop]]
+
+    def _clear(self):
+        self.version = None
+        self.entries = {}
+        self.sequences = []
+        self.size = 0
+
+    def _put(self, sequence, verid, message):
+        entry_size = len(str(message))
+        if sequence in self.entries:
+            self.size -= self.entries[sequence][2]
+        else:
+            bisect.insort(self.sequences, sequence)
+        self.entries[sequence] = (verid, message, entry_size)
+        self.size += entry_size
+
+    def _remove(self, sequence):
+        if sequence in self.entries:
+            self.size -= self.entries.pop(sequence)[2]
+            self.sequences.pop(bisect.bisect_left(self.sequences, sequence))
+
+    def _bypass(self, version):
+        LOG.info(_("Snapshot at version %(ver)s exceeds %(max)s bytes, "
+                   "not cached"), {'ver': version, 'max': self.max_bytes})
+        self.stats['bypasses'] += 1
+        self.oversized_version = version
+        self._clear()
+
+    def _build(self, ctx, version):
+        self.stats['builds'] += 1
+        self._clear()
+        for sequence, verid, message in self.sfcdelta.iter_snapshot(ctx,
+                                                                    version):
+            self._put(sequence, verid, message)
+            if self.size > self.max_bytes:
+                return self._bypass(version)
+        self.version = version
+
+    def _extend(self, ctx, version):
+        if self.sfcdelta.deltadb.get_compaction_horizon(ctx) > self.version:
+            # Deletes below the horizon are gone from the delta tables
+            return self._build(ctx, version)
+        self.stats['extends'] += 1
+        for index in range(len(SNAPSHOT_RESOURCES)):
+            delta_model, id_key, live_model = SNAPSHOT_RESOURCES[index][:3]
+            ids = self.sfcdelta.deltadb.get_changed_object_ids(
+                ctx, delta_model, id_key, self.version)
+            if not ids:
+                continue
+            for id in ids:
+                self._remove(self.sfcdelta.snapshot_sequence(index, id))
+            for sequence, verid, message in self.sfcdelta.iter_snapshot(
+                    ctx, version, resources=[index], ids=ids):
+                self._put(sequence, verid, message)
+            if self.size > self.max_bytes:
+                return self._bypass(version)
+        # Entries read at an older version still carry it in their payload.
+        # Pages handed out earlier hold those messages, so they are copied
+        # rather than changed.
+        for sequence, (verid, message, entry_size) in self.entries.items():
+            if message['payload']['version_id'] != version:
+                message = dict(message, payload=dict(message['payload'],
+                                                     version_id=version))
+                self.entries[sequence] = (verid, message, entry_size)
+        self.version = version
+
+
 class SfcDelta(object):
     """
     Handling Create delta and Get Difference 
     """
     def __init__(self):
-	self.deltadb = delta.SfcDeltaDb()
-	self.db = sfc_db.SFCPluginDb()
+        self.deltadb = delta.SfcDeltaDb()
+        self.db = sfc_db.SFCPluginDb()
+        self.snapshot_cache = SnapshotCache(
+            self, cfg.CONF.sfc_delta.snapshot_cache_max_bytes)
 	
     def create_networkfunctions_delta(self, context, data_dict):
         result_delta = self.deltadb.create_networkfunctions_delta(context, data_dict)
@@ -83,6 +259,17 @@ class SfcDelta(object):
     def create_appliance_instances_delta(self, context, data_dict):
         result_delta = self.deltadb.create_appliance_instances_delta(context, data_dict)
         return result_delta
+
+    def get_runtime_version(self, context):
+        return self.deltadb.get_runtime_version(context)
+
+    def get_changed_chainset_rule_ids(self, context, chainset_id, version,
+                                      until):
+        return self.deltadb.get_changed_chainset_rule_ids(
+            context, chainset_id, version, until)
+
+    def delta_batch(self, context, tenant_id):
+        return self.deltadb.delta_batch(context, tenant_id)
     
     ####Delta############
     def get_networkfunctions_deltas(self, context, filters=None, fields=None):
@@ -133,217 +320,163 @@ class SfcDelta(object):
     ####Delta############
     
     def sfc_init(self, ctx, version, hostname):
-        delta = {}
+        """
+        Return the messages that bring a consumer at version up to date,
+        as an ordered list of (version, message) pairs; the messages of a
+        bulk call share one version.
+        """
+        delta = []
         if version > 0:
-            pass
+            if self._can_resync(ctx, version):
+                delta = self.deltadb.get_deltas_since(
+                    ctx, version, self._get_current_version(ctx))
+            else:
+                LOG.debug(_("Consumer %(host)s at version %(ver)s can not "
+                            "be resynced, sending snapshot"),
+                          {'host': hostname, 'ver': version})
+                delta = self._get_snapshot(ctx)
 
         elif version == 0:
-            #Network Delta
-
-            fields = []
-            fields = ['runtime_version']
-            current_version = 0
-            ver = self.db.get_versions(ctx, filters=None, fields=fields)
-            if ver:
-                current_version = max(ver)['runtime_version']
-                LOG.debug(_("Runtime Version = %s"), str(current_version))
-            #current_version = 100
-
-            #NWApplicances Delta
-            nwapp_diff = self.db.get_appliances(ctx, filters=None, fields=None)
-            for nwapp in nwapp_diff:
-                fil = {}
-                id = nwapp['id']
-                fil['appliance_id'] = [id]
-                fil['operation'] = ['create']
-                CompDelta = self.deltadb.get_appliances_deltas(ctx, fil)
-                arr = sorted(CompDelta, key=lambda t: t['version_id'],
-                             reverse=True)
-                verid = arr[0]['version_id']
-                nwapp.update(
-                    {'appliance_id': nwapp['id'], 'operation': 'create',
-                     'version_id': current_version})
-                nwapp_message = {}
-                nwapp_message.update(
-                    {'method': 'create_appliance', 'payload': nwapp})
-                delta[verid] = nwapp_message
-
-
-            #NWCHains Delta
-            nwchain_diff = self.db.get_chains(ctx, filters=None, fields=None)
-            for nwchain in nwchain_diff:
-                fil = {}
-                id = nwchain['id']
-                fil['chain_id'] = [id]
-                fil['operation'] = ['create']
-                CompDelta = self.deltadb.get_chains_deltas(ctx, fil)
-                arr = sorted(CompDelta, key=lambda t: t['version_id'],
-                             reverse=True)
-                verid = arr[0]['version_id']
-                nwchain.update(
-                    {'chain_id': nwchain['id'], 'operation': 'create',
-                     'version_id': current_version})
-                nwchain_message = {}
-                nwchain_message.update(
-                    {'method': 'create_chain', 'payload': nwchain})
-                delta[verid] = nwchain_message
-
-
-            #NWAPPChains Delta
-            nwchainapp_diff = self.db.get_chain_appliance_maps(ctx,
-                                                               filters=None,
-                                                               fields=None)
-            for nwchainapp in nwchainapp_diff:
-                fil = {}
-                id = nwchainapp['id']
-                fil['chain_appliance_map_id'] = [id]
-                fil['operation'] = ['create']
-                CompDelta = self.deltadb.get_chain_appliances_deltas(ctx, fil)
-                arr = sorted(CompDelta, key=lambda t: t['version_id'],
-                             reverse=True)
-                verid = arr[0]['version_id']
-
-                nwchainapp.update({'chain_appliance_map_id': nwchainapp['id'],
-                                   'operation': 'create',
-                                   'version_id': current_version})
-                nwchainapp_message = {}
-                nwchainapp_message.update({'method': 'create_chain_appliance',
-                                           'payload': nwchainapp})
-                delta[verid] = nwchainapp_message
-
-
-            #NWbypassrule Delta
-            nwbypassrule_diff = self.db.get_chain_bypass_rules(ctx,
-                                                               filters=None,
-                                                               fields=None)
-            for nwbypassrule in nwbypassrule_diff:
-                fil = {}
-                id = nwbypassrule['id']
-                fil['chain_bypass_rule_id'] = [id]
-                fil['operation'] = ['create']
-                CompDelta = self.deltadb.get_chain_bypass_rules_deltas(ctx, fil)
-                arr = sorted(CompDelta, key=lambda t: t['version_id'],
-                             reverse=True)
-                verid = arr[0]['version_id']
-
-                nwbypassrule.update(
-                    {'chain_bypass_rule_id': nwbypassrule['id'],
-                     'operation': 'create', 'version_id': current_version})
-                nwbypassrule_message = {}
-                nwbypassrule_message.update(
-                    {'method': 'create_chain_bypass_rules',
-                     'payload': nwbypassrule})
-                delta[verid] = nwbypassrule_message
-
-
-            #NWchainset Delta
-            nwchainset_diff = self.db.get_chainsets(ctx, filters=None,
-                                                    fields=None)
-            for nwchainset in nwchainset_diff:
-                fil = {}
-                id = nwchainset['id']
-                fil['chainset_id'] = [id]
-                fil['operation'] = ['create']
-                CompDelta = self.deltadb.get_chainsets_deltas(ctx, fil)
-                arr = sorted(CompDelta, key=lambda t: t['version_id'],
-                             reverse=True)
-                verid = arr[0]['version_id']
-                nwchainset.update(
-                    {'chainset_id': nwchainset['id'], 'operation': 'create',
-                     'version_id': current_version})
-                nwchainset_message = {}
-                nwchainset_message.update(
-                    {'method': 'create_chainsets', 'payload': nwchainset})
-                delta[verid] = nwchainset_message
-
-
-            #NWchainrule Delta
-            nwchainrule_diff = self.db.get_chainset_rules(ctx, filters=None,
-                                                          fields=None)
-            for nwchainrule in nwchainrule_diff:
-                fil = {}
-                id = nwchainrule['id']
-                fil['chain_rule_id'] = [id]
-                fil['operation'] = ['create']
-                CompDelta = self.deltadb.get_chainrules_deltas(ctx, fil)
-                arr = sorted(CompDelta, key=lambda t: t['version_id'],
-                             reverse=True)
-                verid = arr[0]['version_id']
-                nwchainrule.update(
-                    {'chain_rule_id': nwchainrule['id'], 'operation': 'create',
-                     'version_id': current_version})
-                nwchainrule_message = {}
-                nwchainrule_message.update(
-                    {'method': 'create_chainrule', 'payload': nwchainrule})
-                delta[verid] = nwchainrule_message
-
-
-	    #Chainset Zone delta
-            zones_diff = self.db.get_chainset_zones(ctx, filters=None,
-                                                          fields=None)
-            for zone in zones_diff:
-                fil = {}
-                id = zone['id']
-                fil['zone_id'] = [id]
-                fil['operation'] = ['create']
-                CompDelta = self.deltadb.get_chainset_zones_deltas(ctx, fil)
-                arr = sorted(CompDelta, key=lambda t: t['version_id'],
-                             reverse=True)
-                verid = arr[0]['version_id']
-                zone.update(
-                    {'zone_id': zone['id'], 'operation': 'create',
-                     'version_id': current_version})
-                zone_message = {}
-                zone_message.update(
-                    {'method': 'create_chainset_zone', 'payload': zone})
-                delta[verid] = zone_message
-		
-            #NWchainmap Delta
-            nwchainmap_diff = self.db.get_chainmaps(ctx, filters=None,
-                                                    fields=None)
-            for nwchainmap in nwchainmap_diff:
-                fil = {}
-                id = nwchainmap['id']
-                fil['chain_map_id'] = [id]
-                fil['operation'] = ['create']
-                CompDelta = self.deltadb.get_chainmaps_deltas(ctx, fil)
-                arr = sorted(CompDelta, key=lambda t: t['version_id'],
-                             reverse=True)
-		LOG.debug(_("ARRAYTESTETTETETETET = %s"), arr)
-                verid = arr[0]['version_id']
-                nwchainmap.update(
-                    {'chain_map_id': nwchainmap['id'], 'operation': 'create',
-                     'version_id': current_version})
-                nwchainmap_message = {}
-                nwchainmap_message.update(
-                    {'method': 'create_chainmap', 'payload': nwchainmap})
-                delta[verid] = nwchainmap_message
-
-
-            #Appliance Instance Delta
-            app_instance_diff = self.db.get_chain_appliance_map_instances(ctx, filters=None,
-                                                 fields=None)
-	    LOG.debug(_("APP INSTANCES = %s"), str(app_instance_diff))
-            for app_instance in app_instance_diff:
-                fil = {}
-                id = app_instance['id']
-                chain_app_id = app_instance['appliance_map_id']
-                chain_app_details = self.db.get_chain_appliance_map(ctx, chain_app_id)
-                fil['appliance_instance_id'] = [id]
-                fil['operation'] = ['create']
-                CompDelta = self.deltadb.get_appliance_instances_deltas(ctx, fil)
-                arr = sorted(CompDelta, key=lambda t: t['version_id'],
-                             reverse=True)
-		LOG.debug(_("ARRAY = %s"), arr)
-		LOG.debug(_("Version-ID = %s"), str(arr[0]['version_id']))
-                verid = arr[0]['version_id']
-                app_instance.update(
-                    {'appliance_instance_id': app_instance['id'], 'operation': 'create',
-                     'version_id': current_version, 'chain_id': chain_app_details['chain_id']})
-                app_instance_message = {}
-                app_instance_message.update(
-                    {'method': 'create_appliance_instance', 'payload': app_instance})
-                delta[verid] = app_instance_message
-
-        LOG.debug(_("Delta to consumer from SFC = %s"), str(delta))
+            delta = self._get_snapshot(ctx)
+
+        LOG.debug(_("Delta to consumer from SFC = %s entries"), len(delta))
         return delta
+
+    def _get_current_version(self, ctx):
+        current_version = self.deltadb.get_runtime_version(ctx)
+        LOG.debug(_("Runtime Version = %s"), str(current_version))
+        return current_version
+
+    def _can_resync(self, ctx, version):
+        """
+        A consumer can be brought up to date from the delta tables unless its
+        version has been compacted away or was never handed out.
+        """
+        return (self.deltadb.get_compaction_horizon(ctx) <= version <=
+                self._get_current_version(ctx))
+
+    def start_publisher(self):
+        sfc_dispatcher.SfcBatchDispatcher.get_instance().start(self.deltadb)
+
+    def start_compactor(self):
+        if cfg.CONF.sfc_delta.compaction_interval > 0:
+            eventlet.spawn_n(self._compaction_loop)
+
+    def _compaction_loop(self):
+        while True:
+            eventlet.sleep(cfg.CONF.sfc_delta.compaction_interval)
+            try:
+                self.compact()
+            except Exception, msg:
+                LOG.error(_("Delta compaction failed: %s"), msg)
+
+    def compact(self):
+        """
+        Compact the delta tables up to the newest runtime version outside
+        the retention window. Every API worker runs the loop; the lease
+        taken in the database lets one of them compact at a time.
+        """
+        ctx = crd_context.Context('crd', 'crd', is_admin=True)
+        low_water = (self._get_current_version(ctx) -
+                     cfg.CONF.sfc_delta.retention_versions)
+        if low_water > 0:
+            self.deltadb.compact_deltas(
+                ctx, low_water, cfg.CONF.sfc_delta.compaction_interval)
+
+    def _get_snapshot(self, ctx):
+        """
+        Build the bootstrap delta for a consumer that does not page: every
+        live object as a create message, paired with the version of its
+        newest create delta, in snapshot order.
+        """
+        current_version = self._get_current_version(ctx)
+        entries = self.snapshot_cache.get(ctx, current_version)
+        if entries is None:
+            entries = self.iter_snapshot(ctx, current_version)
+        return [(verid, message) for sequence, verid, message in entries]
+
+    @staticmethod
+    def snapshot_sequence(index, id):
+        return '%02d:%s' % (index, id)
+
+    def iter_snapshot(self, ctx, version, cursor=None, page_size=None,
+                      resources=None, ids=None):
+        """
+        Lazily yield (sequence, create version, message) for every live
+        object after cursor, reading page_size rows per query. Sequence
+        keys are unique and sort in the order they are yielded. resources
+        and ids restrict the walk to some resource indexes and object ids.
+        """
+        page_size = page_size or cfg.CONF.sfc_delta.snapshot_page_size
+        resource, marker = 0, None
+        if cursor:
+            resource, marker = cursor.split(':', 1)
+            resource = int(resource)
+        for index in range(resource, len(SNAPSHOT_RESOURCES)):
+            if resources is not None and index not in resources:
+                continue
+            (delta_model, id_key, live_model, make_dict, method,
+             eager) = SNAPSHOT_RESOURCES[index]
+            make_dict = getattr(self.db, make_dict)
+            while True:
+                rows = self.deltadb.get_snapshot_rows(ctx, delta_model, id_key,
+                                                      live_model, eager=eager,
+                                                      marker=marker,
+                                                      limit=page_size,
+                                                      ids=ids)
+                for row, verid in rows:
+                    payload = make_dict(row)
+                    payload.update({id_key: payload['id'],
+                                    'operation': 'create',
+                                    'version_id': version})
+                    if method == 'create_appliance_instance':
+                        payload['chain_id'] = \
+                            row['chain_appliance']['chain_id']
+                    yield (self.snapshot_sequence(index, payload['id']), verid,
+                           {'method': method, 'payload': payload})
+                if len(rows) < page_size:
+                    break
+                marker = rows[-1][0]['id']
+            marker = None
+
+    def get_object_message(self, ctx, method, id):
+        """
+        Return the snapshot message of one live object, by the consumer
+        method creating it, or None if it does not exist.
+        """
+        for index in range(len(SNAPSHOT_RESOURCES)):
+            if SNAPSHOT_RESOURCES[index][4] == method:
+                for sequence, verid, message in self.iter_snapshot(
+                        ctx, self._get_current_version(ctx),
+                        resources=[index], ids=[id]):
+                    return message
+        return None
+
+    def get_snapshot_page(self, ctx, cursor=None, version=None,
+                          page_size=None):
+        """
+        Return one page of the bootstrap snapshot. The first page (no
+        cursor) fixes the snapshot version; the consumer passes it back
+        with the cursor of the previous page until next is None, then
+        resyncs from that version to pick up changes made meanwhile.
+        Pages may come from a newer state than version, which that resync
+        reconciles.
+        """
+        page_size = min(page_size or cfg.CONF.sfc_delta.snapshot_page_size,
+                        cfg.CONF.sfc_delta.snapshot_page_size)
+        current_version = self._get_current_version(ctx)
+        if not cursor or version is None:
+            version = current_version
+        page = self.snapshot_cache.get(ctx, current_version, cursor,
+                                       page_size)
+        if page is None:
+            page = []
+            for entry in self.iter_snapshot(ctx, version, cursor, page_size):
+                page.append(entry)
+                if len(page) == page_size:
+                    break
+        entries = [[sequence, message] for sequence, verid, message in page]
+        next_cursor = None
+        if len(entries) == page_size:
+            next_cursor = entries[-1][0]
+        return {'version': version, 'entries': entries, 'next': next_cursor}
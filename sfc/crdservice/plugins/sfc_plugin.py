@@ -13,12 +13,27 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+import errno
+import os
+import socket
+
+import eventlet
+from eventlet import queue
+from oslo.config import cfg
+
+from nscs.crdservice import context as crd_context
+from nscs.crdservice.api.v2 import attributes as attr
 from nscs.crdservice.db import api as db_api
 from nscs.crdservice.openstack.common import log as logging
 from nscs.crdservice.openstack.common.gettextutils import _
+from sfc.crdservice.db import migration
+from sfc.crdservice.db import rule_match
 from sfc.crdservice.db import sfc_db
+from sfc.crdservice.extensions import sfcext
 from sfc.crdservice.extensions.sfcext import SFCPluginBase
 from sfc.crdservice.common import constants
+from sfc.crdservice.common import rule_index
 from sfc.crdservice.drivers.fsl_driver import SFCDriver
 from sfc.crdservice.listener.sfc import SFCListener
 from sfc.crdservice.plugins import delta
@@ -26,6 +41,32 @@ from sfc.crdservice.common import exceptions as sfc_exc
 from nscs.crdservice.common import exceptions
 LOG = logging.getLogger(__name__)
 
+sfc_rule_opts = [
+    cfg.StrOpt('rule_conflict_policy', default='warn',
+               help=_("What to do with a selection rule that duplicates, "
+                      "shadows or overlaps another rule of its chainset: "
+                      "ignore, warn or reject")),
+]
+
+cfg.CONF.register_opts(sfc_rule_opts, "sfc_rules")
+
+sfc_job_opts = [
+    cfg.IntOpt('launch_job_workers', default=4,
+               help=_("Number of launch and scale-out jobs an API worker "
+                      "runs at the same time; further jobs stay pending")),
+]
+
+cfg.CONF.register_opts(sfc_job_opts, "sfc_driver")
+
+sfc_stats_opts = [
+    cfg.IntOpt('stats_log_interval', default=300,
+               help=_("Seconds between two logs of the delta stats of an "
+                      "API worker, such as the updates that wrote no delta; "
+                      "0 disables them")),
+]
+
+cfg.CONF.register_opts(sfc_stats_opts, "sfc_delta")
+
 
 class SFCPlugin(SFCPluginBase, SFCListener):
 
@@ -34,20 +75,178 @@ class SFCPlugin(SFCPluginBase, SFCListener):
     DB related work is implemented in class SFCPluginDb
     """
     supported_extension_aliases = ["sfc"]
+    __native_bulk_support = True
+    __native_pagination_support = True
+    __native_sorting_support = True
 
     def __init__(self):
         self.db = sfc_db.SFCPluginDb()
 	self.sfcdelta = delta.SfcDelta()
         self.driver = SFCDriver.get_instance()
+        self.rule_indexes = {}
+        self.stats = {'suppressed_updates': 0}
+        self.launch_jobs = queue.LightQueue()
         db_api.register_models()
+        migration.check_schema()
+        self._fail_orphaned_launch_jobs()
+        for i in range(cfg.CONF.sfc_driver.launch_job_workers):
+            eventlet.spawn_n(self._launch_job_worker)
+        self.sfcdelta.start_publisher()
+        self.sfcdelta.start_compactor()
+        if cfg.CONF.sfc_delta.stats_log_interval > 0:
+            eventlet.spawn_n(self._stats_loop)
         super(SFCPlugin, self).__init__()
 
+    def _stats_loop(self):
+        """Log the delta stats of this worker every stats_log_interval."""
+        while True:
+            eventlet.sleep(cfg.CONF.sfc_delta.stats_log_interval)
+            LOG.info(_("SFC plugin stats %s"), self.stats)
+
     def get_plugin_type(self):
         return constants.SFC
 
     def get_plugin_description(self):
         return "Crd Network Service Plugin"
 
+    @staticmethod
+    def _changed_fields(old, new):
+        """Return the sorted names of the fields an update changed."""
+        return sorted(field for field in old
+                      if field in new and new[field] != old[field])
+
+    def _suppress_update(self, collection, old, new):
+        """
+        Return whether an update left every field of the object as it
+        was. Such an update writes no delta, so re-PUTs of unchanged
+        objects cost no runtime version, delta row or consumer fanout.
+        """
+        if self._changed_fields(old, new):
+            return False
+        self.stats['suppressed_updates'] += 1
+        LOG.debug(_("Suppressed no-op update of %(collection)s %(id)s, "
+                    "stats %(stats)s"),
+                  {'collection': collection, 'id': new.get('id'),
+                   'stats': self.stats})
+        return True
+
+    @staticmethod
+    def _bulk_item(collection, item, defaults):
+        """
+        Validate a rule given to a bulk call and, with defaults, fill in
+        the defaults the API fills in for a single POST.
+        """
+        params = sfcext.SUB_RESOURCE_ATTRIBUTE_MAP[collection]['parameters']
+        item = dict(item)
+        for name, spec in params.iteritems():
+            if name not in item:
+                if defaults and spec.get('allow_post') and 'default' in spec:
+                    item[name] = spec['default']
+                continue
+            for rule, data in (spec.get('validate') or {}).iteritems():
+                msg = attr.validators[rule](item[name], data)
+                if msg:
+                    raise exceptions.InvalidInput(error_message=msg)
+        return item
+
+    def _bulk_rules(self, context, parent_id, body, collection, resource,
+                    create, update, delete):
+        """
+        Create, update and delete the rules listed in body in one
+        transaction. Their deltas share one runtime version and reach the
+        consumers as a single batch. Returns the created and updated rules
+        and the deleted ids, in request order.
+        """
+        result = {'create': [], 'update': [], 'delete': []}
+        try:
+            with context.session.begin(subtransactions=True):
+                with self.sfcdelta.delta_batch(context, context.tenant_id):
+                    for item in body.get('create') or []:
+                        item = self._bulk_item(collection, item, True)
+                        result['create'].append(
+                            create(context, {resource: item}, parent_id))
+                    for item in body.get('update') or []:
+                        item = self._bulk_item(collection, item, False)
+                        rule_id = item.pop('id')
+                        result['update'].append(update(
+                            context, rule_id, parent_id, {resource: item}))
+                    for rule_id in body.get('delete') or []:
+                        delete(context, rule_id, parent_id)
+                        result['delete'].append(rule_id)
+        except Exception:
+            # The rule index may hold changes that were rolled back.
+            self.rule_indexes.pop(parent_id, None)
+            raise
+        return result
+
+    def _rule_index(self, context, chainset_id):
+        """
+        Return the rule index of a chainset, built on first use. Other API
+        workers change rules too, so before each use the index takes in
+        the rules whose deltas are newer than its version, up to the
+        committed runtime version.
+        """
+        admin = context.elevated()
+        version = self.sfcdelta.get_runtime_version(admin)
+        index = self.rule_indexes.get(chainset_id)
+        if index is None:
+            index = rule_index.RuleIndex()
+            for rule in self.db.get_chainset_rules(
+                    admin, filters={'chainset_id': [chainset_id]}):
+                index.add(rule)
+            self.rule_indexes[chainset_id] = index
+        elif index.version < version:
+            changed = self.sfcdelta.get_changed_chainset_rule_ids(
+                admin, chainset_id, index.version, version)
+            if changed:
+                rules = dict((rule['id'], rule) for rule in
+                             self.db.get_chainset_rules(
+                                 admin, filters={'id': changed}))
+                for rule_id in changed:
+                    if rule_id in rules:
+                        index.add(rules[rule_id])
+                    else:
+                        index.remove(rule_id)
+        index.version = max(index.version, version)
+        return index
+
+    def _check_rule_conflicts(self, context, chainset_id, rule):
+        """
+        Apply rule_conflict_policy to the conflicts of rule, created or
+        updated, with the other selection rules of its chainset.
+        """
+        policy = cfg.CONF.sfc_rules.rule_conflict_policy
+        if policy == 'ignore':
+            return
+        rule = dict(rule, **rule_match.typed_match(rule))
+        conflicts = self._rule_index(context, chainset_id).conflicts(rule)
+        if not conflicts:
+            return
+        conflicts = ', '.join(
+            '%s %s' % (conflict['type'],
+                       conflict['conflicting_rule_id']
+                       if conflict['rule_id'] == rule.get('id')
+                       else conflict['rule_id'])
+            for conflict in conflicts)
+        if policy == 'reject':
+            raise sfc_exc.ChainsetRuleConflict(name=rule.get('name'),
+                                               chainset_id=chainset_id,
+                                               conflicts=conflicts)
+        LOG.warning(_("Rule %(name)s conflicts with rules of chainset "
+                      "%(chainset_id)s: %(conflicts)s"),
+                    {'name': rule.get('name'), 'chainset_id': chainset_id,
+                     'conflicts': conflicts})
+
+    def _index_rule(self, chainset_id, rule=None, rule_id=None):
+        """Add, replace or remove a rule in its chainset index, if built."""
+        index = self.rule_indexes.get(chainset_id)
+        if index is None:
+            return
+        if rule is None:
+            index.remove(rule_id)
+        else:
+            index.add(rule)
+
     @staticmethod
     def _is_pending(obj):
         return obj['status'] in [constants.PENDING_CREATE,
@@ -66,10 +265,13 @@ class SFCPlugin(SFCPluginBase, SFCListener):
     def update_networkfunction(self, context, networkfunction_id,
                                networkfunction):
         # LOG.debug(_('Update networkfunction %s'), networkfunction_id)
+        old = self.db.get_networkfunction(context, networkfunction_id)
         v = self.db.update_networkfunction(context, networkfunction_id,
                                                networkfunction)
 	data = v
         v.update({'operation' : 'update'})
+        if self._suppress_update('networkfunctions', old, data):
+            return data
         delta={}
         delta.update({'networkfunctions_delta':v})
         result_delta = self.sfcdelta.create_networkfunctions_delta(context,delta)
@@ -89,9 +291,13 @@ class SFCPlugin(SFCPluginBase, SFCListener):
         return self.db.get_networkfunction(context, networkfunction_id,
                                            fields)
 
-    def get_networkfunctions(self, context, filters=None, fields=None):
+    def get_networkfunctions(self, context, filters=None, fields=None,
+                             sorts=None, limit=None, marker=None,
+                             page_reverse=False):
         # LOG.debug(_('Get networkfunctions'))
-        return self.db.get_networkfunctions(context, filters, fields)
+        return self.db.get_networkfunctions(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
 
     def create_config_handle(self, context, config_handle):
         v = self.db.create_config_handle(context, config_handle)
@@ -104,10 +310,13 @@ class SFCPlugin(SFCPluginBase, SFCListener):
 
     def update_config_handle(self, context, config_handle_id, config_handle):
         # LOG.debug(_('Update config_handle %s'), config_handle_id)
+        old = self.db.get_config_handle(context, config_handle_id)
         v = self.db.update_config_handle(context, config_handle_id,
                                              config_handle)
 	data = v
         v.update({'operation' : 'update'})
+        if self._suppress_update('config_handles', old, data):
+            return data
         delta={}
         delta.update({'config_handles_delta':v})
         result_delta = self.sfcdelta.create_config_handles_delta(context,delta)
@@ -140,9 +349,12 @@ class SFCPlugin(SFCPluginBase, SFCListener):
         return data
 
     def update_category(self, context, category_id, category):
+        old = self.db.get_category(context, category_id)
         v = self.db.update_category(context, category_id, category)
 	data = v
         v.update({'operation' : 'update'})
+        if self._suppress_update('categories', old, data):
+            return data
         delta={}
         delta.update({'categories_delta':v})
         result_delta = self.sfcdelta.create_categories_delta(context,delta)
@@ -160,9 +372,13 @@ class SFCPlugin(SFCPluginBase, SFCListener):
         # LOG.debug(_('Get category %s'), category_id)
         return self.db.get_category(context, category_id, fields)
 
-    def get_categories(self, context, filters=None, fields=None):
+    def get_categories(self, context, filters=None, fields=None,
+                       sorts=None, limit=None, marker=None,
+                       page_reverse=False):
         # LOG.debug(_('Get categories'))
-        return self.db.get_categories(context, filters, fields)
+        return self.db.get_categories(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
 
     def create_category_nf_map(self, context, nf_map, category_id):
         v = self.db.create_category_networkfunction(context, nf_map,
@@ -205,9 +421,12 @@ class SFCPlugin(SFCPluginBase, SFCListener):
 
     def update_vendor(self, context, vendor_id, vendor):
         # LOG.debug(_('Update vendor %s'), vendor_id)
+        old = self.db.get_vendor(context, vendor_id)
         v = self.db.update_vendor(context, vendor_id, vendor)
 	data = v
         v.update({'operation' : 'update'})
+        if self._suppress_update('vendors', old, data):
+            return data
         delta={}
         delta.update({'vendors_delta':v})
         result_delta = self.sfcdelta.create_vendors_delta(context,delta)
@@ -226,9 +445,13 @@ class SFCPlugin(SFCPluginBase, SFCListener):
         # LOG.debug(_('Get vendor %s'), vendor_id)
         return self.db.get_vendor(context, vendor_id, fields)
 
-    def get_vendors(self, context, filters=None, fields=None):
+    def get_vendors(self, context, filters=None, fields=None,
+                    sorts=None, limit=None, marker=None,
+                    page_reverse=False):
         # LOG.debug(_('Get vendors'))
-        return self.db.get_vendors(context, filters, fields)
+        return self.db.get_vendors(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
 
     def create_appliance(self, context, appliance):
         v = self.db.create_appliance(context, appliance)
@@ -241,12 +464,18 @@ class SFCPlugin(SFCPluginBase, SFCListener):
 
     def update_appliance(self, context, appliance_id, appliance):
         # LOG.debug(_('Update appliance %s'), appliance_id)
-        v = self.db.update_appliance(context, appliance_id, appliance)
-	data = v
-        v.update({'operation' : 'update'})
-        delta={}
-        delta.update({'appliances_delta':v})
-        result_delta = self.sfcdelta.create_appliances_delta(context,delta)
+        with context.session.begin(subtransactions=True):
+            old = self.db.get_for_update(context, 'appliance', appliance_id)
+            v = self.db.update_appliance(context, appliance_id, appliance)
+            data = v
+            v.update({'operation' : 'update'})
+            if self._suppress_update('appliances', old, data):
+                return data
+            delta={}
+            delta.update({'appliances_delta': dict(
+                v, changed_fields=self._changed_fields(old, data))})
+            result_delta = self.sfcdelta.create_appliances_delta(context,
+                                                                 delta)
         return data
 
     def delete_appliance(self, context, appliance_id):
@@ -263,9 +492,13 @@ class SFCPlugin(SFCPluginBase, SFCListener):
         # LOG.debug(_('Get appliance %s'), appliance_id)
         return self.db.get_appliance(context, appliance_id, fields)
 
-    def get_appliances(self, context, filters=None, fields=None):
+    def get_appliances(self, context, filters=None, fields=None,
+                       sorts=None, limit=None, marker=None,
+                       page_reverse=False):
         # LOG.debug(_('Get appliances'))
-        return self.db.get_appliances(context, filters, fields)
+        return self.db.get_appliances(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
 
     def create_chain(self, context, chain):
         v = self.db.create_chain(context, chain)
@@ -278,12 +511,17 @@ class SFCPlugin(SFCPluginBase, SFCListener):
 
     def update_chain(self, context, chain_id, chain):
         # LOG.debug(_('Update chain %s'), chain_id)
-        v = self.db.update_chain(context, chain_id, chain)
-	data = v
-        v.update({'operation' : 'update'})
-        delta={}
-        delta.update({'chains_delta':v})
-        result_delta = self.sfcdelta.create_chains_delta(context,delta)
+        with context.session.begin(subtransactions=True):
+            old = self.db.get_for_update(context, 'chain', chain_id)
+            v = self.db.update_chain(context, chain_id, chain)
+            data = v
+            v.update({'operation' : 'update'})
+            if self._suppress_update('chains', old, data):
+                return data
+            delta={}
+            delta.update({'chains_delta': dict(
+                v, changed_fields=self._changed_fields(old, data))})
+            result_delta = self.sfcdelta.create_chains_delta(context,delta)
         return data
 
     def delete_chain(self, context, chain_id):
@@ -304,13 +542,69 @@ class SFCPlugin(SFCPluginBase, SFCListener):
 	    delta.update({'chains_delta':v})
 	    result_delta = self.sfcdelta.create_chains_delta(context,delta)
 
+    def delete_chain_cascade(self, context, chain_id):
+        """
+        Delete a chain with the selection rules steering to it, its bypass
+        rules, appliance maps and their appliance instances, children
+        first, in one transaction whose deltas reach the consumers as one
+        batch. The VLANs of the instances are released with them; their
+        nova servers are deleted in the background once the transaction
+        has committed.
+        """
+        topology = self.db.get_chain_topology(context, chain_id)
+        filters = {'chain_id': [chain_id]}
+        selection_rules = self.db.get_chainset_rules(context, filters=filters)
+        bypass_rules = self.db.get_chain_bypass_rules(context,
+                                                      filters=filters)
+        instances = []
+        try:
+            with context.session.begin(subtransactions=True):
+                with self.sfcdelta.delta_batch(context, context.tenant_id):
+                    for rule in selection_rules:
+                        self.delete_chainset_rule(context, rule['id'],
+                                                  rule['chainset_id'])
+                    for rule in bypass_rules:
+                        self.delete_chain_bypass_rule(context, rule['id'],
+                                                      chain_id)
+                    for appliance_map in topology['appliance_maps']:
+                        for instance in appliance_map['instances']:
+                            self.db.delete_chain_appliance_map_instance(
+                                context, instance['id'])
+                            self.sfcdelta.create_appliance_instances_delta(
+                                context, {'appliance_instances_delta': dict(
+                                    instance, operation='delete')})
+                            instances.append(instance)
+                        self.delete_chain_appliance(
+                            context, appliance_map['appliance_id'], chain_id)
+                    self.delete_chain(context, chain_id)
+        except Exception:
+            # The rule indexes may hold changes that were rolled back.
+            for rule in selection_rules:
+                self.rule_indexes.pop(rule['chainset_id'], None)
+            raise
+        instance_uuids = [instance['instance_uuid'] for instance in instances
+                          if instance['instance_uuid']]
+        if instance_uuids:
+            eventlet.spawn_n(self.driver.delete_instances, context,
+                             instance_uuids)
+        return {'chain_id': chain_id,
+                'selection_rules': [rule['id'] for rule in selection_rules],
+                'bypass_rules': [rule['id'] for rule in bypass_rules],
+                'appliance_maps': [appliance_map['id'] for appliance_map
+                                   in topology['appliance_maps']],
+                'instances': [instance['id'] for instance in instances]}
+
     def get_chain(self, context, chain_id, fields=None):
         # LOG.debug(_('Get chain %s'), chain_id)
         return self.db.get_chain(context, chain_id, fields)
 
-    def get_chains(self, context, filters=None, fields=None):
+    def get_chains(self, context, filters=None, fields=None,
+                   sorts=None, limit=None, marker=None,
+                   page_reverse=False):
         # LOG.debug(_('Get chains'))
-        return self.db.get_chains(context, filters, fields)
+        return self.db.get_chains(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
 
     def create_chain_appliance(self, context, appliance, chain_id):
         v = self.db.create_chain_appliance_map(context, appliance,
@@ -325,13 +619,20 @@ class SFCPlugin(SFCPluginBase, SFCListener):
     def update_chain_appliance(self, context, appliance_map_id, chain_id,
                                    appliance_map):
         # LOG.debug(_('Update appliance_map %s'), appliance_map_id)
-        v = self.db.update_chain_appliance_map(context, appliance_map_id,
-                                                   chain_id, appliance_map)
-	data = v
-        v.update({'operation' : 'update'})
-        delta={}
-        delta.update({'chain_appliances_delta':v})
-        result_delta = self.sfcdelta.create_chain_appliances_delta(context,delta)
+        with context.session.begin(subtransactions=True):
+            old = self.db.get_for_update(context, 'appliance_map',
+                                         appliance_map_id)
+            v = self.db.update_chain_appliance_map(
+                context, appliance_map_id, chain_id, appliance_map)
+            data = v
+            v.update({'operation' : 'update'})
+            if self._suppress_update('chain_appliances', old, data):
+                return data
+            delta={}
+            delta.update({'chain_appliances_delta': dict(
+                v, changed_fields=self._changed_fields(old, data))})
+            result_delta = self.sfcdelta.create_chain_appliances_delta(
+                context, delta)
         return data
 
     def delete_chain_appliance(self, context, appliance_id, chain_id):
@@ -367,11 +668,14 @@ class SFCPlugin(SFCPluginBase, SFCListener):
 	
 
     def get_chain_appliances(self, context, filters=None, fields=None,
-                                 chain_id=None):
+                             chain_id=None, sorts=None, limit=None,
+                             marker=None, page_reverse=False):
         # LOG.debug(_('Get appliance_maps'))
 	if chain_id:
 	    filters['chain_id'] = [chain_id]
-        return self.db.get_chain_appliance_maps(context, filters, fields)
+        return self.db.get_chain_appliance_maps(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
 
     def create_chain_bypass_rule(self, context, bypass_rule, chain_id):
         v = self.db.create_chain_bypass_rule(context, bypass_rule, chain_id)
@@ -386,12 +690,16 @@ class SFCPlugin(SFCPluginBase, SFCListener):
     def update_chain_bypass_rule(self, context, rule_id, chain_id,
                                  bypass_rule):
         # LOG.debug(_('Update rule %s'), rule_id)
+        old = self.db.get_chain_bypass_rule(context, rule_id, chain_id)
         v = self.db.update_chain_bypass_rule(context, rule_id, chain_id,
                                                  bypass_rule)
 	data = v
         v.update({'operation' : 'update'})
+        if self._suppress_update('chain_bypass_rules', old, data):
+            return data
         delta={}
-        delta.update({'chain_bypass_rules_delta':v})
+        delta.update({'chain_bypass_rules_delta': dict(
+            v, changed_fields=self._changed_fields(old, data))})
         result_delta = self.sfcdelta.create_chain_bypass_rules_delta(context,delta)
         return data
 
@@ -405,16 +713,43 @@ class SFCPlugin(SFCPluginBase, SFCListener):
         delta.update({'chain_bypass_rules_delta':v})
         result_delta = self.sfcdelta.create_chain_bypass_rules_delta(context,delta)
 
+    def get_chain_topology(self, context, chain_id):
+        """
+        Return the chain with its appliance maps in sequence order, each
+        with its appliance and instances.
+        """
+        return self.db.get_chain_topology(context, chain_id)
+
+    def create_chain_bypass_rule_bulk(self, context, bypass_rule, chain_id):
+        body = {'create': [item['bypass_rule']
+                           for item in bypass_rule['bypass_rules']]}
+        return self.bulk_bypass_rules(context, chain_id,
+                                      {'bypass_rules': body})['create']
+
+    def bulk_bypass_rules(self, context, chain_id, body):
+        """
+        Apply {'bypass_rules': {'create': [rule, ...], 'update': [rule with
+        id, ...], 'delete': [id, ...]}} to the bypass rules of a chain.
+        """
+        return self._bulk_rules(context, chain_id, body['bypass_rules'],
+                                'bypass_rules', 'bypass_rule',
+                                self.create_chain_bypass_rule,
+                                self.update_chain_bypass_rule,
+                                self.delete_chain_bypass_rule)
+
     def get_chain_bypass_rule(self, context, rule_id, chain_id, fields=None):
         # LOG.debug(_('Get rule %s'), rule_id)
         return self.db.get_chain_bypass_rule(context, rule_id, chain_id,
                                              fields)
 
     def get_chain_bypass_rules(self, context, filters=None, fields=None,
-                               chain_id=None):
+                               chain_id=None, sorts=None, limit=None,
+                               marker=None, page_reverse=False):
         # LOG.debug(_('Get rules'))
         filters['chain_id'] = [chain_id]
-        return self.db.get_chain_bypass_rules(context, filters, fields)
+        return self.db.get_chain_bypass_rules(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
 
     def create_chainset(self, context, chainset):
         # LOG.debug(_('create_chainset'))
@@ -432,18 +767,25 @@ class SFCPlugin(SFCPluginBase, SFCListener):
 
     def update_chainset(self, context, chainset_id, chainset):
         # LOG.debug(_('Update chainset %s'), chainset_id)
-        v = self.db.update_chainset(context, chainset_id, chainset)
-	data = v
-        v.update({'operation' : 'update'})
-        delta={}
-        delta.update({'chainsets_delta':v})
-        result_delta = self.sfcdelta.create_chainsets_delta(context,delta)
+        with context.session.begin(subtransactions=True):
+            old = self.db.get_for_update(context, 'chainset', chainset_id)
+            v = self.db.update_chainset(context, chainset_id, chainset)
+            data = v
+            v.update({'operation' : 'update'})
+            if self._suppress_update('chainsets', old, data):
+                return data
+            delta={}
+            delta.update({'chainsets_delta': dict(
+                v, changed_fields=self._changed_fields(old, data))})
+            result_delta = self.sfcdelta.create_chainsets_delta(context,
+                                                                delta)
         return data
 
     def delete_chainset(self, context, chainset_id):
         # LOG.debug(_('Delete chainset %s'), chainset_id)
 	v = self.get_chainset(context, chainset_id)
         self.db.delete_chainset(context, chainset_id)
+        self.rule_indexes.pop(chainset_id, None)
 	data = v
         v.update({'operation' : 'delete'})
         delta={}
@@ -451,16 +793,54 @@ class SFCPlugin(SFCPluginBase, SFCListener):
         result_delta = self.sfcdelta.create_chainsets_delta(context,delta)
 	
 
+    def delete_chainset_cascade(self, context, chainset_id):
+        """
+        Delete a chainset with its selection rules, zones and network
+        maps in one transaction whose deltas reach the consumers as one
+        batch. The chains the rules steer to are kept.
+        """
+        self.get_chainset(context, chainset_id)
+        filters = {'chainset_id': [chainset_id]}
+        rules = self.db.get_chainset_rules(context, filters=filters)
+        zones = self.db.get_chainset_zones(context, filters=filters)
+        chainmaps = self.db.get_chainmaps(context, filters=filters)
+        try:
+            with context.session.begin(subtransactions=True):
+                with self.sfcdelta.delta_batch(context, context.tenant_id):
+                    for rule in rules:
+                        self.delete_chainset_rule(context, rule['id'],
+                                                  chainset_id)
+                    for zone in zones:
+                        self.delete_chainset_zone(context, zone['id'],
+                                                  chainset_id)
+                    for chainmap in chainmaps:
+                        self.delete_chainmap(context, chainmap['id'])
+                    self.delete_chainset(context, chainset_id)
+        except Exception:
+            # The rule index may hold changes that were rolled back.
+            self.rule_indexes.pop(chainset_id, None)
+            raise
+        return {'chainset_id': chainset_id,
+                'rules': [rule['id'] for rule in rules],
+                'zones': [zone['id'] for zone in zones],
+                'chainmaps': [chainmap['id'] for chainmap in chainmaps]}
+
     def get_chainset(self, context, chainset_id, fields=None):
         # LOG.debug(_('Get chainset %s'), chainset_id)
         return self.db.get_chainset(context, chainset_id, fields)
 
-    def get_chainsets(self, context, filters=None, fields=None):
+    def get_chainsets(self, context, filters=None, fields=None,
+                      sorts=None, limit=None, marker=None,
+                      page_reverse=False):
         # LOG.debug(_('Get chainsets'))
-        return self.db.get_chainsets(context, filters, fields)
+        return self.db.get_chainsets(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
 
     def create_chainset_rule(self, context, rule, chainset_id):
+        self._check_rule_conflicts(context, chainset_id, rule['rule'])
         v = self.db.create_chainset_rule(context, rule, chainset_id)
+        self._index_rule(chainset_id, v)
 	data = v
         v.update({'operation' : 'create'})
         delta={}
@@ -473,12 +853,19 @@ class SFCPlugin(SFCPluginBase, SFCListener):
 
     def update_chainset_rule(self, context, rule_id, chainset_id, rule):
         # LOG.debug(_('Update rule %s'), rule_id)
+        old = self.db.get_chainset_rule(context, rule_id, chainset_id)
+        self._check_rule_conflicts(context, chainset_id,
+                                   dict(old, **rule['rule']))
         v = self.db.update_chainset_rule(context, rule_id, chainset_id,
                                              rule)
+        self._index_rule(chainset_id, v)
 	data = v
         v.update({'operation' : 'update'})
+        if self._suppress_update('chainrules', old, data):
+            return data
         delta={}
-        delta.update({'chainrules_delta':v})
+        delta.update({'chainrules_delta': dict(
+            v, changed_fields=self._changed_fields(old, data))})
 	cbr = v
 	chain_id=cbr.get('chain_id') or ''
 	if chain_id:
@@ -489,6 +876,7 @@ class SFCPlugin(SFCPluginBase, SFCListener):
         # LOG.debug(_('Delete rule %s'), rule_id)
 	v = self.get_chainset_rule(context, rule_id, chainset_id)
         self.db.delete_chainset_rule(context, rule_id, chainset_id)
+        self._index_rule(chainset_id, rule_id=rule_id)
 	data = v
         v.update({'operation' : 'delete'})
         delta={}
@@ -498,16 +886,43 @@ class SFCPlugin(SFCPluginBase, SFCListener):
 	if chain_id:
 	    result_delta = self.sfcdelta.create_chainrules_delta(context,delta)
 
+    def create_chainset_rule_bulk(self, context, rule, chainset_id):
+        body = {'create': [item['rule'] for item in rule['rules']]}
+        return self.bulk_rules(context, chainset_id,
+                               {'rules': body})['create']
+
+    def bulk_rules(self, context, chainset_id, body):
+        """
+        Apply {'rules': {'create': [rule, ...], 'update': [rule with id,
+        ...], 'delete': [id, ...]}} to the selection rules of a chainset.
+        """
+        return self._bulk_rules(context, chainset_id, body['rules'],
+                                'rules', 'rule',
+                                self.create_chainset_rule,
+                                self.update_chainset_rule,
+                                self.delete_chainset_rule)
+
+    def conflicts(self, context, chainset_id):
+        """
+        Report the selection rules of a chainset that duplicate, shadow or
+        overlap each other.
+        """
+        self.get_chainset(context, chainset_id)
+        return {'conflicts': self._rule_index(context, chainset_id).report()}
+
     def get_chainset_rule(self, context, rule_id, chainset_id, fields=None):
         # LOG.debug(_('Get rule %s'), rule_id)
         return self.db.get_chainset_rule(context, rule_id, chainset_id,
                                          fields)
 
     def get_chainset_rules(self, context, filters=None, fields=None,
-                           chainset_id=None):
+                           chainset_id=None, sorts=None, limit=None,
+                           marker=None, page_reverse=False):
         # LOG.debug(_('Get rules'))
         filters['chainset_id'] = [chainset_id]
-        return self.db.get_chainset_rules(context, filters, fields)
+        return self.db.get_chainset_rules(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
 
     # # Chain map Related
     def create_chainmap(self, context, chainmap):
@@ -521,11 +936,15 @@ class SFCPlugin(SFCPluginBase, SFCListener):
 
     def update_chainmap(self, context, chainmap_id, chainmap):
         # LOG.debug(_('Update chainmap %s'), chainmap_id)
+        old = self.db.get_chainmap(context, chainmap_id)
         v = self.db.update_chainmap(context, chainmap_id, chainmap)
 	data = v
         v.update({'operation' : 'update'})
+        if self._suppress_update('chainmaps', old, data):
+            return data
         delta={}
-        delta.update({'chainmaps_delta':v})
+        delta.update({'chainmaps_delta': dict(
+            v, changed_fields=self._changed_fields(old, data))})
         result_delta = self.sfcdelta.create_chainmaps_delta(context,delta)
         return data
 
@@ -543,18 +962,204 @@ class SFCPlugin(SFCPluginBase, SFCListener):
         # LOG.debug(_('Get chainmap %s'), chainmap_id)
         return self.db.get_chainmap(context, chainmap_id, fields)
 
-    def get_chainmaps(self, context, filters=None, fields=None):
+    def get_chainmaps(self, context, filters=None, fields=None,
+                      sorts=None, limit=None, marker=None,
+                      page_reverse=False):
         # LOG.debug(_('Get chainmaps'))
-        return self.db.get_chainmaps(context, filters, fields)
+        return self.db.get_chainmaps(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
 
     def create_launch(self, context, launch):
-        # LOG.debug(_('Launch  Chain'))
+        """
+        Queue the launch of the chain a rule steers to and return at once
+        with the id of the launch job running it.
+        """
         n = launch['launch']
-        rule_id = n['rule_id']
-        chainset_id = n['chainset_id']
-        chainmap_id = n['chainmap_id']
-        res = {'rule_id': rule_id}
-        self.driver.launch_chain(context, chainset_id, chainmap_id, rule_id)
+        job = self._queue_launch_job(context, {
+            'operation': 'launch',
+            'tenant_id': n.get('tenant_id') or context.tenant_id,
+            'chainset_id': n['chainset_id'],
+            'chainmap_id': n['chainmap_id'],
+            'rule_id': n['rule_id']})
+        res = {'rule_id': n['rule_id'], 'job_id': job['id'],
+               'status': job['status']}
+        return res
+
+    @staticmethod
+    def _job_owner():
+        """The owner, as host:pid, of the jobs this API worker queues."""
+        return '%s:%d' % (socket.gethostname(), os.getpid())
+
+    @staticmethod
+    def _pid_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except OSError, e:
+            return e.errno != errno.ESRCH
+        return True
+
+    def _fail_orphaned_launch_jobs(self):
+        """
+        Fail the jobs left pending or running by API workers of this host
+        that are gone; jobs only run in the worker that queued them.
+        """
+        ctx = crd_context.Context('crd', 'crd', is_admin=True)
+        failed = self.db.fail_orphaned_launch_jobs(
+            ctx, socket.gethostname(), self._pid_alive)
+        if failed:
+            LOG.warning(_("Failed launch jobs %s of stopped API workers"),
+                        failed)
+
+    @staticmethod
+    def _job_context(context):
+        """
+        A new admin context, with a session of its own, carrying the
+        identity and token of the request context a job was queued in.
+        """
+        job_context = crd_context.Context(context.user_id, context.tenant_id,
+                                          is_admin=True)
+        for name in ('user_name', 'tenant_name', 'auth_token',
+                     'service_catalog'):
+            setattr(job_context, name, getattr(context, name, None))
+        return job_context
+
+    def _queue_launch_job(self, context, job):
+        job = self.db.create_launch_job(context, {'launch_job': dict(
+            job, owner=self._job_owner())})
+        self.launch_jobs.put((self._job_context(context), job))
+        return job
+
+    def _launch_job_worker(self):
+        """
+        Run queued launch jobs one after another; launch_job_workers of
+        these run in each API worker and jobs beyond them wait queued.
+        """
+        while True:
+            context, job = self.launch_jobs.get()
+            try:
+                self._run_launch_job(context, job)
+            except Exception:
+                LOG.exception(_("Launch job %s failed"), job['id'])
+
+    def _run_launch_job(self, context, job):
+        """
+        Run a launch job, recording the progress of each appliance and
+        the outcome on the job. A job cancelled while pending is skipped;
+        one cancelled while running stops before it boots another
+        appliance, once it has recorded the instances it booted.
+        """
+        job_id = job['id']
+        started_at = datetime.datetime.now()
+        if not self.db.set_launch_job_status(
+                context, job_id, [sfc_db.JOB_PENDING], sfc_db.JOB_RUNNING,
+                started_at=started_at):
+            return
+        progress = []
+
+        def _progress(appliance_map, state, instance_uuid=None):
+            step = {'appliance_map_id': appliance_map['id'],
+                    'name': appliance_map['name'],
+                    'state': state,
+                    'instance_uuid': instance_uuid,
+                    'elapsed': (datetime.datetime.now() -
+                                started_at).total_seconds()}
+            for index, other in enumerate(progress):
+                if other['appliance_map_id'] == step['appliance_map_id']:
+                    step['instance_uuid'] = (instance_uuid or
+                                             other['instance_uuid'])
+                    progress[index] = step
+                    break
+            else:
+                progress.append(step)
+            self.db.update_launch_job(context, job_id,
+                                      {'launch_job': {'progress': progress}})
+            # launch_chain still records the servers it created before
+            # the cancellation.
+            if (state in ('pending', 'booting') and
+                    self.db.get_launch_job_status(context, job_id) ==
+                    sfc_db.JOB_CANCELLING):
+                raise sfc_exc.LaunchJobCancelled(job_id=job_id)
+
+        status = sfc_db.JOB_COMPLETED
+        error = None
+        try:
+            if job['operation'] == 'vmscaleout':
+                self._scale_out(context, job['instance_id'], _progress)
+            else:
+                self.driver.launch_chain(context, job['chainset_id'],
+                                         job['chainmap_id'], job['rule_id'],
+                                         progress=_progress)
+        except sfc_exc.LaunchJobCancelled:
+            status = sfc_db.JOB_CANCELLED
+        except Exception, e:
+            LOG.exception(_("Launch job %s failed"), job_id)
+            status = sfc_db.JOB_FAILED
+            error = str(e)
+        self.db.set_launch_job_status(
+            context, job_id, [sfc_db.JOB_RUNNING, sfc_db.JOB_CANCELLING],
+            status, error=error, finished_at=datetime.datetime.now())
+        LOG.debug(_("Launch job %(job_id)s %(status)s"),
+                  {'job_id': job_id, 'status': status})
+
+    def get_launch_job(self, context, id, fields=None):
+        return self.db.get_launch_job(context, id, fields)
+
+    def get_launch_jobs(self, context, filters=None, fields=None,
+                        sorts=None, limit=None, marker=None,
+                        page_reverse=False):
+        return self.db.get_launch_jobs(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
+
+    def delete_launch_job(self, context, id):
+        self.db.delete_launch_job(context, id)
+
+    def cancel_launch_job(self, context, id, body=None):
+        """
+        Cancel a launch job. A pending job never runs; a running job
+        boots no further appliance and records the instances it has
+        booted before it is cancelled.
+        """
+        job = self.db.get_launch_job(context, id)
+        if job['status'] not in (sfc_db.JOB_PENDING, sfc_db.JOB_RUNNING,
+                                 sfc_db.JOB_CANCELLING):
+            raise sfc_exc.LaunchJobFinished(job_id=id, status=job['status'])
+        if not self.db.set_launch_job_status(
+                context, id, [sfc_db.JOB_PENDING], sfc_db.JOB_CANCELLED,
+                finished_at=datetime.datetime.now()):
+            self.db.set_launch_job_status(context, id, [sfc_db.JOB_RUNNING],
+                                          sfc_db.JOB_CANCELLING)
+        return {'launch_job': self.db.get_launch_job(context, id)}
+
+    def create_flow_lookup(self, context, flow_lookup):
+        """
+        Find the selection rule a flow hits, in its chainset or in every
+        chainset of the tenant, and the chain it steers the flow to with
+        the appliance instances of the chain in sequence order.
+        """
+        n = flow_lookup['flow_lookup']
+        flow = rule_match.typed_flow(n)
+        if n.get('chainset_id'):
+            chainset_ids = [self.get_chainset(context, n['chainset_id'])['id']]
+        else:
+            # Only the chainsets with a rule the flow may hit are indexed
+            chainset_ids = self.db.get_flow_chainset_ids(context, flow)
+        matched = []
+        for chainset_id in chainset_ids:
+            index = self._rule_index(context, chainset_id)
+            matched.extend((rank, chainset_id, rule_id, chain_id)
+                           for rank, rule_id, chain_id in index.lookup(flow))
+        matched.sort()
+        res = {'chainset_id': None, 'rule_id': None, 'chain_id': None,
+               'matched_rule_ids': [match[2] for match in matched],
+               'appliance_maps': []}
+        if matched:
+            res.update(zip(('chainset_id', 'rule_id', 'chain_id'),
+                           matched[0][1:]))
+        if res['chain_id']:
+            res['appliance_maps'] = self.db.get_chain_topology(
+                context, res['chain_id'])['appliance_maps']
         return res
 
     def create_vlanquota(self, context, vlanquota):
@@ -574,9 +1179,13 @@ class SFCPlugin(SFCPluginBase, SFCListener):
         # LOG.debug(_('Get vlanquota %s'), vlanquota_id)
         return self.db.get_vlanquota(context, vlanquota_id, fields)
 
-    def get_vlanquotas(self, context, filters=None, fields=None):
+    def get_vlanquotas(self, context, filters=None, fields=None,
+                       sorts=None, limit=None, marker=None,
+                       page_reverse=False):
         # LOG.debug(_('Get vlanquotas'))
-        return self.db.get_vlanquotas(context, filters, fields)
+        return self.db.get_vlanquotas(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
 
     def create_chain_appliance_instance(self, context, chain_id, appliance_id, instance):
 	chain_appliance = self.get_chain_appliance(context, appliance_id, chain_id)
@@ -593,11 +1202,16 @@ class SFCPlugin(SFCPluginBase, SFCListener):
 	return data
     
     def update_chain_appliance_instance(self, context, chain_appliance_map_instance_id, chain_appliance_map_instance):
+        old = self.db.get_chain_appliance_map_instance(
+            context, chain_appliance_map_instance_id)
         v = self.db.update_chain_appliance_map_instance(context, chain_appliance_map_instance_id, chain_appliance_map_instance)
 	data = v
 	v.update({'operation' : 'update'})
+        if self._suppress_update('appliance_instances', old, data):
+            return data
         delta={}
-        delta.update({'appliance_instances_delta':v})
+        delta.update({'appliance_instances_delta': dict(
+            v, changed_fields=self._changed_fields(old, data))})
         result_delta = self.sfcdelta.create_appliance_instances_delta(context,delta)
 	return data
     
@@ -620,11 +1234,15 @@ class SFCPlugin(SFCPluginBase, SFCListener):
     def get_chain_appliance_instance(self, context, chain_appliance_map_instance_id, appliance_id=None, chain_id=None, fields=None):
         return self.db._get_chain_appliance_map_instance_handle(context, chain_appliance_map_instance_id)
     
-    def get_chain_appliance_instances(self, context, filters=None, fields=None, chain_id=None, appliance_id=None):
+    def get_chain_appliance_instances(self, context, filters=None, fields=None, chain_id=None, appliance_id=None,
+                                      sorts=None, limit=None, marker=None,
+                                      page_reverse=False):
 	chain_appliance = self.get_chain_appliance(context, appliance_id, chain_id)
 	appliance_map_id = chain_appliance['id']
         filters['appliance_map_id'] = [appliance_map_id]
-        return self.db.get_chain_appliance_map_instances(context, filters, fields)
+        return self.db.get_chain_appliance_map_instances(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
 
     def send_inst_delete_driver(self, instance_id, tenant_id, hostname):
         self.driver.send_delete_instance(instance_id, tenant_id, hostname)
@@ -640,6 +1258,27 @@ class SFCPlugin(SFCPluginBase, SFCListener):
         return self.sfcdelta.sfc_init(self.context, payload['version'],
 				      payload['hostname'])
 
+    def sfc_snapshot_page(self, context, **kwargs):
+        """
+        Return one page of the bootstrap snapshot to a paging consumer
+        """
+        payload = kwargs['consumer']['payload']
+        return self.sfcdelta.get_snapshot_page(self.context,
+                                               cursor=payload.get('cursor'),
+                                               version=payload.get('version'),
+                                               page_size=payload.get(
+                                                   'page_size'))
+
+    def sfc_get_object(self, context, **kwargs):
+        """
+        Return the create message of one live object to a consumer that
+        has no copy to merge a compact update into
+        """
+        payload = kwargs['consumer']['payload']
+        return self.sfcdelta.get_object_message(self.context,
+                                                payload['method'],
+                                                payload['id'])
+
 
     def get_nsdelta(self, context, keyword, fields=None):
         delta = {}
@@ -661,12 +1300,16 @@ class SFCPlugin(SFCPluginBase, SFCListener):
 
     def update_chainset_zone(self, context, zone_id, chainset_id, zone):
         # LOG.debug(_('Update zone %s'), zone_id)
+        old = self.db.get_chainset_zone(context, zone_id, chainset_id)
         v = self.db.update_chainset_zone(context, zone_id, chainset_id,
                                              zone)
 	data = v
         v.update({'operation' : 'update'})
+        if self._suppress_update('chainset_zones', old, data):
+            return data
         delta={}
-        delta.update({'chainset_zones_delta':v})
+        delta.update({'chainset_zones_delta': dict(
+            v, changed_fields=self._changed_fields(old, data))})
         result_delta = self.sfcdelta.create_chainset_zone_deltas(context,delta)
         return data
 
@@ -686,68 +1329,72 @@ class SFCPlugin(SFCPluginBase, SFCListener):
                                          fields)
 
     def get_chainset_zones(self, context, filters=None, fields=None,
-                           chainset_id=None):
+                           chainset_id=None, sorts=None, limit=None,
+                           marker=None, page_reverse=False):
         # LOG.debug(_('Get zones'))
         filters['chainset_id'] = [chainset_id]
-        return self.db.get_chainset_zones(context, filters, fields)
+        return self.db.get_chainset_zones(
+            context, filters, fields, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse)
     
     def create_vmscaleout(self, context, vmscaleout):
-        # LOG.debug(_('Launch  Chain'))
+        """
+        Queue the launch of another instance of the chain of an appliance
+        instance and return at once with the id of the launch job
+        running it.
+        """
         n = vmscaleout['vmscaleout']
-        instance_id = n['instance_id']
-	###Get Appliance Details###############
-	filters = {}
-	filters['instance_uuid'] = [instance_id]
-	
-	chainset_id = None
-	chain_network_map_id = None
-	rule_id = None
-	
-	appliance_instances = self.db.get_chain_appliance_map_instances(context, filters=filters)
-	if appliance_instances:
-	    appliance_instance_details = appliance_instances[0]
-	    appliance_map_id = appliance_instance_details['appliance_map_id']
-	    appliance_map_details = self.db.get_chain_appliance_map(context,
-								    appliance_map_id)
-	    chain_id = appliance_map_details['chain_id']
-	    appliance_id = appliance_map_details['appliance_id']
-	    filters = {}
-	    filters['chain_id'] = [chain_id]
-	    chain_sel_rules = self.db.get_chainset_rules(context, filters=filters)
-	    LOG.debug("########################################")
-	    LOG.debug(_("Chain ID: %s"), str(chain_id))
-	    LOG.debug(_("Chain Selection Rules: %s"), str(chain_sel_rules))
-	    LOG.debug("########################################")
-	    if chain_sel_rules:
-		rule_details = chain_sel_rules[0]
-		chainset_id = rule_details['chainset_id']
-		rule_id = rule_details['id']
-		filters = {}
-		filters['chainset_id'] = [chainset_id]
-		chain_network_maps = self.get_chainmaps(context, filters=filters)
-		if chain_network_maps:
-		    chain_net_map_details = chain_network_maps[0]
-		    chain_network_map_id = chain_net_map_details['id']
-		    
-	    LOG.debug("########################################")
-	    LOG.debug(_("Chainset ID: %s, Chain-Network-Map ID: %s, Rule ID: %s"), str(chainset_id), str(chain_network_map_id), str(rule_id))
-	    LOG.debug("########################################")
-	    ####Check all the required arguments to run launch_chain in fsl_driver
-	    if chainset_id and chain_network_map_id and rule_id:
-		LOG.debug("########################################")
-		LOG.debug("@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@")
-		LOG.debug(_("Scaling out Instance: %s"), str(instance_id))
-		LOG.debug(_("Launching Instance ... "))
-		LOG.debug("@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@")
-		LOG.debug("########################################")
-		self.driver.launch_chain(context, chainset_id, chain_network_map_id, rule_id)
-	    else:
-		LOG.error(_("@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%"))
-		LOG.error(_("@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%"))
-		LOG.error(_("One of the required fields: chainset_id/chain_network_map_id/rule_id is missing to Launch Instance!!!"))
-		LOG.error(_("@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%"))
-		LOG.error(_("@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%@$%"))
-	    
-	    
-        res = {'vmscaleout': {'instance_id': instance_id}}
-	return res
\ No newline at end of file
+        job = self._queue_launch_job(context, {
+            'operation': 'vmscaleout',
+            'tenant_id': n.get('tenant_id') or context.tenant_id,
+            'instance_id': n['instance_id']})
+        res = {'vmscaleout': {'instance_id': n['instance_id'],
+                              'job_id': job['id'],
+                              'status': job['status']}}
+        return res
+
+    def _scale_out(self, context, instance_id, progress):
+        """
+        Launch the chain of an appliance instance again, for the first
+        selection rule steering to it and the first chain network map of
+        the chainset of the rule.
+        """
+        chainset_id = None
+        chain_network_map_id = None
+        rule_id = None
+
+        filters = {'instance_uuid': [instance_id]}
+        appliance_instances = self.db.get_chain_appliance_map_instances(
+            context, filters=filters)
+        if appliance_instances:
+            appliance_map_id = appliance_instances[0]['appliance_map_id']
+            appliance_map_details = self.db.get_chain_appliance_map(
+                context, appliance_map_id)
+            chain_id = appliance_map_details['chain_id']
+            filters = {'chain_id': [chain_id]}
+            chain_sel_rules = self.db.get_chainset_rules(context,
+                                                         filters=filters)
+            LOG.debug(_("Chain ID: %(chain_id)s, Chain Selection Rules: "
+                        "%(rules)s"),
+                      {'chain_id': chain_id, 'rules': chain_sel_rules})
+            if chain_sel_rules:
+                chainset_id = chain_sel_rules[0]['chainset_id']
+                rule_id = chain_sel_rules[0]['id']
+                filters = {'chainset_id': [chainset_id]}
+                chain_network_maps = self.get_chainmaps(context,
+                                                        filters=filters)
+                if chain_network_maps:
+                    chain_network_map_id = chain_network_maps[0]['id']
+
+        LOG.debug(_("Chainset ID: %(chainset_id)s, Chain-Network-Map ID: "
+                    "%(chainmap_id)s, Rule ID: %(rule_id)s"),
+                  {'chainset_id': chainset_id,
+                   'chainmap_id': chain_network_map_id, 'rule_id': rule_id})
+        if not (chainset_id and chain_network_map_id and rule_id):
+            msg = _("One of the required fields: chainset_id/"
+                    "chain_network_map_id/rule_id is missing to scale out "
+                    "instance %s") % instance_id
+            raise exceptions.InvalidInput(error_message=msg)
+        LOG.debug(_("Scaling out Instance: %s"), instance_id)
+        self.driver.launch_chain(context, chainset_id, chain_network_map_id,
+                                 rule_id, progress=progress)
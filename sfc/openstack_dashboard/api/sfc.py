@@ -523,6 +523,20 @@ def chain_get(request, chain_id, **params):
     return Chain(chain)
 
 
+def chain_topology_get(request, chain_id, **params):
+    LOG.debug("chain_topology_get(): chain_id=%s, params=%s"
+              % (chain_id, params))
+    topology = crdclient(request).show_chain_topology(chain_id, **params)
+    chain = Chain(topology)
+    chain.appliance_maps = []
+    for n in topology['appliance_maps']:
+        appliance_map = Appliance_Map(n)
+        appliance_map.instances = [Appliance_Map_instance(i)
+                                   for i in n['instances']]
+        chain.appliance_maps.append(appliance_map)
+    return chain
+
+
 class Appliance_Map(CrdAPIDictWrapper):
 
     """Wrapper for crd appliance_maps"""
@@ -171,8 +171,7 @@ class ListInstancesView(tables.DataTableView):
     def get_data(self):
         try:
             appliance_map = self._get_data()
-            appliance_map_instances = api.sfc.appliance_map_instance_list_for_chain(self.request,
-                                                                            appliance_map.chain_id, appliance_map.appliance_id)
+            appliance_map_instances = appliance_map.instances
             for appliance_map_instance in appliance_map_instances:
                 appliance_map_id = appliance_map_instance.appliance_map_id
                 instance_uuid = appliance_map_instance.instance_uuid
@@ -203,12 +202,13 @@ class ListInstancesView(tables.DataTableView):
         return appliance_map_instances
 
     def _get_data(self):
-        if not hasattr(self, "_appliance_map_instance"):
+        if not hasattr(self, "_appliance_map"):
             try:
                 appliance_map_id = self.kwargs['appliance_map_id']
                 chain_id = self.kwargs['chain_id']
-                appliance_map = api.sfc.appliance_map_get(
-                    self.request, chain_id, appliance_map_id)
+                chain = api.sfc.chain_topology_get(self.request, chain_id)
+                appliance_map = [m for m in chain.appliance_maps
+                                 if m.id == appliance_map_id][0]
                 appliance_map.set_id_as_name_if_empty(length=0)
             except:
                 msg = _('Unable to retrieve details for chain appliance map "%s".') \
@@ -96,9 +96,9 @@ class DetailChainView(tables.MultiTableView):
 
     def get_appliance_maps_data(self):
         try:
-            chain = self._get_data()
-            appliance_maps = api.sfc.appliance_map_list_for_chain(self.request,
-                                                                  chain.id)
+            chain = api.sfc.chain_topology_get(self.request,
+                                               self.kwargs['chain_id'])
+            appliance_maps = chain.appliance_maps
             #for appliance_map in appliance_maps:
             #    chain_map_id = appliance_map.id
             #    instance_id = appliance_map.instance_uuid
@@ -169,25 +169,23 @@ class ChainController(rest.RestController):
         chains = request.crdclient.list_chains()
         
         
-        chain_details = request.crdclient.show_chain(chain_id)
-        LOG.debug(_("Chain Details: %s"), str(chain_details))
+        topology = request.crdclient.show_chain_topology(chain_id)
+        LOG.debug(_("Chain Topology: %s"), str(topology))
         
-        tenant_id = chain_details['chain']['tenant_id']
+        tenant_id = topology['tenant_id']
 
         ### Delete Chain Appliance Associations
-        ### Get Chain Appliance Association of the chain
+        ### Chain Appliance Associations and their Instances come
+        ### with the chain topology
         instance_ref = False
-        chain_app_maps = request.crdclient.list_appliance_maps(chain_id)
-        LOG.debug(_("Chain Appliances: %s"), str(chain_app_maps))
-        for chain_app in chain_app_maps['appliances']:
+        for chain_app in topology['appliance_maps']:
             chain_app_id = chain_app['id']
             appliance_id = chain_app['appliance_id']
             
-            chain_app_insts = request.crdclient.list_appliance_map_instances(chain_id,
-                                                                             appliance_id)
+            chain_app_insts = chain_app['instances']
             LOG.debug(_("Chain Appliances Instances: %s"), str(chain_app_insts))
-            if chain_app_insts['instances']:
-                for app_inst in chain_app_insts['instances']:
+            if chain_app_insts:
+                for app_inst in chain_app_insts:
                     app_inst_id = app_inst['id']
                     instance_uuid = app_inst['instance_uuid']
                     nova = nc(cfg.CONF.nova.username,
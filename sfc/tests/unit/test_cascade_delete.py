@@ -0,0 +1,188 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cascade deletes of chains and chainsets by the plugin, on an SQLite
+schema built from the models.
+"""
+
+import contextlib
+import unittest
+
+import eventlet
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from nscs.crdservice.db import model_base
+from sfc.crdservice.db import sfc_db
+from sfc.crdservice.plugins import sfc_plugin
+
+TENANT = 'tenant'
+
+
+class FakeContext(object):
+
+    is_admin = True
+    tenant_id = TENANT
+    user_id = 'user'
+
+    def __init__(self, engine):
+        self.session = orm.sessionmaker(bind=engine, autocommit=True)()
+
+
+class FakeSfcDelta(object):
+    """
+    Records the deltas written, by delta key, as (id, operation), and the
+    batches opened; writing a delta of the key in fail raises.
+    """
+
+    def __init__(self):
+        self.deltas = []
+        self.batches = 0
+        self.fail = None
+
+    @contextlib.contextmanager
+    def delta_batch(self, context, tenant_id):
+        self.batches += 1
+        yield
+
+    def __getattr__(self, name):
+        if not (name.startswith('create_') and name.endswith('_delta')):
+            raise AttributeError(name)
+
+        def _create(context, delta):
+            [(key, value)] = delta.items()
+            if key == self.fail:
+                raise Exception('delta not written')
+            self.deltas.append((key, value['id'], value['operation']))
+        return _create
+
+
+class FakeDriver(object):
+
+    def __init__(self):
+        self.deleted = []
+
+    def delete_instances(self, context, instance_uuids):
+        self.deleted.extend(instance_uuids)
+
+
+class CascadeDeleteTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        model_base.BASEV2.metadata.create_all(self.engine)
+        self.context = FakeContext(self.engine)
+        self.plugin = sfc_plugin.SFCPlugin.__new__(sfc_plugin.SFCPlugin)
+        self.plugin.db = sfc_db.SFCPluginDb()
+        self.plugin.db.row_cache = sfc_db.RowCache(16)
+        self.plugin.sfcdelta = FakeSfcDelta()
+        self.plugin.driver = FakeDriver()
+        self.plugin.rule_indexes = {}
+        self._insert(sfc_db.SFCCategory, id='category')
+        self._insert(sfc_db.SFCVendor, id='vendor')
+        self._insert(sfc_db.SFCAppliance, id='appliance',
+                     category_id='category', vendor_id='vendor')
+        self._insert(sfc_db.SFCChain, id='chain')
+        self._insert(sfc_db.SFCChainSet, id='chainset')
+        self._insert(sfc_db.SFCChainSelectionRule, id='rule',
+                     chainset_id='chainset', chain_id='chain')
+        self._insert(sfc_db.SFCChainBypassRule, id='bypass',
+                     chain_id='chain')
+        self._insert(sfc_db.SFCChainsetNetworkMap, id='chainmap',
+                     chainset_id='chainset')
+        self._insert(sfc_db.SFCChainAppliance, id='map', chain_id='chain',
+                     appliance_id='appliance')
+        self._insert(sfc_db.SFCApplianceInstance, id='instance',
+                     appliance_map_id='map', instance_uuid='server',
+                     network_id='net', vlan_in=10, vlan_out=11)
+        for vlan_id in (10, 11):
+            self._insert(sfc_db.SFCVLANAllocation, network_id='net',
+                         vlan_id=vlan_id, instance_id='instance')
+
+    def _insert(self, model, **values):
+        """Insert a row, with a dummy value in each required column."""
+        values.setdefault('tenant_id', TENANT)
+        for column in model.__table__.columns:
+            if (not column.nullable and column.default is None and
+                    column.name not in values):
+                if isinstance(column.type, sa.Integer):
+                    values[column.name] = 0
+                elif isinstance(column.type, sa.Boolean):
+                    values[column.name] = False
+                else:
+                    values[column.name] = 'x'
+        if 'tenant_id' not in model.__table__.columns:
+            del values['tenant_id']
+        self.engine.execute(model.__table__.insert().values(**values))
+
+    def _count(self, model):
+        return self.engine.execute(
+            sa.select([sa.func.count()]).select_from(
+                model.__table__)).scalar()
+
+    def test_delete_chain_cascade(self):
+        result = self.plugin.delete_chain_cascade(self.context, 'chain')
+        self.assertEqual({'chain_id': 'chain', 'selection_rules': ['rule'],
+                          'bypass_rules': ['bypass'],
+                          'appliance_maps': ['map'],
+                          'instances': ['instance']}, result)
+        # Children first, in one batch
+        self.assertEqual(
+            [('chainrules_delta', 'rule', 'delete'),
+             ('chain_bypass_rules_delta', 'bypass', 'delete'),
+             ('appliance_instances_delta', 'instance', 'delete'),
+             ('chain_appliances_delta', 'map', 'delete'),
+             ('chains_delta', 'chain', 'delete')],
+            self.plugin.sfcdelta.deltas)
+        self.assertEqual(1, self.plugin.sfcdelta.batches)
+        for model in (sfc_db.SFCChain, sfc_db.SFCChainSelectionRule,
+                      sfc_db.SFCChainBypassRule, sfc_db.SFCChainAppliance,
+                      sfc_db.SFCApplianceInstance):
+            self.assertEqual(0, self._count(model))
+        self.assertEqual(1, self._count(sfc_db.SFCChainSet))
+        table = sfc_db.SFCVLANAllocation.__table__
+        self.assertEqual([None, None], [
+            row['instance_id'] for row in self.engine.execute(
+                table.select())])
+        # The servers are deleted in the background
+        eventlet.sleep(0)
+        self.assertEqual(['server'], self.plugin.driver.deleted)
+
+    def test_failed_chain_cascade_deletes_nothing(self):
+        self.plugin.sfcdelta.fail = 'chains_delta'
+        self.assertRaises(Exception, self.plugin.delete_chain_cascade,
+                          self.context, 'chain')
+        for model in (sfc_db.SFCChain, sfc_db.SFCChainSelectionRule,
+                      sfc_db.SFCChainBypassRule, sfc_db.SFCChainAppliance,
+                      sfc_db.SFCApplianceInstance):
+            self.assertEqual(1, self._count(model))
+        eventlet.sleep(0)
+        self.assertEqual([], self.plugin.driver.deleted)
+
+    def test_delete_chainset_cascade(self):
+        result = self.plugin.delete_chainset_cascade(self.context,
+                                                     'chainset')
+        self.assertEqual({'chainset_id': 'chainset', 'rules': ['rule'],
+                          'zones': [], 'chainmaps': ['chainmap']}, result)
+        self.assertEqual(0, self._count(sfc_db.SFCChainSet))
+        self.assertEqual(0, self._count(sfc_db.SFCChainSelectionRule))
+        self.assertEqual(0, self._count(sfc_db.SFCChainsetNetworkMap))
+        # The chain the rule steered to is kept
+        self.assertEqual(1, self._count(sfc_db.SFCChain))
+
+
+if __name__ == '__main__':
+    unittest.main()
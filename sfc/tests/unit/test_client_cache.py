@@ -0,0 +1,72 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Reuse, expiry and eviction of the clients in the client cache.
+"""
+
+import unittest
+
+from oslo.config import cfg
+
+from sfc.crdservice.common import clients
+
+
+class ClientCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = clients.ClientCache()
+        self.built = []
+        for name in ('client_ttl', 'client_cache_size'):
+            self.addCleanup(cfg.CONF.clear_override, name, 'sfc_driver')
+
+    def _get(self, user):
+        def _build():
+            self.built.append(user)
+            return object()
+
+        return self.cache.get(('nova', user), _build)
+
+    def test_client_reused(self):
+        client = self._get('a')
+        self.assertTrue(client is self._get('a'))
+        self.assertFalse(client is self._get('b'))
+        self.assertEqual(['a', 'b'], self.built)
+        self.assertEqual({'hits': 1, 'misses': 2, 'expired': 0,
+                          'evictions': 0}, self.cache.stats)
+
+    def test_client_expires(self):
+        client = self._get('a')
+        cfg.CONF.set_override('client_ttl', 0, 'sfc_driver')
+        self.assertFalse(client is self._get('a'))
+        self.assertEqual(['a', 'a'], self.built)
+        self.assertEqual(1, self.cache.stats['expired'])
+
+    def test_least_recently_used_evicted(self):
+        cfg.CONF.set_override('client_cache_size', 2, 'sfc_driver')
+        self._get('a')
+        self._get('b')
+        self._get('a')
+        self._get('c')
+        self.assertEqual([('nova', 'a'), ('nova', 'c')],
+                         list(self.cache.clients))
+        self.assertEqual(1, self.cache.stats['evictions'])
+        self._get('a')
+        self._get('b')
+        self.assertEqual(['a', 'b', 'c', 'b'], self.built)
+
+
+if __name__ == '__main__':
+    unittest.main()
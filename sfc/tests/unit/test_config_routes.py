@@ -0,0 +1,199 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Config handle routing table, and the routes the deltas of an SQLite
+schema built from the models tell it to drop.
+"""
+
+import unittest
+import uuid
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+from oslo.config import cfg
+
+from nscs.crdservice.db import model_base
+from sfc.crdservice.common import routing
+from sfc.crdservice.db import delta
+from sfc.crdservice.db import sfc_db
+
+TENANT = 'tenant'
+
+
+class FakeContext(object):
+
+    is_admin = True
+    tenant_id = TENANT
+    user_id = 'user'
+
+    def __init__(self, engine):
+        self.session = orm.sessionmaker(bind=engine, autocommit=True)()
+
+
+class ConfigRoutesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.routes = routing.ConfigRoutes()
+        self.handles = {'h1': ['u1', 'u2'], 'h2': ['u3']}
+        self.resolved = []
+        self.located = []
+        self.changed = (set(), set())
+        self.addCleanup(cfg.CONF.clear_override, 'route_host_ttl',
+                        'sfc_driver')
+
+    def _resolve(self, config_handle_id):
+        self.resolved.append(config_handle_id)
+        return list(self.handles[config_handle_id])
+
+    def _locate(self, instance_uuid):
+        self.located.append(instance_uuid)
+        return TENANT, 'host-' + instance_uuid
+
+    def _changes(self, since):
+        return self.changed
+
+    def _route(self, config_handle_id, version=1):
+        return self.routes.route(config_handle_id, self._resolve,
+                                 self._locate, version, self._changes)
+
+    def test_resolved_once(self):
+        self.assertEqual([('u3', TENANT, 'host-u3')], self._route('h2'))
+        self.assertEqual([('u3', TENANT, 'host-u3')], self._route('h2'))
+        self.assertEqual(['h2'], self.resolved)
+        self.assertEqual(['u3'], self.located)
+        self.assertEqual(1, self.routes.stats['hits'])
+
+    def test_version_move_drops_changed_handles_only(self):
+        self._route('h1')
+        self._route('h2')
+        self.handles['h2'] = ['u4']
+        self.changed = (set(['h2']), set())
+        self.assertEqual([('u4', TENANT, 'host-u4')], self._route('h2', 2))
+        self._route('h1', 2)
+        self.assertEqual(['h1', 'h2', 'h2'], self.resolved)
+
+    def test_version_move_drops_handles_of_changed_instances(self):
+        self._route('h1')
+        self._route('h2')
+        self.handles['h1'] = ['u1']
+        self.changed = (set(), set(['u2']))
+        self.assertEqual([('u1', TENANT, 'host-u1')], self._route('h1', 2))
+        self._route('h2', 2)
+        self.assertEqual(['h1', 'h2', 'h1'], self.resolved)
+
+    def test_untold_changes_drop_every_handle(self):
+        self._route('h1')
+        self._route('h2')
+        self.changed = None
+        self._route('h1', 2)
+        self._route('h2', 2)
+        self.assertEqual(['h1', 'h2', 'h1', 'h2'], self.resolved)
+
+    def test_route_resolved_across_a_move_is_not_kept(self):
+        def _resolve(config_handle_id):
+            # Another green thread sees the next version meanwhile
+            self.routes.advance(2, self._changes)
+            return self._resolve(config_handle_id)
+
+        self.routes.route('h2', _resolve, self._locate, 1, self._changes)
+        self._route('h2', 2)
+        self.assertEqual(['h2', 'h2'], self.resolved)
+
+    def test_forgotten_instance_drops_its_handles(self):
+        self._route('h1')
+        self._route('h2')
+        self.routes.forget_instance('u1')
+        self._route('h1')
+        self._route('h2')
+        self.assertEqual(['h1', 'h2', 'h1'], self.resolved)
+        self.assertEqual(['u1', 'u2', 'u3', 'u1'], self.located)
+
+    def test_learned_host_expires(self):
+        self.routes.set_host('u3', TENANT, 'learned')
+        self.assertEqual([('u3', TENANT, 'learned')], self._route('h2'))
+        cfg.CONF.set_override('route_host_ttl', 0, 'sfc_driver')
+        self.assertEqual([('u3', TENANT, 'host-u3')], self._route('h2'))
+        self.assertEqual(1, self.routes.stats['expired'])
+
+
+class ConfigRouteChangesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        model_base.BASEV2.metadata.create_all(self.engine)
+        self.context = FakeContext(self.engine)
+        self.db = sfc_db.SFCPluginDb()
+        self.version = 1
+        self._insert(sfc_db.SFCAppliance, id='a1', config_handle_id='h1')
+        self._insert(sfc_db.SFCChainAppliance, id='m1', chain_id='c1',
+                     appliance_id='a1')
+        self._insert(sfc_db.SFCApplianceInstance, id='i1',
+                     appliance_map_id='m1', instance_uuid='u1')
+
+    def _insert(self, model, **values):
+        """Insert a row, with a dummy value in each required column."""
+        for column in model.__table__.columns:
+            if (not column.nullable and column.default is None and
+                    column.name not in values):
+                values[column.name] = 'x'
+        self.engine.execute(model.__table__.insert().values(**values))
+
+    def _log(self, model, **values):
+        """Write a delta at the next version."""
+        self.version += 1
+        versions = model_base.BASEV2.metadata.tables['crd_versions']
+        self.engine.execute(versions.insert().values(
+            runtime_version=self.version))
+        self._insert(model, id=str(uuid.uuid4()), tenant_id=TENANT,
+                     operation='update', user_id='user',
+                     version_id=self.version, **values)
+
+    def _changes(self, since=1):
+        return self.db.get_config_route_changes(self.context, since)
+
+    def test_nothing_changed(self):
+        self.assertEqual((set(), set()), self._changes())
+
+    def test_appliance_moved_to_another_handle(self):
+        self.engine.execute(sfc_db.SFCAppliance.__table__.update().values(
+            config_handle_id='h2'))
+        self._log(delta.sfc_appliances_delta, appliance_id='a1')
+        # h2 routes to u1 now; h1 routed to it before
+        self.assertEqual((set(['h2']), set(['u1'])), self._changes())
+        self.assertEqual((set(), set()), self._changes(self.version))
+
+    def test_instance_added(self):
+        self._insert(sfc_db.SFCApplianceInstance, id='i2',
+                     appliance_map_id='m1', instance_uuid='u2')
+        self._log(delta.sfc_appliance_instances_delta,
+                  appliance_instance_id='i2', appliance_map_id='m1',
+                  instance_uuid='u2')
+        self.assertEqual((set(['h1']), set(['u1', 'u2'])), self._changes())
+
+    def test_instance_of_deleted_map(self):
+        self._log(delta.sfc_appliance_instances_delta,
+                  appliance_instance_id='i9', appliance_map_id='m9',
+                  instance_uuid='u9')
+        self.assertEqual((set(), set(['u9'])), self._changes())
+
+    def test_compacted_deltas_tell_nothing(self):
+        self._insert(delta.sfc_delta_horizon, id=delta.HORIZON_ID,
+                     version_id=2)
+        self.assertEqual(None, self._changes())
+
+
+if __name__ == '__main__':
+    unittest.main()
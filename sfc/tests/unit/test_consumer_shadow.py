@@ -0,0 +1,89 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Copies of objects a consumer keeps to merge compact updates into.
+"""
+
+import collections
+import unittest
+
+from sfc.crdconsumer import plugin as consumer_plugin
+
+
+class ShadowTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.consumer = consumer_plugin.SFCConsumerPlugin.__new__(
+            consumer_plugin.SFCConsumerPlugin)
+        self.consumer.shadow = collections.OrderedDict()
+        self.consumer.compact_updates = False
+        self.fetched = []
+        self.service = {}
+
+        def fetch_object(kind, object_id):
+            self.fetched.append(object_id)
+            return self.service.get(object_id)
+        self.consumer.fetch_object = fetch_object
+
+    def _merge(self, operation, payload):
+        return self.consumer.shadow_merge('chain', operation, payload['id'],
+                                          payload)
+
+    def test_no_copies_without_compact_updates(self):
+        self._merge('create', {'id': 'c1', 'name': 'a'})
+        self._merge('update', {'id': 'c1', 'name': 'b'})
+        self.assertEqual({}, dict(self.consumer.shadow))
+
+    def test_compact_update_merged_into_copy(self):
+        self.consumer.compact_updates = True
+        self._merge('create', {'id': 'c1', 'name': 'a', 'admin': True})
+        payload = self._merge('update', {'id': 'c1', 'name': 'b',
+                                         'changed_fields': ['name']})
+        self.assertEqual({'id': 'c1', 'name': 'b', 'admin': True}, payload)
+        self.assertEqual([], self.fetched)
+
+    def test_missing_copy_fetched_from_service(self):
+        self.service['c1'] = {'id': 'c1', 'name': 'a', 'admin': True}
+        payload = self._merge('update', {'id': 'c1', 'name': 'b',
+                                         'changed_fields': ['name']})
+        self.assertEqual({'id': 'c1', 'name': 'b', 'admin': True}, payload)
+        self.assertEqual(['c1'], self.fetched)
+        self.assertTrue(self.consumer.compact_updates)
+        self.assertEqual(payload, self.consumer.shadow[('chain', 'c1')])
+
+    def test_unknown_object_left_compact(self):
+        payload = self._merge('update', {'id': 'c1', 'name': 'b',
+                                         'changed_fields': ['name']})
+        self.assertEqual(['name'], payload['changed_fields'])
+
+    def test_delete_drops_copy(self):
+        self.consumer.compact_updates = True
+        self._merge('create', {'id': 'c1', 'name': 'a'})
+        self._merge('delete', {'id': 'c1'})
+        self.assertEqual({}, dict(self.consumer.shadow))
+
+    def test_copies_bounded_least_recently_used_first(self):
+        self.consumer.compact_updates = True
+        size = consumer_plugin.SHADOW_SIZE
+        for index in range(size + 1):
+            self._merge('create', {'id': index})
+        self.assertEqual(size, len(self.consumer.shadow))
+        self.assertNotIn(('chain', 0), self.consumer.shadow)
+        self.assertIn(('chain', size), self.consumer.shadow)
+
+
+if __name__ == '__main__':
+    unittest.main()
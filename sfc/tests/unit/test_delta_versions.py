@@ -0,0 +1,139 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Committed runtime version of the delta tables, and the outbox drained up
+to it, on an SQLite schema built from the models.
+"""
+
+import datetime
+import json
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from nscs.crdservice.db import model_base
+from nscs.crdservice.openstack.common import timeutils
+from sfc.crdservice.db import delta
+
+
+class FakeContext(object):
+
+    def __init__(self, engine):
+        self.session = orm.sessionmaker(bind=engine, autocommit=True)()
+
+
+class CommittedVersionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        model_base.BASEV2.metadata.create_all(self.engine)
+        self.context = FakeContext(self.engine)
+        self.deltadb = delta.SfcDeltaDb()
+
+    def _version(self, version, leased=False, expired=False):
+        """Hand out version, still being written when leased."""
+        versions = model_base.BASEV2.metadata.tables['crd_versions']
+        self.engine.execute(versions.insert().values(
+            runtime_version=version))
+        if leased:
+            seconds = -1 if expired else 300
+            self.engine.execute(delta.sfc_version_leases.__table__.insert(
+            ).values(version_id=version,
+                     leased_until=timeutils.utcnow() +
+                     datetime.timedelta(seconds=seconds)))
+
+    def _commit(self, version):
+        self.engine.execute(delta.sfc_version_leases.__table__.delete(
+        ).where(delta.sfc_version_leases.version_id == version))
+
+    def test_no_versions(self):
+        self.assertEqual(0, self.deltadb.get_runtime_version(self.context))
+
+    def test_newest_version_when_none_leased(self):
+        self._version(1)
+        self._version(2)
+        self.assertEqual(2, self.deltadb.get_runtime_version(self.context))
+
+    def test_stops_below_oldest_leased_version(self):
+        self._version(1)
+        self._version(2, leased=True)
+        self._version(3)
+        self._version(4, leased=True)
+        self.assertEqual(1, self.deltadb.get_runtime_version(self.context))
+        self._commit(2)
+        self.assertEqual(3, self.deltadb.get_runtime_version(self.context))
+        self._commit(4)
+        self.assertEqual(4, self.deltadb.get_runtime_version(self.context))
+
+    def test_expired_lease_is_given_up(self):
+        self._version(1, leased=True, expired=True)
+        self._version(2)
+        self.assertEqual(2, self.deltadb.get_runtime_version(self.context))
+
+
+class OutboxDrainTestCase(CommittedVersionTestCase):
+
+    def setUp(self):
+        super(OutboxDrainTestCase, self).setUp()
+        self.sent = []
+
+    def _queue(self, version):
+        self.engine.execute(delta.sfc_delta_outbox.__table__.insert().values(
+            version_id=version, message=json.dumps({'version': version}),
+            attempts=0, created_at=datetime.datetime.now()))
+
+    def _send(self, messages):
+        self.sent.extend(version for version, message in messages)
+
+    def _drain(self):
+        return self.deltadb.drain_outbox(self.context, self._send, 100,
+                                         'worker', 30)
+
+    def test_writers_committing_out_of_order(self):
+        # Writer A takes version 1, writer B version 2; B commits first
+        self._version(1, leased=True)
+        self._version(2, leased=True)
+        self._queue(2)
+        self._commit(2)
+        self.assertEqual(0, self._drain())
+        self.assertEqual([], self.sent)
+        self._queue(1)
+        self._commit(1)
+        self.assertEqual(2, self._drain())
+        self.assertEqual([1, 2], self.sent)
+
+    def test_failed_send_keeps_messages(self):
+        self._version(1)
+        self._queue(1)
+
+        def _fail(messages):
+            raise IOError()
+        self.assertRaises(IOError, self.deltadb.drain_outbox, self.context,
+                          _fail, 100, 'worker', 30)
+        self.assertEqual(1, self._drain())
+        self.assertEqual([1], self.sent)
+
+    def test_other_owner_holds_lease(self):
+        self._version(1)
+        self._queue(1)
+        self.deltadb.drain_outbox(self.context, self._send, 1, 'other', 30)
+        self._queue(1)
+        self.assertEqual(0, self._drain())
+
+
+if __name__ == '__main__':
+    unittest.main()
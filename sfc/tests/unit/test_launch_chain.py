@@ -0,0 +1,230 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Launch of the appliance instances of a chain by the driver, with nova,
+the CRD database and the instance waiters replaced by fakes.
+"""
+
+import unittest
+
+import eventlet
+from oslo.config import cfg
+
+from sfc.crdservice.common import exceptions as sfc_exc
+from sfc.crdservice.drivers import fsl_driver
+
+
+class FakeTransaction(object):
+
+    def __init__(self, session):
+        self.session = session
+
+    def __enter__(self):
+        self.session.depth += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.session.depth -= 1
+        if exc_type is None and not self.session.depth:
+            self.session.commits += 1
+
+
+class FakeSession(object):
+
+    def __init__(self):
+        self.depth = 0
+        self.commits = 0
+
+    def begin(self, subtransactions=False):
+        return FakeTransaction(self)
+
+
+class FakeContext(object):
+
+    tenant_id = 'tenant'
+
+    def __init__(self):
+        self.session = FakeSession()
+
+
+class FakeServer(object):
+
+    def __init__(self, id):
+        self.id = id
+        self.name = id
+
+
+class FakeServers(object):
+
+    def __init__(self, failing):
+        self.failing = failing
+        self.deleted = []
+
+    def create(self, name, image, flavor, **kwargs):
+        if name in self.failing:
+            raise Exception('boot failed')
+        return FakeServer('server-' + name)
+
+    def delete(self, instance_uuid):
+        self.deleted.append(instance_uuid)
+
+
+class FakeNova(object):
+
+    def __init__(self, failing=()):
+        self.servers = FakeServers(failing)
+        self.security_groups = self
+
+    def get(self, security_group_id):
+        return FakeServer(security_group_id)
+
+
+class FakeSFCPluginDb(object):
+
+    maps = []
+
+    def get_chainset_rule(self, context, rule_id, chainset_id):
+        return {'chain_id': 'chain'}
+
+    def get_chainmap(self, context, chainmap_id):
+        return {'inbound_network_id': 'net', 'outbound_network_id': 'net'}
+
+    def get_chainset(self, context, chainset_id):
+        return {'id': chainset_id}
+
+    def get_chain_topology(self, context, chain_id):
+        return {'appliance_maps': self.maps}
+
+
+class FakeModule(object):
+    """Stands in for a module the driver instantiates classes of."""
+
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class LaunchChainTestCase(unittest.TestCase):
+
+    def setUp(self):
+        FakeSFCPluginDb.maps = [
+            {'id': name, 'name': name, 'chain_id': 'chain',
+             'appliance_id': 'appliance',
+             'appliance': {'image_id': 'image', 'flavor_id': 'flavor',
+                           'security_group_id': 'default',
+                           'config_handle_id': 'handle'}}
+            for name in ('a', 'b', 'c')]
+        self.nova = FakeNova()
+        self._patch(fsl_driver, 'novaclient', lambda context=None: self.nova)
+        self._patch(fsl_driver, 'crdclient', lambda context=None: None)
+        self._patch(fsl_driver, 'sfc_db',
+                    FakeModule(SFCPluginDb=FakeSFCPluginDb))
+        self._patch(fsl_driver, 'sfc_delta_db',
+                    FakeModule(SfcDeltaDb=lambda: None))
+        self._patch(fsl_driver, 'nova_db', FakeModule(NovaDb=lambda: None))
+        self._patch(fsl_driver, 'q_man',
+                    FakeModule(get_plugin=lambda: None))
+        self.addCleanup(cfg.CONF.clear_override, 'launch_pool_size',
+                        'sfc_driver')
+        self.context = FakeContext()
+        self.driver = fsl_driver.SFCDriver.__new__(fsl_driver.SFCDriver)
+        self.driver._wait_appliance_instance = self._wait
+        self.driver._add_appliance_instances = self._record
+        # Seconds each server takes to become ready
+        self.delays = {'server-a': 0.03, 'server-b': 0.01, 'server-c': 0.02}
+        self.waited = []
+        self.recorded = []
+        self.failing_records = set()
+        self.progress = []
+
+    def _patch(self, obj, name, value):
+        self.addCleanup(setattr, obj, name, getattr(obj, name))
+        setattr(obj, name, value)
+
+    def _wait(self, instance_uuid):
+        eventlet.sleep(self.delays[instance_uuid])
+        self.waited.append(instance_uuid)
+        return 'active'
+
+    def _record(self, context, booted, nics):
+        self.assertEqual(1, context.session.depth)
+        uuids = [instance_uuid for appliance_map, instance_uuid in booted]
+        if self.failing_records.intersection(uuids):
+            raise Exception('record failed')
+        self.recorded.append(uuids)
+
+    def _launch(self, pool_size, cancel_at=None):
+        """Launch the chain, cancelling it as appliance cancel_at boots."""
+
+        def _progress(appliance_map, state, instance_uuid=None):
+            self.progress.append((state, instance_uuid))
+            if state == 'booting' and appliance_map['name'] == cancel_at:
+                raise sfc_exc.LaunchJobCancelled(job_id='job')
+
+        cfg.CONF.set_override('launch_pool_size', pool_size, 'sfc_driver')
+        return self.driver.launch_chain(self.context, 'chainset', 'chainmap',
+                                        'rule', _progress)
+
+    def _ready(self):
+        return [instance_uuid for state, instance_uuid in self.progress
+                if state == 'active']
+
+    def test_serial_launch_records_together(self):
+        self.assertEqual('chain', self._launch(1))
+        self.assertEqual([['server-a', 'server-b', 'server-c']],
+                         self.recorded)
+        self.assertEqual(1, self.context.session.commits)
+        self.assertEqual(['server-a', 'server-b', 'server-c'], self._ready())
+
+    def test_failed_boot_deletes_booted_servers(self):
+        self.nova = FakeNova(failing=['c'])
+        self.assertRaises(Exception, self._launch, 1)
+        self.assertEqual([], self.recorded)
+        self.assertEqual(['server-a', 'server-b'],
+                         self.nova.servers.deleted)
+
+    def test_concurrent_launch_records_as_ready(self):
+        self.assertEqual('chain', self._launch(3))
+        self.assertEqual([['server-b'], ['server-c'], ['server-a']],
+                         self.recorded)
+        self.assertEqual(3, self.context.session.commits)
+        self.assertEqual(['server-b', 'server-c', 'server-a'], self._ready())
+        self.assertEqual([], self.nova.servers.deleted)
+
+    def test_concurrent_failure_keeps_recorded_instances(self):
+        self.delays['server-a'] = 0.1
+        self.failing_records.add('server-c')
+        self.assertRaises(Exception, self._launch, 3)
+        self.assertEqual([['server-b']], self.recorded)
+        self.assertEqual(['server-a', 'server-c'],
+                         sorted(self.nova.servers.deleted))
+        # The waiter of the server deleted before it was ready is stopped
+        eventlet.sleep(0.15)
+        self.assertEqual(['server-b', 'server-c'], self.waited)
+
+    def test_serial_cancel_keeps_booted_servers(self):
+        self.assertRaises(sfc_exc.LaunchJobCancelled, self._launch, 1, 'c')
+        self.assertEqual([['server-a', 'server-b']], self.recorded)
+        self.assertEqual(['server-a', 'server-b'], self._ready())
+        self.assertEqual([], self.nova.servers.deleted)
+
+    def test_concurrent_cancel_keeps_booted_servers(self):
+        self.assertRaises(sfc_exc.LaunchJobCancelled, self._launch, 3, 'b')
+        self.assertEqual([['server-a']], self.recorded)
+        self.assertEqual(['server-a'], self._ready())
+        self.assertEqual([], self.nova.servers.deleted)
+
+
+if __name__ == '__main__':
+    unittest.main()
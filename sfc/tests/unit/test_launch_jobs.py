@@ -0,0 +1,155 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+States of launch jobs run by the plugin, cancellation of a running job and
+the failing of jobs orphaned by stopped API workers, on an SQLite schema
+built from the models.
+"""
+
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from nscs.crdservice.db import model_base
+from sfc.crdservice.common import exceptions as sfc_exc
+from sfc.crdservice.db import sfc_db
+from sfc.crdservice.plugins import sfc_plugin
+
+TENANT = 'tenant'
+
+
+class FakeContext(object):
+
+    is_admin = True
+    tenant_id = TENANT
+    user_id = 'user'
+
+    def __init__(self, engine):
+        self.session = orm.sessionmaker(bind=engine, autocommit=True)()
+
+
+class FakeDriver(object):
+    """
+    Boots the appliances a and b, calling booted(name) once the server of
+    each is created.
+    """
+
+    def __init__(self):
+        self.launches = 0
+        self.booted = lambda name: None
+
+    def launch_chain(self, context, chainset_id, chainmap_id, rule_id,
+                     progress):
+        self.launches += 1
+        for name in ('a', 'b'):
+            appliance_map = {'id': name, 'name': name}
+            progress(appliance_map, 'booting')
+            progress(appliance_map, 'booted', 'server-' + name)
+            self.booted(name)
+            progress(appliance_map, 'active', 'server-' + name)
+
+
+class LaunchJobTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        model_base.BASEV2.metadata.create_all(self.engine)
+        self.context = FakeContext(self.engine)
+        self.plugin = sfc_plugin.SFCPlugin.__new__(sfc_plugin.SFCPlugin)
+        self.plugin.db = sfc_db.SFCPluginDb()
+        self.plugin.driver = FakeDriver()
+
+    def _create_job(self, owner='host:1'):
+        return self.plugin.db.create_launch_job(self.context, {
+            'launch_job': {'operation': 'launch', 'tenant_id': TENANT,
+                           'chainset_id': 'chainset', 'chainmap_id': 'map',
+                           'rule_id': 'rule', 'owner': owner}})
+
+    def _run(self, job):
+        self.plugin._run_launch_job(self.context, job)
+        return self.plugin.db.get_launch_job(self.context, job['id'])
+
+    def _cancel(self, job):
+        return self.plugin.cancel_launch_job(self.context,
+                                             job['id'])['launch_job']
+
+    def test_completed(self):
+        job = self._run(self._create_job())
+        self.assertEqual(sfc_db.JOB_COMPLETED, job['status'])
+        self.assertEqual([('a', 'active', 'server-a'),
+                          ('b', 'active', 'server-b')],
+                         [(step['name'], step['state'], step['instance_uuid'])
+                          for step in job['progress']])
+        self.assertTrue(job['started_at'] and job['finished_at'])
+
+    def test_failed(self):
+        def _booted(name):
+            raise Exception('no host for %s' % name)
+
+        self.plugin.driver.booted = _booted
+        job = self._run(self._create_job())
+        self.assertEqual(sfc_db.JOB_FAILED, job['status'])
+        self.assertEqual('no host for a', job['error'])
+
+    def test_cancelled_while_pending_never_runs(self):
+        job = self._create_job()
+        self.assertEqual(sfc_db.JOB_CANCELLED, self._cancel(job)['status'])
+        self.assertEqual(sfc_db.JOB_CANCELLED, self._run(job)['status'])
+        self.assertEqual(0, self.plugin.driver.launches)
+
+    def test_cancelled_while_running(self):
+        job = self._create_job()
+        statuses = []
+
+        def _booted(name):
+            if name == 'a':
+                statuses.append(self._cancel(job)['status'])
+
+        self.plugin.driver.booted = _booted
+        job = self._run(job)
+        self.assertEqual([sfc_db.JOB_CANCELLING], statuses)
+        self.assertEqual(sfc_db.JOB_CANCELLED, job['status'])
+        # The appliance booted before the cancellation is kept, the next
+        # one never boots
+        self.assertEqual([('a', 'active'), ('b', 'booting')],
+                         [(step['name'], step['state'])
+                          for step in job['progress']])
+
+    def test_finished_job_is_not_cancelled(self):
+        job = self._run(self._create_job())
+        self.assertRaises(sfc_exc.LaunchJobFinished, self._cancel, job)
+
+    def test_fail_orphaned_launch_jobs(self):
+        dead = self._create_job('host:1')
+        alive = self._create_job('host:2')
+        elsewhere = self._create_job('other:1')
+        unowned = self._create_job(None)
+        finished = self._run(self._create_job('host:1'))
+        failed = self.plugin.db.fail_orphaned_launch_jobs(
+            self.context, 'host', lambda pid: pid == 2)
+        self.assertEqual(sorted([dead['id'], unowned['id']]), sorted(failed))
+        statuses = dict(
+            (job['id'], job['status'])
+            for job in self.plugin.db.get_launch_jobs(self.context))
+        self.assertEqual(sfc_db.JOB_FAILED, statuses[dead['id']])
+        self.assertEqual(sfc_db.JOB_PENDING, statuses[alive['id']])
+        self.assertEqual(sfc_db.JOB_PENDING, statuses[elsewhere['id']])
+        self.assertEqual(sfc_db.JOB_COMPLETED, statuses[finished['id']])
+
+
+if __name__ == '__main__':
+    unittest.main()
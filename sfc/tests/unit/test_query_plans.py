@@ -0,0 +1,123 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Query plans of the SFC lookup hot paths.
+
+Every lookup the plugin, the driver and the delta code run per request
+is explained on an empty SQLite schema built from the models; the test
+fails when one of them falls back to a full table scan, which means an
+index it relies on is gone.
+"""
+
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy.engine import reflection
+
+from nscs.crdservice.db import model_base
+from sfc.crdservice.db import delta
+from sfc.crdservice.db import migration
+from sfc.crdservice.db import sfc_db
+
+ID = 'a3c1e0f2-5d0b-4e4c-9e7e-2f1d3c4b5a69'
+VERSION = 100
+
+# (hot path, model, filter on the model)
+HOT_PATHS = (
+    ('selection rules of a chain', sfc_db.SFCChainSelectionRule,
+     lambda m: m.chain_id == ID),
+    ('selection rules of a chainset', sfc_db.SFCChainSelectionRule,
+     lambda m: m.chainset_id == ID),
+    ('bypass rules of a chain', sfc_db.SFCChainBypassRule,
+     lambda m: m.chain_id == ID),
+    ('network maps of a chainset', sfc_db.SFCChainsetNetworkMap,
+     lambda m: m.chainset_id == ID),
+    ('zones of a chainset', sfc_db.SFCChainsetZone,
+     lambda m: m.chainset_id == ID),
+    ('appliances of a config handle', sfc_db.SFCAppliance,
+     lambda m: m.config_handle_id == ID),
+    ('chain appliance of a chain and appliance', sfc_db.SFCChainAppliance,
+     lambda m: sa.and_(m.chain_id == ID, m.appliance_id == ID)),
+    ('chain appliances of an appliance', sfc_db.SFCChainAppliance,
+     lambda m: m.appliance_id == ID),
+    ('appliance instance of a nova instance', sfc_db.SFCApplianceInstance,
+     lambda m: m.instance_uuid == ID),
+    ('appliance instances of a chain appliance', sfc_db.SFCApplianceInstance,
+     lambda m: m.appliance_map_id == ID),
+    ('appliance instances of a tenant network', sfc_db.SFCApplianceInstance,
+     lambda m: sa.and_(m.network_id == ID, m.tenant_id == ID)),
+    ('rule deltas of a chainset newer than a version',
+     delta.sfc_chainrules_delta,
+     lambda m: sa.and_(m.chainset_id == ID, m.version_id > VERSION)),
+    ('outbox messages up to the committed version', delta.sfc_delta_outbox,
+     lambda m: m.version_id <= VERSION),
+)
+
+
+class QueryPlanTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        model_base.BASEV2.metadata.create_all(self.engine)
+
+    def _plan(self, model, criterion):
+        query = sa.select([model.__table__]).where(criterion(model))
+        compiled = query.compile(dialect=self.engine.dialect)
+        params = [compiled.params[name] for name in compiled.positiontup]
+        rows = self.engine.execute('EXPLAIN QUERY PLAN %s' % compiled,
+                                   params)
+        return [row[-1] for row in rows]
+
+    def assertIndexed(self, path, model, criterion):
+        plan = self._plan(model, criterion)
+        scans = [step for step in plan
+                 if step.startswith('SCAN') and 'INDEX' not in step]
+        self.assertFalse(scans, '%s scans %s: %s' % (
+            path, model.__tablename__, plan))
+
+    def test_lookups_use_indexes(self):
+        for path, model, criterion in HOT_PATHS:
+            self.assertIndexed(path, model, criterion)
+
+    def test_object_deltas_use_indexes(self):
+        for model, object_column in delta.COMPACTED_DELTAS:
+            self.assertIndexed(
+                'deltas of an object', model,
+                lambda m: sa.and_(getattr(m, object_column) == ID,
+                                  m.operation == 'create',
+                                  m.version_id > VERSION))
+
+    def test_resync_deltas_use_indexes(self):
+        for model, object_column in delta.COMPACTED_DELTAS:
+            self.assertIndexed(
+                'deltas newer than a version', model,
+                lambda m: sa.and_(m.version_id > VERSION,
+                                  m.version_id <= VERSION * 2))
+
+    def test_upgrade_adds_missing_indexes(self):
+        table = sfc_db.SFCChainSelectionRule.__table__
+        index = [index for index in table.indexes
+                 if list(index.columns) == [table.c.chain_id]][0]
+        index.drop(bind=self.engine)
+        migration._add_missing_indexes(
+            self.engine, reflection.Inspector.from_engine(self.engine))
+        self.assertIndexed('selection rules of a chain',
+                           sfc_db.SFCChainSelectionRule,
+                           lambda m: m.chain_id == ID)
+
+
+if __name__ == '__main__':
+    unittest.main()
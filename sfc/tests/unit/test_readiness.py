@@ -0,0 +1,113 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Wakeups of the waiters of instances by the notifications resolving them.
+"""
+
+import time
+import unittest
+
+import eventlet
+from oslo.config import cfg
+
+from sfc.crdservice.common import readiness
+
+
+class InstanceReadinessTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ready = readiness.InstanceReadiness()
+        self.addCleanup(cfg.CONF.clear_override, 'instance_poll_interval',
+                        'sfc_driver')
+
+    def test_resolve_wakes_waiter(self):
+        self.ready.register('u1')
+        waiter = eventlet.spawn(self.ready.wait, 'u1', 5)
+        eventlet.sleep(0)
+        self.ready.resolve('u1', 'active')
+        self.assertEqual('active', waiter.wait())
+
+    def test_resolve_wakes_every_waiter(self):
+        self.ready.register('u1')
+        self.ready.register('u1')
+        waiters = [eventlet.spawn(self.ready.wait, 'u1', 5)
+                   for i in range(2)]
+        eventlet.sleep(0)
+        self.ready.resolve('u1', 'error')
+        self.assertEqual(['error', 'error'],
+                         [waiter.wait() for waiter in waiters])
+
+    def test_wait_times_out(self):
+        self.ready.register('u1')
+        self.assertEqual(None, self.ready.wait('u1', 0.01))
+
+    def test_state_seen_once(self):
+        self.ready.register('u1')
+        self.ready.resolve('u1', 'active')
+        self.assertEqual('active', self.ready.wait('u1', 0.01))
+        self.assertEqual(None, self.ready.wait('u1', 0.01))
+
+    def test_resolve_without_waiter_is_ignored(self):
+        self.ready.resolve('u1', 'active')
+        self.assertEqual({}, self.ready.events)
+
+    def test_discard_keeps_other_waiters(self):
+        self.ready.register('u1')
+        self.ready.register('u1')
+        self.ready.discard('u1')
+        self.assertTrue('u1' in self.ready.events)
+        self.ready.discard('u1')
+        self.assertEqual({}, self.ready.events)
+        self.assertEqual({}, self.ready.waiters)
+
+    def test_wait_for_checks_again_when_resolved(self):
+        cfg.CONF.set_override('instance_poll_interval', 60, 'sfc_driver')
+        states = []
+
+        def _check():
+            states.append(None)
+            if len(states) > 1:
+                return 'active'
+
+        waiter = eventlet.spawn(self.ready.wait_for, 'u1', _check)
+        eventlet.sleep(0)
+        started = time.time()
+        self.ready.resolve('u1', 'active')
+        self.assertEqual('active', waiter.wait())
+        self.assertTrue(time.time() - started < 5)
+        self.assertEqual(2, len(states))
+        self.assertEqual({}, self.ready.events)
+
+    def test_wait_for_polls_without_notification(self):
+        cfg.CONF.set_override('instance_poll_interval', 0, 'sfc_driver')
+        checks = []
+
+        def _check():
+            checks.append(None)
+            if len(checks) == 3:
+                return 'active'
+
+        self.assertEqual('active', self.ready.wait_for('u1', _check))
+
+    def test_wait_for_times_out(self):
+        cfg.CONF.set_override('instance_poll_interval', 60, 'sfc_driver')
+        self.assertEqual(None, self.ready.wait_for('u1', lambda: None,
+                                                   timeout=0.05))
+        self.assertEqual({}, self.ready.waiters)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Resync of a consumer across a bulk write, whose deltas share a version.
+"""
+
+import collections
+import json
+import unittest
+
+from sfc.crdconsumer import plugin as consumer_plugin
+from sfc.crdservice.plugins import delta as plugin_delta
+
+
+def _rule(rule_id):
+    return {'method': 'create_chainrule',
+            'payload': {'chain_rule_id': rule_id, 'chainset_id': 'cs1',
+                        'operation': 'create'}}
+
+
+class FakeDeltaDb(object):
+    """Delta tables holding a chain and a bulk write of three rules."""
+
+    def __init__(self):
+        self.deltas = [(6, {'method': 'create_chain',
+                            'payload': {'chain_id': 'c1',
+                                        'operation': 'create'}}),
+                       (7, _rule('r1')), (7, _rule('r2')), (7, _rule('r3'))]
+
+    def get_compaction_horizon(self, context):
+        return 0
+
+    def get_runtime_version(self, context):
+        return self.deltas[-1][0]
+
+    def get_deltas_since(self, context, version, until):
+        return [entry for entry in self.deltas
+                if version < entry[0] <= until]
+
+
+class BulkResyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sfcdelta = plugin_delta.SfcDelta.__new__(plugin_delta.SfcDelta)
+        self.sfcdelta.deltadb = FakeDeltaDb()
+
+    def _consumer(self):
+        consumer = consumer_plugin.SFCConsumerPlugin.__new__(
+            consumer_plugin.SFCConsumerPlugin)
+        consumer.consumer_context = None
+        consumer.listener_topic = 'crd-listener'
+        consumer.shadow = collections.OrderedDict()
+        consumer.compact_updates = False
+
+        def call(context, msg, topic):
+            # The reply crosses the message bus as JSON
+            return json.loads(json.dumps(self.sfcdelta.sfc_init(None, 6,
+                                                                'host')))
+        consumer.call = call
+        return consumer
+
+    def test_sfc_init_sends_every_delta_of_a_version(self):
+        deltas = self.sfcdelta.sfc_init(None, 6, 'host')
+        self.assertEqual([(7, 'r1'), (7, 'r2'), (7, 'r3')],
+                         [(version, message['payload']['chain_rule_id'])
+                          for version, message in deltas])
+
+    def test_consumer_applies_every_delta_of_a_version(self):
+        consumer = self._consumer()
+        applied = []
+        consumer.apply_message = lambda context, message: applied.append(
+            message['payload']['chain_rule_id'])
+        delta_msg = consumer.init_consumer({'payload': {'version': 6,
+                                                        'hostname': 'host'}})
+        for version in sorted(delta_msg):
+            message = delta_msg[version]
+            getattr(consumer, message['method'])(None,
+                                                 payload=message['payload'])
+        self.assertEqual(['r1', 'r2', 'r3'], applied)
+
+
+if __name__ == '__main__':
+    unittest.main()
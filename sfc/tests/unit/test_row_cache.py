@@ -0,0 +1,121 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Row cache of the database plugin across API workers, each with a cache
+of its own, on an SQLite schema built from the models.
+"""
+
+import datetime
+import unittest
+import uuid
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from nscs.crdservice.common import exceptions as q_exc
+from nscs.crdservice.db import model_base
+from sfc.crdservice.db import delta
+from sfc.crdservice.db import sfc_db
+
+TENANT = 'tenant'
+
+
+class FakeContext(object):
+
+    is_admin = True
+    tenant_id = TENANT
+    user_id = 'user'
+
+    def __init__(self, engine):
+        self.session = orm.sessionmaker(bind=engine, autocommit=True)()
+
+
+class RowCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        model_base.BASEV2.metadata.create_all(self.engine)
+        self.version = 0
+        self.workers = []
+        for index in range(2):
+            db = sfc_db.SFCPluginDb()
+            db.row_cache = sfc_db.RowCache(16)
+            self.workers.append((db, FakeContext(self.engine)))
+
+    def _log_chain(self, chain, operation):
+        """Write the delta the plugin writes with a chain change."""
+        self.version += 1
+        versions = model_base.BASEV2.metadata.tables['crd_versions']
+        self.engine.execute(versions.insert().values(
+            runtime_version=self.version))
+        self.engine.execute(delta.sfc_chains_delta.__table__.insert().values(
+            id=str(uuid.uuid4()), tenant_id=TENANT, chain_id=chain['id'],
+            name=chain['name'], operation=operation, user_id='user',
+            logged_at=datetime.datetime.now(), version_id=self.version))
+
+    def _create_chain(self, name):
+        db, context = self.workers[0]
+        chain = db.create_chain(context, {'chain': {
+            'tenant_id': TENANT, 'name': name, 'auto_boot': False}})
+        self._log_chain(chain, 'create')
+        return chain
+
+    def _get_chain(self, worker, id):
+        db, context = self.workers[worker]
+        return db.get_chain(context, id)
+
+    def test_update_by_other_worker_is_seen(self):
+        chain = self._create_chain('a')
+        self.assertEqual('a', self._get_chain(0, chain['id'])['name'])
+        db, context = self.workers[1]
+        chain = db.update_chain(context, chain['id'], {'chain': {'name': 'b'}})
+        self._log_chain(chain, 'update')
+        self.assertEqual('b', self._get_chain(0, chain['id'])['name'])
+
+    def test_delete_by_other_worker_is_seen(self):
+        chain = self._create_chain('a')
+        self._get_chain(0, chain['id'])
+        db, context = self.workers[1]
+        db.delete_chain(context, chain['id'])
+        self._log_chain(chain, 'delete')
+        self.assertRaises(q_exc.ChainNotFound, self._get_chain, 0,
+                          chain['id'])
+
+    def test_unchanged_rows_stay_cached(self):
+        changed = self._create_chain('a')
+        unchanged = self._create_chain('b')
+        self._get_chain(0, changed['id'])
+        self._get_chain(0, unchanged['id'])
+        db, context = self.workers[1]
+        self._log_chain(db.update_chain(context, changed['id'],
+                                        {'chain': {'name': 'c'}}), 'update')
+        cache = self.workers[0][0].row_cache
+        hits = cache.stats['hits']
+        self.assertEqual('b', self._get_chain(0, unchanged['id'])['name'])
+        self.assertEqual(hits + 1, cache.stats['hits'])
+        self.assertEqual('c', self._get_chain(0, changed['id'])['name'])
+
+    def test_row_read_before_a_move_is_not_cached(self):
+        cache = sfc_db.RowCache(16)
+        cache.advance(None, 1, None)
+        generation = cache.generation
+        cache.advance(1, 2, [('chain', ['c1'])])
+        cache.put('chain', 'c1', {'id': 'c1'}, generation)
+        self.assertEqual(None, cache.get('chain', 'c1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
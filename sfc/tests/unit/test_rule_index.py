@@ -0,0 +1,148 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import random
+import unittest
+
+from sfc.crdservice.common import rule_index
+
+
+class IntervalTreeTestCase(unittest.TestCase):
+    """Interval tree against a brute-force list of intervals."""
+
+    def setUp(self):
+        self.random = random.Random(1)
+        self.tree = rule_index.IntervalTree()
+        self.intervals = {}
+
+    def _insert(self, key):
+        start = self.random.randrange(1000)
+        end = start + self.random.choice([0, 1, 5, 50, 400])
+        self.tree.insert(key, start, end)
+        self.intervals[key] = (start, end)
+
+    def _overlapping(self, start, end):
+        return sorted(key for key, (first, last) in self.intervals.items()
+                      if first <= end and last >= start)
+
+    def _check(self):
+        self.assertEqual(len(self.intervals), len(self.tree))
+        for i in range(50):
+            start = self.random.randrange(-10, 1100)
+            end = start + self.random.choice([0, 3, 30, 300])
+            self.assertEqual(self._overlapping(start, end),
+                             sorted(self.tree.overlapping(start, end)))
+
+    def test_insert(self):
+        for key in range(500):
+            self._insert(key)
+            if key % 50 == 0:
+                self._check()
+        self._check()
+
+    def test_shared_starts(self):
+        for key in range(200):
+            self.tree.insert(key, 7, 7 + key % 5)
+            self.intervals[key] = (7, 7 + key % 5)
+        self._check()
+        for key in range(0, 200, 3):
+            self.assertTrue(self.tree.remove(key, 7))
+            del self.intervals[key]
+        self._check()
+
+    def test_remove(self):
+        for key in range(500):
+            self._insert(key)
+        keys = list(self.intervals)
+        self.random.shuffle(keys)
+        for key in keys[:300]:
+            self.assertTrue(self.tree.remove(key, self.intervals.pop(key)[0]))
+        self._check()
+        for key in keys[:100]:
+            self._insert(key)
+        self._check()
+
+    def test_remove_missing_keeps_size(self):
+        for key in range(20):
+            self._insert(key)
+        self.assertFalse(self.tree.remove('missing', 5))
+        self.assertFalse(self.tree.remove(3, self.intervals[3][0] + 1))
+        self.assertTrue(self.tree.remove(3, self.intervals.pop(3)[0]))
+        self.assertFalse(self.tree.remove(3, 0))
+        self._check()
+
+    def test_overlapping_limit(self):
+        for key in range(100):
+            self.tree.insert(key, 0, 10)
+        self.assertEqual(None, self.tree.overlapping(5, 5, limit=99))
+        self.assertEqual(100, len(self.tree.overlapping(5, 5, limit=100)))
+
+
+class RuleIndexTestCase(unittest.TestCase):
+    """Rule index lookups against a comparison with every rule."""
+
+    def setUp(self):
+        self.random = random.Random(2)
+        self.index = rule_index.RuleIndex()
+        self.rules = {}
+
+    def _rule(self, rule_id):
+        rule = {'id': rule_id, 'chain_id': 'c%d' % self.random.randrange(3)}
+        for prefix, span in (('sip', 1 << 12), ('dip', 1 << 12),
+                             ('sp', 1024), ('dp', 1024)):
+            if self.random.random() < 0.2:
+                continue
+            start = self.random.randrange(span)
+            rule['%s_start_num' % prefix] = start
+            rule['%s_end_num' % prefix] = start + self.random.choice(
+                [0, 0, 15, 255])
+        rule['protocol_num'] = self.random.choice([6, 17, None])
+        return rule
+
+    def _brute_overlapping(self, rule):
+        match = rule_index._match(rule)
+        prefixes = [prefix for prefix in rule_index.RANGES
+                    if match[prefix] is not None]
+        return sorted(rule_id for rule_id, other in self.rules.items()
+                      if rule_id != rule['id'] and rule_index._overlaps(
+                          match, rule_index._match(other), prefixes))
+
+    def _check(self):
+        self.assertEqual(len(self.rules), len(self.index))
+        for i in range(30):
+            rule = self._rule('probe')
+            self.assertEqual(self._brute_overlapping(rule),
+                             sorted(self.index.overlapping(rule)))
+
+    def test_add_remove_replace(self):
+        for i in range(400):
+            rule = self._rule('r%d' % i)
+            self.index.add(rule)
+            self.rules[rule['id']] = rule
+        self._check()
+        for i in range(0, 400, 2):
+            self.index.remove('r%d' % i)
+            del self.rules['r%d' % i]
+        for i in range(1, 400, 4):
+            rule = self._rule('r%d' % i)
+            self.index.add(rule)
+            self.rules[rule['id']] = rule
+        self._check()
+        self.index.remove('missing')
+        self._check()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from nscs.crdservice.common import exceptions as q_exc
+from sfc.crdservice.db import rule_match
+
+
+class EthValueTestCase(unittest.TestCase):
+
+    def _eth_value(self, value):
+        return rule_match.typed_flow({'eth_value': value})['eth_value_num']
+
+    def test_ethertypes_are_hex(self):
+        for value in ('0x0800', '0X0800', '0800', '800'):
+            self.assertEqual(0x0800, self._eth_value(value))
+        for value in ('0x86DD', '86DD', '86dd'):
+            self.assertEqual(0x86dd, self._eth_value(value))
+
+    def test_invalid_ethertype(self):
+        for value in ('0x', 'ipv4', '08 00'):
+            self.assertRaises(q_exc.InvalidInput, self._eth_value, value)
+
+    def test_rule_without_value_matches_any(self):
+        self.assertEqual(None, rule_match.typed_match(
+            {'eth_type': 'any', 'eth_value': '0800'})['eth_value_num'])
+
+
+if __name__ == '__main__':
+    unittest.main()
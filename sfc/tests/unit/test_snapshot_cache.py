@@ -0,0 +1,93 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Snapshot cache shared by bootstrapping consumers.
+"""
+
+import unittest
+
+from sfc.crdservice.plugins import delta as plugin_delta
+
+
+class FakeDeltaDb(object):
+
+    def __init__(self):
+        self.changed = []
+
+    def get_compaction_horizon(self, ctx):
+        return 0
+
+    def get_changed_object_ids(self, ctx, delta_model, id_key, version):
+        if delta_model is plugin_delta.SNAPSHOT_RESOURCES[0][0]:
+            return self.changed
+        return []
+
+
+class FakeSfcDelta(object):
+    """Appliances a1 and a2, each with a name."""
+
+    snapshot_sequence = staticmethod(plugin_delta.SfcDelta.snapshot_sequence)
+
+    def __init__(self):
+        self.deltadb = FakeDeltaDb()
+        self.names = {'a1': 'fw', 'a2': 'lb'}
+
+    def iter_snapshot(self, ctx, version, resources=None, ids=None):
+        for id in sorted(self.names):
+            if ids is not None and id not in ids:
+                continue
+            yield (self.snapshot_sequence(0, id), 1,
+                   {'method': 'create_appliance',
+                    'payload': {'id': id, 'name': self.names[id],
+                                'version_id': version}})
+
+
+class SnapshotCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sfcdelta = FakeSfcDelta()
+        self.cache = plugin_delta.SnapshotCache(self.sfcdelta, 1024 * 1024)
+
+    def _payloads(self, entries):
+        return [message['payload'] for sequence, verid, message in entries]
+
+    def test_extend_reads_changed_objects(self):
+        self.cache.get(None, 5)
+        self.sfcdelta.names['a2'] = 'ids'
+        self.sfcdelta.deltadb.changed = ['a2']
+        self.assertEqual([('fw', 6), ('ids', 6)],
+                         [(payload['name'], payload['version_id'])
+                          for payload in self._payloads(
+                              self.cache.get(None, 6))])
+        self.assertEqual(1, self.cache.stats['extends'])
+
+    def test_extend_leaves_pages_handed_out_alone(self):
+        first = self.cache.get(None, 5, limit=1)
+        self.cache.get(None, 6)
+        self.assertEqual([5], [payload['version_id']
+                               for payload in self._payloads(first)])
+
+    def test_pages_follow_cursor(self):
+        first = self.cache.get(None, 5, limit=1)
+        rest = self.cache.get(None, 5, cursor=first[-1][0])
+        self.assertEqual(['a1', 'a2'],
+                         [payload['id'] for payload in
+                          self._payloads(first + rest)])
+        self.assertEqual(1, self.cache.stats['hits'])
+
+
+if __name__ == '__main__':
+    unittest.main()
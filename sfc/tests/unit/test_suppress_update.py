@@ -0,0 +1,101 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Suppression of no-op updates by the plugin and the changed fields of the
+deltas it writes, on an SQLite schema built from the models.
+"""
+
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from nscs.crdservice.db import model_base
+from sfc.crdservice.db import sfc_db
+from sfc.crdservice.plugins import sfc_plugin
+
+TENANT = 'tenant'
+
+
+class FakeContext(object):
+
+    is_admin = True
+    tenant_id = TENANT
+    user_id = 'user'
+
+    def __init__(self, engine):
+        self.session = orm.sessionmaker(bind=engine, autocommit=True)()
+
+
+class FakeSfcDelta(object):
+    """Records the chain deltas the plugin writes."""
+
+    def __init__(self):
+        self.deltas = []
+
+    def create_chains_delta(self, context, delta):
+        self.deltas.append(delta['chains_delta'])
+
+
+class SuppressUpdateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        model_base.BASEV2.metadata.create_all(self.engine)
+        self.context = FakeContext(self.engine)
+        self.plugin = sfc_plugin.SFCPlugin.__new__(sfc_plugin.SFCPlugin)
+        self.plugin.db = sfc_db.SFCPluginDb()
+        self.plugin.db.row_cache = sfc_db.RowCache(16)
+        self.plugin.sfcdelta = FakeSfcDelta()
+        self.plugin.stats = {'suppressed_updates': 0}
+        self.chain = self.plugin.db.create_chain(self.context, {'chain': {
+            'tenant_id': TENANT, 'name': 'a', 'auto_boot': False}})
+
+    def _update(self, **fields):
+        return self.plugin.update_chain(self.context, self.chain['id'],
+                                        {'chain': fields})
+
+    def test_changed_fields(self):
+        self.assertEqual(['auto_boot', 'name'], self.plugin._changed_fields(
+            {'id': 'c', 'name': 'a', 'auto_boot': False, 'extras': ''},
+            {'id': 'c', 'name': 'b', 'auto_boot': True,
+             'operation': 'update'}))
+
+    def test_update_writes_changed_fields(self):
+        self.assertEqual('b', self._update(name='b')['name'])
+        [delta] = self.plugin.sfcdelta.deltas
+        self.assertEqual(['name'], delta['changed_fields'])
+        self.assertEqual('update', delta['operation'])
+        self.assertEqual(0, self.plugin.stats['suppressed_updates'])
+
+    def test_unchanged_update_is_suppressed(self):
+        self.assertEqual('a', self._update(name='a')['name'])
+        self.assertEqual([], self.plugin.sfcdelta.deltas)
+        self.assertEqual(1, self.plugin.stats['suppressed_updates'])
+
+    def test_compared_with_the_row_not_the_cache(self):
+        # The cache still holds 'a' after another worker renamed the chain
+        self.plugin.db.get_chain(self.context, self.chain['id'])
+        self.engine.execute(sfc_db.SFCChain.__table__.update().values(
+            name='b'))
+        self._update(name='a')
+        [delta] = self.plugin.sfcdelta.deltas
+        self.assertEqual(['name'], delta['changed_fields'])
+        self.assertEqual(0, self.plugin.stats['suppressed_updates'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+VLAN pair allocation of appliance instances, on an SQLite database file
+so that a concurrent launch can write while an allocation is under way.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+from sqlalchemy import pool
+
+from nscs.crdservice.db import model_base
+from sfc.crdservice.common import exceptions as sfc_exc
+from sfc.crdservice.db import sfc_db
+
+TENANT = 'tenant'
+NETWORK = 'network'
+
+
+class FakeContext(object):
+
+    is_admin = True
+    tenant_id = TENANT
+
+    def __init__(self, session):
+        self.session = session
+
+
+class VlanAllocationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        self.engine = sa.create_engine(
+            'sqlite:///%s' % os.path.join(path, 'sfc.db'),
+            poolclass=pool.NullPool)
+        model_base.BASEV2.metadata.create_all(self.engine)
+        self.engine.execute(sfc_db.SFCVLANQuota.__table__.insert().values(
+            id='quota', tenant_id=TENANT, vlan_start=10, vlan_end=15))
+        self.make_session = orm.sessionmaker(bind=self.engine,
+                                             autocommit=True)
+        # The allocator creates missing rows in a session of its own
+        get_session = sfc_db.db_api.get_session
+        self.addCleanup(setattr, sfc_db.db_api, 'get_session', get_session)
+        sfc_db.db_api.get_session = lambda *args, **kwargs: (
+            self.make_session())
+        self.context = FakeContext(self.make_session())
+        self.db = sfc_db.SFCPluginDb()
+
+    def _allocate(self, *instance_ids):
+        return self.db.allocate_vlan_pairs(self.context, NETWORK,
+                                           list(instance_ids))
+
+    def _held(self):
+        table = sfc_db.SFCVLANAllocation.__table__
+        return dict((row['vlan_id'], row['instance_id'])
+                    for row in self.engine.execute(table.select().where(
+                        table.c.instance_id != None)))
+
+    def test_pairs_taken_lowest_first(self):
+        self.assertEqual({'i1': (10, 11), 'i2': (12, 13)},
+                         self._allocate('i1', 'i2'))
+        self.assertEqual({'i3': (14, 15)}, self._allocate('i3'))
+
+    def test_quota_exhausted(self):
+        self._allocate('i1', 'i2')
+        self.assertRaises(sfc_exc.VlanRangeExhausted, self._allocate,
+                          'i3', 'i4')
+        # A failed allocation holds nothing
+        self.assertEqual(set(['i1', 'i2']), set(self._held().values()))
+        self.assertEqual({'i3': (14, 15)}, self._allocate('i3'))
+
+    def test_released_vlans_reused(self):
+        self._allocate('i1', 'i2')
+        self.db.release_vlans(self.context, 'i1')
+        self.assertEqual({'i3': (10, 11)}, self._allocate('i3'))
+
+    def test_vlans_of_older_instances_kept(self):
+        self.engine.execute(
+            sfc_db.SFCApplianceInstance.__table__.insert().values(
+                id='old', tenant_id=TENANT, appliance_map_id='map',
+                network_id=NETWORK, vlan_in=10, vlan_out=11))
+        self.assertEqual({'i1': (12, 13)}, self._allocate('i1'))
+        self.assertEqual('old', self._held()[10])
+
+    def test_concurrent_launch_creates_rows_first(self):
+        make_session = self.make_session
+        db = self.db
+
+        class RacingSession(object):
+            """Loses the race to a launch creating the same rows."""
+
+            def begin(self, subtransactions=False):
+                db._sync_vlan_allocations(TENANT, NETWORK, 10, 15)
+                raise sa.exc.IntegrityError('INSERT', {}, Exception())
+
+        sessions = [RacingSession()]
+        sfc_db.db_api.get_session = lambda *args, **kwargs: (
+            sessions.pop() if sessions else make_session())
+        self.assertEqual({'i1': (10, 11)}, self._allocate('i1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
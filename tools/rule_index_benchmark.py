@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# Copyright 2013 Freescale Semiconductor, Inc.
+# All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of the selection rule index of a chainset.
+
+Loads 100k random rules into a RuleIndex, checking the conflicts of each
+rule before adding it as the plugin does, then times conflict checks and
+removals at full size against comparing a rule with every other one.
+Run from the top of the source tree:
+
+    python tools/rule_index_benchmark.py [number of rules]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+from sfc.crdservice.common import rule_index
+
+SAMPLE = 200
+
+
+def make_rule(i, prefix_lengths, any_address, any_port):
+    rule = {'id': 'r%06d' % i, 'chain_id': 'c%d' % random.randrange(20)}
+    for prefix in ('sip', 'dip'):
+        if random.random() < any_address:
+            continue
+        length = random.choice(prefix_lengths)
+        start = ((10 << 24) + random.randrange(1 << 24)) & \
+            ~((1 << (32 - length)) - 1) & 0xffffffff
+        rule['%s_start_num' % prefix] = start
+        rule['%s_end_num' % prefix] = start + (1 << (32 - length)) - 1
+    for prefix in ('sp', 'dp'):
+        if random.random() < any_port:
+            continue
+        start = random.randrange(1, 65000)
+        rule['%s_start_num' % prefix] = start
+        rule['%s_end_num' % prefix] = start + random.choice([0, 0, 10, 100])
+    rule['protocol_num'] = random.choice([6, 17, None])
+    return rule
+
+
+def run(name, count, prefix_lengths, any_address, any_port):
+    random.seed(7)
+    rules = [make_rule(i, prefix_lengths, any_address, any_port)
+             for i in range(count)]
+    index = rule_index.RuleIndex()
+    start = time.time()
+    conflicts = 0
+    for rule in rules:
+        conflicts += len(index.conflicts(rule))
+        index.add(rule)
+    build = time.time() - start
+    sample = rules[-SAMPLE:]
+
+    start = time.time()
+    for rule in sample:
+        index.conflicts(rule)
+    check = (time.time() - start) / SAMPLE
+
+    matches = [rule_index._match(rule) for rule in rules]
+    start = time.time()
+    for rule in sample:
+        match = rule_index._match(rule)
+        prefixes = [prefix for prefix in rule_index.RANGES
+                    if match[prefix] is not None]
+        for other in matches:
+            rule_index._overlaps(match, other, prefixes)
+    scan = (time.time() - start) / SAMPLE
+
+    start = time.time()
+    for rule in sample:
+        index.remove(rule['id'])
+    remove = (time.time() - start) / SAMPLE
+
+    print('%s: build %.1fs (%.0f us/insert), %d conflicts; at %d rules: '
+          'index check %.0f us, linear scan %.0f us, remove %.0f us'
+          % (name, build, build / count * 1e6, conflicts, count,
+             check * 1e6, scan * 1e6, remove * 1e6))
+    sys.stdout.flush()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    run('typical', count, [32, 32, 32, 28, 24], 0.01, 0.1)
+    run('dense', count, [32, 32, 28, 24, 20, 16], 0.03, 0.5)
+
+
+if __name__ == '__main__':
+    main()